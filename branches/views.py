@@ -1,11 +1,13 @@
 from typing import Optional
 
 from django.http import HttpRequest
-from git.repo import Repo
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 
+from repositories.locks import get_repository_paths, locks_repository
 from repositories.models import Repository
+from repositories.objects import commit_changes
+from repositories.pool import get_repo
 from repositories.serializers import RepositorySerializer
 
 
@@ -13,6 +15,7 @@ class BranchViewSet(viewsets.ViewSet):
     queryset = Repository.objects.all()
     serializer_class = RepositorySerializer
 
+    @locks_repository(get_repository_paths)
     def create(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         repository = Repository.objects.get(pk=pk)
         branch_name = request.data.get("branch_name")
@@ -21,18 +24,19 @@ class BranchViewSet(viewsets.ViewSet):
         if not branch_name or not message:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        repo = Repo(repository.path)
-        repo.git.checkout("-b", branch_name)
-        repo.index.add("*")
-        repo.index.commit(message)
+        repo = get_repo(repository.path)
+        # The new branch starts at HEAD, so the working tree does not change
+        repo.head.reference = repo.create_head(branch_name)
+        commit_changes(repository, repo, {}, message)
 
         return Response(status=status.HTTP_201_CREATED)
 
+    @locks_repository(get_repository_paths)
     def destroy(
         self, request: HttpRequest, pk: Optional[str] = None, name: Optional[str] = None
     ) -> Response:
         repository = Repository.objects.get(pk=pk)
-        repo = Repo(repository.path)
+        repo = get_repo(repository.path)
 
         if name is None or name == "main":
             return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -41,6 +45,7 @@ class BranchViewSet(viewsets.ViewSet):
 
         return Response(status=status.HTTP_200_OK)
 
+    @locks_repository(get_repository_paths)
     def update(
         self, request: HttpRequest, pk: Optional[str] = None, name: Optional[str] = None
     ) -> Response:
@@ -50,16 +55,18 @@ class BranchViewSet(viewsets.ViewSet):
         if name is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        repo = Repo(repository.path)
-        repo.git.checkout(name)
-        repo.index.add("*")
-        repo.index.commit(message)
+        repo = get_repo(repository.path)
+        if repo.bare:
+            repo.head.reference = repo.heads[name]
+        else:
+            repo.git.checkout(name)
+        commit_changes(repository, repo, {}, message)
 
         return Response(status=status.HTTP_200_OK)
 
     def list(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         repository = Repository.objects.get(pk=pk)
-        repo = Repo(repository.path)
+        repo = get_repo(repository.path)
 
         branch_list = repo.git.branch().split("\n")
         branch_list = [branch.strip() for branch in branch_list]
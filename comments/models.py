@@ -14,5 +14,15 @@ class Comment(models.Model):
     text = models.CharField(max_length=255)
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Comments of a commit and the counts for a page of commits are read from
+        # this index
+        indexes = [
+            models.Index(
+                fields=["repository", "commit", "-created", "-id"],
+                name="comment_commit_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.user.first_name + " " + self.pull_request.title
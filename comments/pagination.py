@@ -0,0 +1,6 @@
+from repositories.pagination import KeysetPagination
+
+
+class CommentPagination(KeysetPagination):
+    orderings = {"newest": "created"}
+    default_ordering = "newest"
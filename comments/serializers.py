@@ -1,9 +1,15 @@
 from rest_framework.serializers import ModelSerializer
 
 from comments.models import Comment
+from project.serializers import ValuesSerializer
 
 
 class CommentSerializer(ModelSerializer):
     class Meta:
         model = Comment
         fields = "__all__"
+
+
+class CommentListSerializer(ValuesSerializer):
+    model = Comment
+    fields = ("id", "user", "user__username", "commit", "text", "created")
@@ -54,6 +54,40 @@ class CommentViewSetTestCase(APITestCase):
         self.assertEqual(Comment.objects.count(), 1)
         self.assertEqual(Comment.objects.first().text, "test comment")
 
+    def test_list_comments(self):
+        commit = Repo(self.repo.path).head.commit.hexsha
+        Comment.objects.bulk_create(
+            [
+                Comment(
+                    user=self.user1,
+                    repository=self.repo,
+                    commit=commit if i < 4 else "0" * 40,
+                    text=f"comment {i}",
+                )
+                for i in range(5)
+            ]
+        )
+        url = reverse("repositories-comments", args=[self.repo.id])
+
+        response = self.client.get(url, {"commit": commit, "page_size": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["text"] for row in response.data["results"]],
+            ["comment 3", "comment 2", "comment 1"],
+        )
+        self.assertEqual(
+            response.data["results"][0]["user__username"], self.user1.username
+        )
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [row["text"] for row in response.data["results"]], ["comment 0"]
+        )
+        self.assertIsNone(response.data["next"])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_comment_without_commit(self):
         response = self.client.post(
             reverse("comments-list"),
@@ -0,0 +1,23 @@
+from django.db.models import Count
+
+from comments.models import Comment
+
+
+def get_comment_counts(repository_id: int, commits: list) -> dict:
+    # One grouped query for a whole page of commits
+    rows = (
+        Comment.objects.filter(repository_id=repository_id, commit__in=commits)
+        .values("commit")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    return {row["commit"]: row["count"] for row in rows}
+
+
+def add_comment_counts(repository_id: int, commit_list: list) -> list:
+    counts = get_comment_counts(
+        repository_id, [commit["commit_hash"] for commit in commit_list]
+    )
+    for commit in commit_list:
+        commit["comment_count"] = counts.get(commit["commit_hash"], 0)
+    return commit_list
@@ -1,17 +1,44 @@
 from typing import Optional
 
-from django.http import HttpRequest
+from django.http import Http404, HttpRequest
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 
 from comments.models import Comment
-from comments.serializers import CommentSerializer
+from comments.pagination import CommentPagination
+from comments.serializers import CommentListSerializer, CommentSerializer
+from repositories.models import Repository
 
 
 class CommentViewSet(viewsets.ViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
+    def list(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        commit_hash = request.query_params.get("commit")
+
+        if not commit_hash:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        repository = Repository.objects.filter(pk=pk).first()
+        if repository is None:
+            raise Http404
+
+        if (
+            repository.private
+            and not repository.owners.filter(id=request.user.id).exists()
+        ):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        pagenator = CommentPagination()
+        serializer = CommentListSerializer(request)
+
+        query = Comment.objects.filter(repository=repository, commit=commit_hash)
+        query = serializer.get_queryset(query, "created")
+        query = pagenator.paginate_queryset(query, request)
+
+        return pagenator.get_paginated_response(serializer.serialize(query))
+
     def create(self, request: HttpRequest) -> Response:
         text = request.data.get("text")
         commit_hash = request.data.get("commit")
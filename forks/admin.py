@@ -1,5 +1,6 @@
 from django.contrib import admin
 
-from forks.models import Fork
+from forks.models import Fork, ForkStatus
 
 admin.site.register(Fork)
+admin.site.register(ForkStatus)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ForksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "forks"
+
+    def ready(self):
+        import forks.signals  # noqa: F401
@@ -0,0 +1,89 @@
+import os
+import shutil
+from typing import Optional
+
+from django.db import transaction
+from git.repo import Repo
+
+from forks.models import Fork
+from forks.utils import share_objects
+from jobs.models import Job
+from jobs.utils import JobError, job_handler, set_progress
+from project.settings import BARE_REPOSITORIES, FORK_SHARED_OBJECTS, REPO_ROOT
+from repositories.models import Repository
+from repositories.pool import get_repo
+from repositories.signals import repository_updated
+from users.models import User
+
+
+def get_fork_paths(user: User, source_repository: Repository) -> list:
+    return [
+        source_repository.path,
+        os.path.join(REPO_ROOT, user.username, source_repository.name),
+    ]
+
+
+@job_handler("fork")
+@transaction.atomic
+def fork_repository(job: Optional[Job], user_id: int, repository_id: int) -> None:
+    user = User.objects.get(pk=user_id)
+    source_repository = Repository.objects.get(pk=repository_id)
+    source_dir, target_dir = get_fork_paths(user, source_repository)
+
+    if os.path.exists(target_dir):
+        if Repository.objects.filter(path=target_dir).exists():
+            raise JobError({"error": f"{target_dir} already exists"})
+        # Left behind by an attempt whose worker died, the lock on it is ours
+        shutil.rmtree(target_dir)
+
+    if FORK_SHARED_OBJECTS:
+        # The fork borrows the upstream objects through alternates and only
+        # stores what it adds itself
+        share_objects(get_repo(source_dir))
+
+    try:
+        create_fork(job, user, source_repository, source_dir, target_dir)
+    except Exception:
+        # The rows are rolled back with the transaction, the clone goes with them
+        # so a retry starts from scratch
+        shutil.rmtree(target_dir, ignore_errors=True)
+        raise
+
+
+def create_fork(
+    job: Optional[Job],
+    user: User,
+    source_repository: Repository,
+    source_dir: str,
+    target_dir: str,
+) -> None:
+    repo = Repo.clone_from(
+        source_dir, target_dir, bare=BARE_REPOSITORIES, shared=FORK_SHARED_OBJECTS
+    )
+    set_progress(job, 80)
+
+    branch_name = "new-branch-name"
+    # Branching off HEAD leaves the working tree as it is
+    repo.head.reference = repo.create_head(branch_name)
+
+    target_repository = Repository.objects.create(
+        name=source_repository.name,
+        user=user,
+        path=target_dir,
+        fork=True,
+    )
+
+    target_repository.owners.add(user)
+
+    Fork.objects.create(
+        source_repository=source_repository,
+        target_repository=target_repository,
+        user=user,
+    )
+
+    repository_updated.send(
+        sender=Repository,
+        repository=target_repository,
+        before=None,
+        after=repo.head.commit.hexsha,
+    )
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from git.repo import Repo
+
+from project.settings import BARE_REPOSITORIES
+
+
+def get_disk_usage(path: str, exclude_inodes: set) -> int:
+    # Hardlinked files shared with the source do not use new space
+    usage = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            stat = os.lstat(os.path.join(dirpath, filename))
+            if (stat.st_dev, stat.st_ino) not in exclude_inodes:
+                usage += stat.st_blocks * 512
+    return usage
+
+
+def get_inodes(path: str) -> set:
+    inodes = set()
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            stat = os.lstat(os.path.join(dirpath, filename))
+            inodes.add((stat.st_dev, stat.st_ino))
+    return inodes
+
+
+class Command(BaseCommand):
+    help = "Compare fork time and disk use of full clones and shared object forks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--files", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--file-size", type=int, default=16 * 1024)
+        parser.add_argument("--runs", type=int, default=3)
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp(prefix="benchmark-forks-")
+        self.stdout.write("files\tsource_kb\tmode\tseconds\tdisk_kb\tgit_dir_kb")
+
+        try:
+            for file_count in options["files"]:
+                source = self.create_source(work_dir, file_count, options["file_size"])
+                source_usage = get_disk_usage(source, set())
+                source_inodes = get_inodes(source)
+
+                # copy is what a clone costs when the objects cannot be hardlinked,
+                # e.g. across filesystems
+                for mode in ("copy", "clone", "shared"):
+                    seconds, usage, git_dir_usage = self.fork(
+                        source, source_inodes, mode, options["runs"]
+                    )
+                    self.stdout.write(
+                        f"{file_count}\t{source_usage // 1024}\t{mode}\t"
+                        f"{seconds:.3f}\t{usage // 1024}\t{git_dir_usage // 1024}"
+                    )
+        finally:
+            shutil.rmtree(work_dir)
+
+    def create_source(self, work_dir: str, file_count: int, file_size: int) -> str:
+        path = os.path.join(work_dir, f"source-{file_count}")
+        repo = Repo.init(path)
+
+        for i in range(file_count):
+            with open(os.path.join(path, f"chapter{i}.txt"), "w") as f:
+                f.write(os.urandom(file_size // 2).hex())
+
+        repo.git.add("-A")
+        repo.git.commit("-m", "benchmark")
+        repo.git.gc("--quiet")
+        repo.close()
+        return path
+
+    def fork(self, source: str, source_inodes: set, mode: str, runs: int) -> tuple:
+        timings = []
+        usage = git_dir_usage = 0
+
+        for run in range(runs):
+            target = f"{source}-fork-{mode}-{run}"
+            start = time.perf_counter()
+            Repo.clone_from(
+                source,
+                target,
+                bare=BARE_REPOSITORIES,
+                shared=mode == "shared",
+                no_hardlinks=mode == "copy",
+            ).close()
+            timings.append(time.perf_counter() - start)
+
+            git_dir = target if BARE_REPOSITORIES else os.path.join(target, ".git")
+            usage = get_disk_usage(target, source_inodes)
+            git_dir_usage = get_disk_usage(git_dir, source_inodes)
+            shutil.rmtree(target)
+
+        return sorted(timings)[len(timings) // 2], usage, git_dir_usage
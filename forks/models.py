@@ -16,3 +16,22 @@ class Fork(models.Model):
 
     def __str__(self):
         return self.user.first_name + " " + self.repository.name
+
+
+class ForkStatus(models.Model):
+    id = models.BigAutoField(primary_key=True, unique=True)
+    repository = models.OneToOneField(
+        Repository, on_delete=models.CASCADE, related_name="fork_status"
+    )
+    upstream = models.ForeignKey(
+        Repository, on_delete=models.CASCADE, related_name="downstream_status"
+    )
+    head = models.CharField(max_length=40)
+    upstream_head = models.CharField(max_length=40)
+    ahead = models.IntegerField(default=0)
+    behind = models.IntegerField(default=0)
+    pullrequest = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.repository.name
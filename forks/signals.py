@@ -0,0 +1,15 @@
+from django.dispatch import receiver
+
+from forks.models import ForkStatus
+from forks.utils import update_downstream_status, update_fork_status
+from project.background import run_in_background
+from repositories.signals import repository_updated
+
+
+@receiver(repository_updated)
+def schedule_fork_status_update(sender, repository, **kwargs) -> None:
+    if repository.fork:
+        run_in_background(update_fork_status, repository.id)
+
+    if ForkStatus.objects.filter(upstream=repository).exists():
+        run_in_background(update_downstream_status, repository.id)
@@ -7,9 +7,15 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from forks.models import Fork
-from project.settings import REPO_ROOT
+from forks.models import Fork, ForkStatus
+from forks.utils import (
+    read_alternates,
+    update_downstream_status,
+    update_fork_status,
+)
+from project.settings import REPO_ROOT, TRASH_ROOT
 from repositories.models import Repository
+from repositories.trash import empty_trash
 from users.models import User
 
 
@@ -62,19 +68,90 @@ class ForkViewSetTestCase(APITestCase):
 
         self.assertEqual(len(Repo(fork.source_repository.path).branches), 1)
 
+    def test_update_fork_status(self):
+        self.client.force_authenticate(user=self.user2)
+        self.client.post(reverse("repositories-forks", args=[self.repo.id]))
+        fork = Fork.objects.get(user=self.user2, source_repository=self.repo)
+
+        fork_status = update_fork_status(fork.target_repository.id)
+        self.assertEqual((fork_status.ahead, fork_status.behind), (0, 0))
+        self.assertFalse(fork_status.pullrequest)
+
+        upstream = Repo(self.repo.path)
+        with open(os.path.join(self.repo.path, "README.txt"), "w") as f:
+            f.write("upstream")
+        upstream.index.add(["README.txt"])
+        upstream.index.commit("upstream commit")
+
+        forked = Repo(fork.target_repository.path)
+        with open(os.path.join(forked.working_dir, "CHAPTER.txt"), "w") as f:
+            f.write("fork")
+        forked.index.add(["CHAPTER.txt"])
+        forked.index.commit("fork commit")
+
+        update_downstream_status(self.repo.id)
+
+        fork_status = ForkStatus.objects.get(repository=fork.target_repository)
+        self.assertEqual((fork_status.ahead, fork_status.behind), (1, 1))
+        self.assertEqual(fork_status.upstream, self.repo)
+        self.assertTrue(fork_status.pullrequest)
+
     def test_delete(self):
         self.client.force_authenticate(user=self.user2)
         response = self.client.post(reverse("repositories-forks", args=[self.repo.id]))
 
-        response = self.client.delete(
-            reverse("repositories-forks", args=[self.repo.id])
-        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse("repositories-forks", args=[self.repo.id])
+            )
+        callbacks[0]()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(self.repo.source_fork.count(), 0)
         self.assertFalse(
             os.path.exists(os.path.join(REPO_ROOT, self.user2.username, "test_repo"))
         )
 
+    def test_create_shares_objects(self):
+        self.client.force_authenticate(user=self.user2)
+        self.client.post(reverse("repositories-forks", args=[self.repo.id]))
+        fork = Fork.objects.get(user=self.user2, source_repository=self.repo)
+
+        repo = Repo(fork.target_repository.path)
+        self.assertEqual(
+            read_alternates(repo),
+            [os.path.realpath(os.path.join(self.repo.path, ".git", "objects"))],
+        )
+        self.assertFalse(os.listdir(os.path.join(repo.git_dir, "objects", "pack")))
+
+    def test_delete_upstream_dissociates_fork(self):
+        self.client.force_authenticate(user=self.user2)
+        self.client.post(reverse("repositories-forks", args=[self.repo.id]))
+        fork = Fork.objects.get(user=self.user2, source_repository=self.repo)
+        target_path = fork.target_repository.path
+        head = Repo(target_path).head.commit.hexsha
+
+        self.client.force_authenticate(user=self.user1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse("repositories-detail", args=[self.repo.id])
+            )
+        callbacks[0]()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(os.path.exists(self.repo.path))
+
+        # Until the reaper runs the fork borrows from the trashed objects
+        repo = Repo(target_path)
+        self.assertTrue(read_alternates(repo)[0].startswith(TRASH_ROOT))
+        self.assertEqual(repo.git.cat_file("-p", f"{head}:README.txt"), "")
+
+        empty_trash(None)
+
+        repo = Repo(target_path)
+        self.assertEqual(read_alternates(repo), [])
+        self.assertEqual(repo.git.cat_file("-p", f"{head}:README.txt"), "")
+        repo.git.fsck()
+
     # no_auth
     def test_create_no_auth(self):
         response = self.client.post(reverse("repositories-forks", args=[self.repo.id]))
@@ -0,0 +1,139 @@
+import os
+from typing import Optional
+
+from git.repo import Repo
+
+from forks.models import Fork, ForkStatus
+from repositories.models import Repository
+from repositories.pool import get_repo, repo_pool
+
+
+def get_upstream(repo: Repo) -> Optional[Repository]:
+    if "origin" not in [remote.name for remote in repo.remotes]:
+        return None
+
+    url = repo.remotes.origin.url
+    if url.startswith("file://"):
+        url = url[len("file://") :]
+
+    return Repository.objects.filter(path=os.path.normpath(url)).first()
+
+
+def get_upstream_head(upstream_repo: Repo) -> str:
+    if "main" in upstream_repo.heads:
+        return upstream_repo.heads["main"].commit.hexsha
+    return upstream_repo.head.commit.hexsha
+
+
+def count_ahead_behind(
+    repo: Repo, upstream_repo: Repo, head: str, upstream_head: str
+) -> tuple:
+    # Borrow the upstream objects read-only instead of fetching them into the fork
+    env = {
+        "GIT_ALTERNATE_OBJECT_DIRECTORIES": os.path.join(
+            upstream_repo.git_dir, "objects"
+        )
+    }
+    output = repo.git.rev_list(
+        "--left-right", "--count", f"{head}...{upstream_head}", env=env
+    )
+    ahead, behind = output.split()
+    return int(ahead), int(behind)
+
+
+def update_fork_status(repository_id: int) -> Optional[ForkStatus]:
+    repository = Repository.objects.filter(pk=repository_id, fork=True).first()
+    if repository is None:
+        return None
+
+    repo = get_repo(repository.path)
+    upstream = get_upstream(repo)
+
+    if upstream is None:
+        ForkStatus.objects.filter(repository=repository).delete()
+        return None
+
+    upstream_repo = get_repo(upstream.path)
+    head = repo.head.commit.hexsha
+    upstream_head = get_upstream_head(upstream_repo)
+
+    ahead, behind = count_ahead_behind(repo, upstream_repo, head, upstream_head)
+    changed = (
+        repo.commit(head).tree.hexsha != upstream_repo.commit(upstream_head).tree.hexsha
+    )
+
+    fork_status, _ = ForkStatus.objects.update_or_create(
+        repository=repository,
+        defaults={
+            "upstream": upstream,
+            "head": head,
+            "upstream_head": upstream_head,
+            "ahead": ahead,
+            "behind": behind,
+            "pullrequest": ahead > 0 and changed,
+        },
+    )
+    return fork_status
+
+
+def update_downstream_status(repository_id: int) -> None:
+    for fork_id in ForkStatus.objects.filter(upstream_id=repository_id).values_list(
+        "repository_id", flat=True
+    ):
+        update_fork_status(fork_id)
+
+
+def get_alternates_path(repo: Repo) -> str:
+    return os.path.join(repo.common_dir, "objects", "info", "alternates")
+
+
+def read_alternates(repo: Repo) -> list:
+    try:
+        with open(get_alternates_path(repo), "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+    return [
+        os.path.realpath(os.path.join(repo.common_dir, "objects", line))
+        for line in lines
+        if line and not line.startswith("#")
+    ]
+
+
+def share_objects(upstream_repo: Repo) -> None:
+    # Forks read the upstream objects in place, so the upstream must never prune
+    # objects it no longer references itself
+    with upstream_repo.config_writer() as config_writer:
+        config_writer.set_value("gc", "pruneExpire", "never")
+
+
+def dissociate(repo: Repo) -> None:
+    # Copies every object borrowed from the alternates into the repository's own
+    # pack, then stops borrowing. repack is safe next to concurrent writers.
+    repo.git.repack("-a", "-d")
+    os.remove(get_alternates_path(repo))
+
+
+def dissociate_dependents(path: str) -> int:
+    # Must run before the repository at path is deleted or moved
+    if not os.path.isdir(path):
+        return 0
+
+    objects_dir = os.path.realpath(os.path.join(get_repo(path).common_dir, "objects"))
+    dissociated = 0
+
+    for target_path in Fork.objects.filter(source_repository__path=path).values_list(
+        "target_repository__path", flat=True
+    ):
+        if not os.path.isdir(target_path):
+            continue
+
+        repo = get_repo(target_path)
+        if objects_dir in read_alternates(repo):
+            dissociate(repo)
+            # Pooled handles still run cat-file processes that know the alternates
+            repo_pool.evict(target_path)
+            dissociated += 1
+
+    return dissociated
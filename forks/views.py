@@ -1,64 +1,48 @@
 import os
-import shutil
 from typing import Optional
 
 from django.db import transaction
 from django.http import HttpRequest
-from git.repo import Repo
 from rest_framework import status, viewsets
 from rest_framework.response import Response
 
+from forks.jobs import get_fork_paths
 from forks.models import Fork
 from forks.serializers import ForkSerializer
+from jobs.utils import run_or_enqueue_job
+from project.background import run_in_background
 from project.settings import REPO_ROOT
 from repositories.models import Repository
+from repositories.trash import empty_trash, trash_on_commit
 
 
 class ForkViewSet(viewsets.ViewSet):
     queryset = Fork.objects.all()
     serializer_class = ForkSerializer
 
-    @transaction.atomic
     def create(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         source_repository = Repository.objects.get(pk=pk)
 
-        source_dir = source_repository.path
-        target_dir = os.path.join(
-            REPO_ROOT, request.user.username, source_repository.name
-        )
-
-        repo = Repo.clone_from(source_dir, target_dir)
-        branch_name = "new-branch-name"
-        new_branch = repo.create_head(branch_name)
-        new_branch.checkout()
-
-        target_repository = Repository.objects.create(
-            name=source_repository.name,
-            user=request.user,
-            path=target_dir,
-            fork=True,
+        return run_or_enqueue_job(
+            request,
+            "fork",
+            get_fork_paths(request.user, source_repository),
+            status.HTTP_201_CREATED,
+            user_id=request.user.id,
+            repository_id=source_repository.id,
         )
 
-        target_repository.owners.add(request.user)
-
-        Fork.objects.create(
-            source_repository=source_repository,
-            target_repository=target_repository,
-            user=request.user,
-        )
-
-        return Response(status=status.HTTP_201_CREATED)
-
     @transaction.atomic
     def destroy(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         source_repository = Repository.objects.get(pk=pk)
-        Fork.objects.get(
-            source_repository=source_repository, user=request.user
-        ).delete()
-
         target_dir = os.path.join(
             REPO_ROOT, request.user.username, source_repository.name
         )
-        shutil.rmtree(target_dir)
+
+        with trash_on_commit(target_dir):
+            Fork.objects.get(
+                source_repository=source_repository, user=request.user
+            ).delete()
+        run_in_background(empty_trash)
 
         return Response(status=status.HTTP_200_OK)
@@ -0,0 +1,63 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.utils import claim_job, requeue_stale_jobs, run_job
+from project.settings import JOB_POLL_INTERVAL, JOB_WORKERS
+
+
+def work(once: bool, interval: float) -> int:
+    done = 0
+    while True:
+        requeue_stale_jobs()
+        job = claim_job()
+
+        if job is None:
+            if once:
+                return done
+            time.sleep(interval)
+            continue
+
+        run_job(job)
+        done += 1
+
+
+class Command(BaseCommand):
+    help = "Run queued jobs in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=JOB_WORKERS)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=JOB_POLL_INTERVAL,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        if options["processes"] <= 1:
+            done = work(options["once"], options["interval"])
+            self.stdout.write(self.style.SUCCESS(f"Ran {done} jobs"))
+            return
+
+        # Every process opens its own database connection after the fork
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=work, args=(options["once"], options["interval"]))
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
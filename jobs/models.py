@@ -0,0 +1,44 @@
+from django.db import models
+from django.utils import timezone
+
+from project.settings import JOB_MAX_ATTEMPTS
+from users.models import User
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=64)
+    user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    # Repositories the job writes to, locked while it runs. Jobs with the same key
+    # run one after another.
+    paths = models.JSONField(default=list)
+    key = models.CharField(max_length=255)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20,
+        choices=(
+            ("queued", "Queued"),
+            ("running", "Running"),
+            ("succeeded", "Succeeded"),
+            ("failed", "Failed"),
+        ),
+        default="queued",
+    )
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=JOB_MAX_ATTEMPTS)
+    run_after = models.DateTimeField(default=timezone.now)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["key", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id}"
@@ -0,0 +1,19 @@
+from jobs.models import Job
+from project.serializers import ValuesSerializer
+
+
+class JobSerializer(ValuesSerializer):
+    model = Job
+    fields = (
+        "id",
+        "name",
+        "status",
+        "progress",
+        "result",
+        "error",
+        "attempts",
+        "run_after",
+        "created",
+        "started",
+        "finished",
+    )
@@ -0,0 +1,201 @@
+import os
+import shutil
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from git.repo import Repo
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from jobs.models import Job
+from jobs.utils import claim_job, enqueue_job, handlers, requeue_stale_jobs, run_job
+from project.settings import REPO_ROOT
+from repositories.locks import RepositoryBusy
+from repositories.models import Repository
+from users.models import User
+
+
+class JobTestCase(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(
+            username="user1@user1.com", password="user1_password"
+        )
+        self.user2 = User.objects.create(
+            username="user2@user2.com", password="user2_password"
+        )
+        self.user1_token = RefreshToken.for_user(self.user1).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user1_token}")
+
+        repo_path = os.path.join(REPO_ROOT, self.user1.username, "test_repo")
+        if os.path.exists(repo_path):
+            shutil.rmtree(repo_path)
+
+        repo = Repo.init(repo_path)
+        open(os.path.join(repo_path, "README.txt"), "w").close()
+        repo.index.add("*")
+        repo.index.commit("initial commit")
+
+        self.repository = Repository.objects.create(
+            name="test_repo", user=self.user1, path=repo_path
+        )
+
+    @mock.patch("jobs.utils.JOBS_ENABLED", True)
+    def test_update_structure_in_job(self):
+        data = {
+            "structure": '{"README.txt": "blob", "test": {"README.txt": "blob"}}',
+            "message": "Updated README.txt",
+        }
+        response = self.client.patch(
+            reverse("repositories-structure", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data["job"]
+
+        response = self.client.get(reverse("jobs-detail", args=[job_id]))
+        self.assertEqual(response.data["status"], "queued")
+
+        call_command("run_jobs", "--once", "--processes", "1", stdout=StringIO())
+
+        response = self.client.get(reverse("jobs-detail", args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "succeeded")
+        self.assertEqual(response.data["progress"], 100)
+        self.assertEqual(response.data["attempts"], 1)
+
+        response = self.client.get(
+            reverse("repositories-detail", args=[self.repository.id]),
+        )
+        self.assertEqual(response.data["tree"], data["structure"])
+
+    def test_update_structure_bad_input_in_request(self):
+        response = self.client.patch(
+            reverse("repositories-structure", args=[self.repository.id]),
+            {"structure": "{not json", "message": "Updated README.txt"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", response.data)
+
+    def test_retrieve_job_of_another_user(self):
+        job = enqueue_job("update_structure", [self.repository.path], self.user2)
+
+        response = self.client.get(reverse("jobs-detail", args=[job.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_claim_one_job_per_repository(self):
+        first = enqueue_job("update_structure", [self.repository.path])
+        second = enqueue_job("update_structure", [self.repository.path])
+        other = enqueue_job("update_structure", ["other"])
+
+        self.assertEqual(claim_job().id, first.id)
+        # second waits until the first job on the repository is done
+        self.assertEqual(claim_job().id, other.id)
+        self.assertIsNone(claim_job())
+
+        Job.objects.filter(pk=first.pk).update(status="succeeded")
+        self.assertEqual(claim_job().id, second.id)
+
+    def test_retry_with_backoff(self):
+        handler = mock.Mock(side_effect=RepositoryBusy("busy"))
+        job = enqueue_job("busy", [self.repository.path])
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+
+        with mock.patch.dict(handlers, {"busy": handler}):
+            run_job(claim_job())
+            job.refresh_from_db()
+            self.assertEqual(job.status, "queued")
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIsNone(claim_job())
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(handler.call_count, 2)
+
+    def test_fail_without_retry(self):
+        handler = mock.Mock(side_effect=Repository.DoesNotExist("gone"))
+        job = enqueue_job("missing", [self.repository.path])
+
+        with mock.patch.dict(handlers, {"missing": handler}):
+            run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.error, "gone")
+
+    def test_fork_after_failed_attempt(self):
+        target_dir = os.path.join(REPO_ROOT, self.user2.username, "test_repo")
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        job = enqueue_job(
+            "fork",
+            [self.repository.path, target_dir],
+            user_id=self.user2.id,
+            repository_id=self.repository.id,
+        )
+
+        with mock.patch(
+            "forks.jobs.Fork.objects.create", side_effect=OperationalError("locked")
+        ):
+            run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "queued")
+        # The clone of the failed attempt is gone, the retry starts over
+        self.assertFalse(os.path.exists(target_dir))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertTrue(Repository.objects.filter(path=target_dir).exists())
+
+    def test_requeue_stale_jobs(self):
+        job = enqueue_job("update_structure", [self.repository.path])
+        claim_job()
+        Job.objects.filter(pk=job.pk).update(
+            heartbeat=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_job().id, job.id)
+
+
+class JobHeartbeatTestCase(TransactionTestCase):
+    @mock.patch("jobs.utils.JOB_HEARTBEAT_INTERVAL", 0.01)
+    def test_heartbeat_while_running(self):
+        job = enqueue_job("slow", ["slow"])
+        claimed = claim_job()
+
+        def handler(job):
+            # The job reports no progress, the worker still beats for it
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                heartbeat = Job.objects.get(pk=job.pk).heartbeat
+                if heartbeat > claimed.heartbeat:
+                    return
+                time.sleep(0.01)
+
+        with mock.patch.dict(handlers, {"slow": handler}):
+            run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertGreater(job.heartbeat, claimed.heartbeat)
@@ -0,0 +1,198 @@
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Callable, Iterator, Optional
+
+from django.db import InterfaceError, OperationalError, connection
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from jobs.models import Job
+from project.settings import (
+    JOB_HEARTBEAT_INTERVAL,
+    JOB_RETRY_DELAY,
+    JOB_RETRY_MAX_DELAY,
+    JOB_TIMEOUT,
+    JOBS_ENABLED,
+)
+from repositories.locks import RepositoryBusy, busy_response, repository_lock
+
+logger = logging.getLogger(__name__)
+
+# name -> function(job, **arguments), registered with @job_handler in the jobs
+# module of each app
+handlers: dict = {}
+
+# Errors that may pass when the job runs again, any other error fails it at once
+RETRY_ERRORS = (
+    RepositoryBusy,
+    OperationalError,
+    InterfaceError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class JobError(Exception):
+    # Fails the job without a retry, data is kept as the result
+    def __init__(self, data: Any) -> None:
+        super().__init__(data)
+        self.data = data
+
+
+def job_handler(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        handlers[name] = func
+        return func
+
+    return decorator
+
+
+def set_progress(job: Optional[Job], progress: int) -> None:
+    # Handlers also run inside requests, without a job
+    if job is None:
+        return
+    job.progress = progress
+    Job.objects.filter(pk=job.pk).update(progress=progress, heartbeat=timezone.now())
+
+
+def enqueue_job(name: str, paths: list, user=None, **arguments: Any) -> Job:
+    return Job.objects.create(
+        name=name,
+        user=user,
+        paths=paths,
+        key=paths[0] if paths else "",
+        arguments=arguments,
+    )
+
+
+def run_or_enqueue_job(
+    request: Request, name: str, paths: list, success_status: int, **arguments: Any
+) -> Response:
+    if JOBS_ENABLED:
+        job = enqueue_job(name, paths, request.user, **arguments)
+        return Response({"job": job.id}, status=status.HTTP_202_ACCEPTED)
+
+    # Without a worker the job runs in the request as before
+    try:
+        with repository_lock(*paths) as timer:
+            result = handlers[name](None, **arguments)
+    except RepositoryBusy:
+        return busy_response()
+    except JobError as e:
+        return Response(e.data, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError as e:
+        # Bad input, e.g. a PathConflict or malformed JSON, fails a queued job
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = Response(result, status=success_status)
+    response["Server-Timing"] = f"lock;dur={timer.wait * 1000:.1f}"
+    return response
+
+
+def requeue_stale_jobs() -> int:
+    # The worker running these died, the attempt it used is not given back. A live
+    # worker keeps the heartbeat fresh, see keep_alive.
+    deadline = timezone.now() - timedelta(seconds=JOB_TIMEOUT)
+    return Job.objects.filter(status="running", heartbeat__lt=deadline).update(
+        status="queued"
+    )
+
+
+def claim_job() -> Optional[Job]:
+    now = timezone.now()
+    busy = Job.objects.filter(status="running").values("key")
+    candidates = (
+        Job.objects.filter(status="queued", run_after__lte=now)
+        .exclude(key__in=busy)
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[:10]
+    )
+
+    for pk in candidates:
+        # Only one worker gets to move the job out of queued. Two jobs with the
+        # same key claimed at once still wait for each other on the lock.
+        claimed = Job.objects.filter(pk=pk, status="queued").update(
+            status="running",
+            attempts=F("attempts") + 1,
+            started=now,
+            heartbeat=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+
+    return None
+
+
+def get_retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+def finish_job(
+    job: Job, job_status: str, result: Any = None, error: Optional[str] = None
+) -> None:
+    job.status = job_status
+    job.result = result
+    job.error = error
+    job.finished = timezone.now()
+    if job_status == "succeeded":
+        job.progress = 100
+    job.save(update_fields=["status", "result", "error", "finished", "progress"])
+
+
+@contextmanager
+def keep_alive(job: Job) -> Iterator[None]:
+    # A clone or merge can run long without reporting progress, a thread beats for
+    # the job until it returns
+    stop = threading.Event()
+
+    def beat() -> None:
+        try:
+            while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+                Job.objects.filter(pk=job.pk).update(heartbeat=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job: Job) -> None:
+    handler = handlers.get(job.name)
+    if handler is None:
+        finish_job(job, "failed", error=f"unknown job {job.name}")
+        return
+
+    try:
+        with keep_alive(job), repository_lock(*job.paths):
+            result = handler(job, **job.arguments)
+    except JobError as e:
+        finish_job(job, "failed", result=e.data, error=str(e))
+    except RETRY_ERRORS as e:
+        if job.attempts >= job.max_attempts:
+            logger.exception("job %s failed", job)
+            finish_job(job, "failed", error=str(e))
+            return
+
+        # Retried later, e.g. when the repository was busy
+        delay = get_retry_delay(job.attempts)
+        logger.warning("job %s failed, retrying in %ss: %s", job, delay, e)
+        job.status = "queued"
+        job.error = str(e)
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=["status", "error", "run_after"])
+    except Exception as e:
+        # Missing rows, bad arguments and bugs fail the same way every time
+        logger.exception("job %s failed", job)
+        finish_job(job, "failed", error=str(e))
+    else:
+        finish_job(job, "succeeded", result=result)
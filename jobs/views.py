@@ -0,0 +1,25 @@
+from typing import Optional
+
+from django.http import Http404, HttpRequest
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+
+
+class JobViewSet(viewsets.ViewSet):
+    queryset = Job.objects.all()
+
+    def retrieve(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        query = Job.objects.filter(pk=pk)
+        if not request.user.is_staff:
+            query = query.filter(user=request.user)
+
+        serializer = JobSerializer(request)
+        data = serializer.serialize(serializer.get_queryset(query))
+
+        if not data:
+            raise Http404
+
+        return Response(data[0], status=status.HTTP_200_OK)
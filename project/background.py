@@ -0,0 +1,24 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.db import connections, transaction
+
+from project.settings import BACKGROUND_WORKERS
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS)
+
+
+def run_in_background(func: Callable, *args: Any) -> None:
+    def run() -> None:
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("background task %s failed", func.__name__)
+        finally:
+            connections.close_all()
+
+    # Only start once the rows the task reads are visible to other connections
+    transaction.on_commit(lambda: executor.submit(run))
@@ -0,0 +1,69 @@
+from typing import Iterable, Optional
+
+from django.db.models import Model, QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+
+# Read-only serialization straight from values() rows. Many-to-many fields listed
+# in related are loaded with one query per page, and ?fields= narrows the columns.
+class ValuesSerializer:
+    model: Optional[type[Model]] = None
+    fields: tuple = ()
+    default_fields: Optional[tuple] = None
+    # many-to-many field name -> fields of the related rows
+    related: dict = {}
+
+    def __init__(self, request: Optional[Request] = None) -> None:
+        self.selected = self.get_selected_fields(request)
+
+    def get_selected_fields(self, request: Optional[Request]) -> tuple:
+        fields = request.query_params.get("fields") if request is not None else None
+        if not fields:
+            return self.default_fields or self.fields
+
+        names = set(fields.split(","))
+        unknown = names - set(self.fields)
+        if unknown:
+            raise ValidationError({"fields": sorted(unknown)})
+
+        return tuple(name for name in self.fields if name in names)
+
+    def get_queryset(self, queryset: QuerySet, *extra: str) -> QuerySet:
+        # extra columns are read for the caller (e.g. a pagination key) but not
+        # returned
+        columns = {"id", *extra}
+        columns.update(name for name in self.selected if name not in self.related)
+        return queryset.values(*columns)
+
+    def serialize(self, rows: Iterable[dict]) -> list:
+        rows = list(rows)
+        for name in self.selected:
+            if name in self.related:
+                self.add_related(rows, name)
+
+        return [{name: row[name] for name in self.selected} for row in rows]
+
+    def add_related(self, rows: list, name: str) -> None:
+        field = self.model._meta.get_field(name)
+        source = f"{field.m2m_field_name()}_id"
+        target = field.m2m_reverse_field_name()
+        related_fields = self.related[name]
+
+        values = {row["id"]: [] for row in rows}
+        through_rows = (
+            field.remote_field.through.objects.filter(**{f"{source}__in": values})
+            .order_by("id")
+            .values(source, *(f"{target}__{related}" for related in related_fields))
+        )
+
+        for through_row in through_rows:
+            values[through_row[source]].append(
+                {
+                    related: through_row[f"{target}__{related}"]
+                    for related in related_fields
+                }
+            )
+
+        for row in rows:
+            row[name] = values[row["id"]]
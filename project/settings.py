@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -45,6 +49,7 @@ INSTALLED_APPS = [
     "forks.apps.ForksConfig",
     "stars.apps.StarsConfig",
     "branches.apps.BranchesConfig",
+    "jobs.apps.JobsConfig",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -193,3 +198,76 @@ if DEBUG:
     ]
 
 REPO_ROOT = os.path.join(BASE_DIR, "root")
+
+# Tests get a throwaway root, the paths below and the modules importing them all
+# follow it. Repositories, trash, locks and caches of a real root stay untouched.
+if sys.argv[1:2] == ["test"]:
+    REPO_ROOT = tempfile.mkdtemp(prefix="root-")
+    atexit.register(shutil.rmtree, REPO_ROOT, True)
+
+CACHE_ROOT = os.path.join(REPO_ROOT, ".cache")
+
+SNAPSHOT_CACHE_SIZE = 256
+# Limits of each cache directory under CACHE_ROOT, checked every
+# SNAPSHOT_CACHE_PRUNE_INTERVAL writes of a worker
+SNAPSHOT_CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024
+SNAPSHOT_CACHE_DISK_MAX_AGE = 7 * 24 * 60 * 60
+SNAPSHOT_CACHE_PRUNE_INTERVAL = 1000
+
+REPOSITORY_MAX_PAGE_SIZE = 100
+
+COMMIT_LOG_PAGE_SIZE = 30
+COMMIT_LOG_MAX_PAGE_SIZE = 100
+COMMIT_LOG_BATCH_SIZE = 500
+
+DIFF_PAGE_SIZE = 50
+DIFF_MAX_PAGE_SIZE = 200
+
+# Repo handles kept by each thread
+REPO_POOL_SIZE = 8
+
+BACKGROUND_WORKERS = 2
+
+CONTENT_CHUNK_SIZE = 64 * 1024
+
+STATS_PAGE_SIZE = 100
+STATS_MAX_PAGE_SIZE = 1000
+
+SEARCH_MAX_FILE_SIZE = 1024 * 1024
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Writes to one repository are serialized with file locks shared by all workers
+REPO_LOCK_ROOT = os.path.join(REPO_ROOT, ".locks")
+REPO_LOCK_TIMEOUT = 10
+REPO_LOCK_QUEUE_SIZE = 8
+REPO_LOCK_WARN_WAIT = 1
+
+# Pre-initialized repositories that create renames into place
+TEMPLATE_POOL_ROOT = os.path.join(REPO_ROOT, ".pool")
+TEMPLATE_POOL_SIZE = 8
+
+# Deleted repositories are renamed into TRASH_ROOT and removed in the background,
+# at most TRASH_REAP_RATE bytes per second, see `manage.py empty_trash`
+TRASH_ROOT = os.path.join(REPO_ROOT, ".trash")
+TRASH_REAP_RATE = 32 * 1024 * 1024
+TRASH_ABORT_AGE = 60
+
+# Forks, merges and structure updates return 202 with a job run by
+# `manage.py run_jobs` when enabled, otherwise they run in the request
+JOBS_ENABLED = False
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 1
+# A running job's heartbeat is renewed every JOB_HEARTBEAT_INTERVAL seconds, jobs
+# without one for JOB_TIMEOUT seconds lost their worker and are queued again
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_TIMEOUT = 600
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 2
+JOB_RETRY_MAX_DELAY = 300
+
+# Forks share the upstream object store through git alternates
+FORK_SHARED_OBJECTS = True
+
+# New repositories are created without a working tree, see `manage.py convert_to_bare`
+BARE_REPOSITORIES = False
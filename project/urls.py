@@ -26,6 +26,7 @@ from rest_framework_simplejwt.views import (
 from branches.views import BranchViewSet
 from comments.views import CommentViewSet
 from forks.views import ForkViewSet
+from jobs.views import JobViewSet
 from pullrequests.views import PullRequestViewSet
 from repositories.views import RepositoryViewSet
 from stars.views import StarViewSet
@@ -39,6 +40,7 @@ router.register(
     r"repositories/<int:pk>/pullrequests", PullRequestViewSet, basename="pullrequests"
 )
 router.register(r"repositories/<int:pk>/comments", CommentViewSet, basename="comments")
+router.register(r"jobs", JobViewSet, basename="jobs")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -73,6 +75,24 @@ urlpatterns += [
     ),
 ]
 
+# pull requests
+urlpatterns += [
+    path(
+        "repositories/<int:pk>/pull-requests",
+        PullRequestViewSet.as_view({"get": "list"}),
+        name="repositories-pullrequests",
+    ),
+]
+
+# comments
+urlpatterns += [
+    path(
+        "repositories/<int:pk>/comments",
+        CommentViewSet.as_view({"get": "list"}),
+        name="repositories-comments",
+    ),
+]
+
 # forks
 urlpatterns += [
     path(
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PullrequestsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "pullrequests"
+
+    def ready(self):
+        import pullrequests.signals  # noqa: F401
@@ -0,0 +1,36 @@
+from typing import Optional
+
+from jobs.models import Job
+from jobs.utils import JobError, job_handler, set_progress
+from pullrequests.models import PullRequest
+from pullrequests.utils import fetch_pull_request
+from repositories.merge import MergeConflict, MergeError, merge_commit
+from repositories.pool import get_repo
+
+
+@job_handler("merge_pull_request")
+def merge_pull_request(job: Optional[Job], pull_request_id: int) -> dict:
+    pull_request = PullRequest.objects.select_related(
+        "source_repository", "target_repository"
+    ).get(pk=pull_request_id)
+    target_repo = get_repo(pull_request.target_repository.path)
+
+    try:
+        source_commit = fetch_pull_request(pull_request, target_repo)
+        set_progress(job, 30)
+        commit = merge_commit(
+            pull_request.target_repository,
+            target_repo,
+            pull_request.target_branch,
+            source_commit,
+            "Merged pull request",
+        )
+    except MergeConflict as e:
+        raise JobError({"error": str(e), "conflicts": e.conflicts})
+    except MergeError as e:
+        raise JobError({"error": str(e)})
+
+    pull_request.status = "merged"
+    pull_request.save()
+
+    return {"commit_hash": commit.hexsha}
@@ -26,6 +26,34 @@ class PullRequest(models.Model):
             ("merged", "Merged"),
         ),
     )
+    # Computed in the background for the branch heads it was checked at, None
+    # until the first check
+    mergeable = models.CharField(
+        max_length=20,
+        choices=(
+            ("clean", "Clean"),
+            ("conflicting", "Conflicting"),
+        ),
+        null=True,
+        blank=True,
+    )
+    conflicts = models.JSONField(default=list, blank=True)
+    merge_checked_source = models.CharField(max_length=40, null=True, blank=True)
+    merge_checked_target = models.CharField(max_length=40, null=True, blank=True)
+
+    class Meta:
+        # Open pull request checks are an index probe, listings also read the
+        # (updated, id) order from the same index
+        indexes = [
+            models.Index(
+                fields=["source_repository", "status", "-updated", "-id"],
+                name="pullrequest_source_status_idx",
+            ),
+            models.Index(
+                fields=["target_repository", "status", "-updated", "-id"],
+                name="pullrequest_target_status_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -0,0 +1,6 @@
+from repositories.pagination import KeysetPagination
+
+
+class PullRequestPagination(KeysetPagination):
+    orderings = {"updated": "updated"}
+    default_ordering = "updated"
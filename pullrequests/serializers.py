@@ -1,5 +1,6 @@
 from rest_framework.serializers import ModelSerializer
 
+from project.serializers import ValuesSerializer
 from pullrequests.models import PullRequest
 
 
@@ -7,3 +8,45 @@ class PullRequestSerializer(ModelSerializer):
     class Meta:
         model = PullRequest
         fields = "__all__"
+        read_only_fields = (
+            "mergeable",
+            "conflicts",
+            "merge_checked_source",
+            "merge_checked_target",
+        )
+
+
+class PullRequestListSerializer(ValuesSerializer):
+    # Related names come from the same joined query
+    model = PullRequest
+    fields = (
+        "id",
+        "title",
+        "text",
+        "status",
+        "user",
+        "user__username",
+        "source_repository",
+        "source_repository__name",
+        "source_branch",
+        "target_repository",
+        "target_repository__name",
+        "target_branch",
+        "mergeable",
+        "conflicts",
+        "created",
+        "updated",
+    )
+    default_fields = (
+        "id",
+        "title",
+        "status",
+        "user",
+        "user__username",
+        "source_repository",
+        "source_branch",
+        "target_repository",
+        "target_branch",
+        "mergeable",
+        "updated",
+    )
@@ -0,0 +1,18 @@
+from django.db.models import Q
+from django.dispatch import receiver
+
+from project.background import run_in_background
+from pullrequests.models import PullRequest
+from pullrequests.utils import update_mergeability
+from repositories.signals import repository_updated
+
+
+@receiver(repository_updated)
+def schedule_mergeability_update(sender, repository, **kwargs) -> None:
+    pull_requests = PullRequest.objects.filter(
+        Q(source_repository=repository) | Q(target_repository=repository),
+        status="open",
+    ).values_list("id", flat=True)
+
+    for pull_request_id in pull_requests:
+        run_in_background(update_mergeability, pull_request_id)
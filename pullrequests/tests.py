@@ -1,6 +1,9 @@
 import os
 import shutil
+from unittest import mock
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from git.repo import Repo
 from rest_framework import status
@@ -10,7 +13,11 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from forks.models import Fork
 from project.settings import REPO_ROOT
 from pullrequests.models import PullRequest
+from pullrequests.utils import update_mergeability
+from repositories.diff import diff_cache
+from repositories.merge import merge_commit
 from repositories.models import Repository
+from repositories.signals import repository_updated
 from users.models import User
 
 
@@ -99,6 +106,58 @@ class PullRequestViewSetTestCase(APITestCase):
         response = self.client.post(reverse("pullrequests-list"), self.data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_list_pull_requests(self):
+        PullRequest.objects.bulk_create(
+            [
+                PullRequest(
+                    title=f"pull request {i}",
+                    text="text",
+                    source_branch="new-branch-name",
+                    source_repository=self.repository2,
+                    target_branch="main",
+                    target_repository=self.repository,
+                    user=self.user2 if i % 2 else self.user1,
+                    status="open" if i < 5 else "closed",
+                )
+                for i in range(7)
+            ]
+        )
+        url = reverse("repositories-pullrequests", args=[self.repository.id])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"page_size": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # user, repository and one joined query for the page
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            [row["title"] for row in response.data["results"]],
+            ["pull request 6", "pull request 5", "pull request 4"],
+        )
+        self.assertEqual(
+            response.data["results"][0]["user__username"], "user1@user1.com"
+        )
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 3)
+        self.assertEqual(response.data["results"][0]["title"], "pull request 3")
+
+        response = self.client.get(
+            url, {"status": "open", "author": self.user2.id, "role": "target"}
+        )
+        self.assertEqual(
+            [row["title"] for row in response.data["results"]],
+            ["pull request 3", "pull request 1"],
+        )
+
+        response = self.client.get(
+            reverse("repositories-pullrequests", args=[self.repository2.id]),
+            {"role": "target"},
+        )
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.get(url, {"status": "unknown"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_destory_pull_request(self):
         response = self.client.post(reverse("pullrequests-list"), self.data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -120,9 +179,42 @@ class PullRequestViewSetTestCase(APITestCase):
         self.assertEqual(PullRequest.objects.count(), 1)
         self.assertEqual(PullRequest.objects.first().title, "test pull request")
 
-        response = self.client.get(reverse("pullrequests-check", args=[1]), self.data)
+        # Upstream changes after the fork are not part of the pull request
+        with open(os.path.join(self.repository.path, "UPSTREAM.txt"), "w") as f:
+            f.write("upstream")
+        target_repo = Repo(self.repository.path)
+        target_repo.index.add(["*"])
+        target_repo.index.commit("upstream commit")
+
+        response = self.client.get(reverse("pullrequests-check", args=[1]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertTrue("test" in str(response.data))
+        self.assertEqual(response.data["head"], repo.head.commit.hexsha)
+        self.assertIsNotNone(
+            diff_cache.get(f"{response.data['base']}...{response.data['head']}")
+        )
+        self.assertEqual(
+            response.data["files"],
+            [
+                {
+                    "path": "README.txt",
+                    "old_path": None,
+                    "status": "modified",
+                    "insertions": 1,
+                    "deletions": 0,
+                }
+            ],
+        )
+
+        response = self.client.get(
+            reverse("pullrequests-check", args=[1]), {"path": "README.txt"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("+test", response.data["patch"])
+
+        response = self.client.get(
+            reverse("pullrequests-check", args=[1]), {"path": "UPSTREAM.txt"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_approve_pull_request(self):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user1_token}")
@@ -175,6 +267,128 @@ class PullRequestViewSetTestCase(APITestCase):
         response = self.client.post(reverse("pullrequests-approve", args=[1]), data={})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+        conflict = response.data["conflicts"][0]
+        self.assertEqual(conflict["path"], "README.txt")
+        self.assertEqual(conflict["base"], "")
+        self.assertEqual(conflict["ours"], "asdfasdf")
+        self.assertEqual(conflict["theirs"], "test")
+        self.assertIn("<<<<<<<", conflict["merged"])
+
+        # Nothing was checked out or left half merged
+        self.assertEqual(PullRequest.objects.first().status, "open")
+        self.assertEqual(reop.remotes, [])
+        self.assertFalse(reop.is_dirty())
+        with open(os.path.join(self.repository.path, "README.txt"), "r") as f:
+            self.assertEqual(f.read(), "asdfasdf")
+
+    def test_approve_pull_request_with_merge_commit(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user1_token}")
+
+        response = self.client.post(reverse("pullrequests-list"), self.data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with open(os.path.join(self.repository2.path, "README.txt"), "w") as f:
+            f.write("test")
+        repo = Repo(self.repository2.path)
+        repo.index.add(["*"])
+        repo.index.commit("test commit")
+
+        with open(os.path.join(self.repository.path, "CHAPTER.txt"), "w") as f:
+            f.write("chapter")
+        target_repo = Repo(self.repository.path)
+        target_repo.index.add(["*"])
+        target_repo.index.commit("test commit")
+
+        response = self.client.post(reverse("pullrequests-approve", args=[1]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        head = target_repo.head.commit
+        self.assertEqual(head.hexsha, response.data["commit_hash"])
+        self.assertEqual(len(head.parents), 2)
+        self.assertEqual(head.parents[1].hexsha, repo.head.commit.hexsha)
+        self.assertFalse(target_repo.is_dirty())
+        with open(os.path.join(self.repository.path, "README.txt"), "r") as f:
+            self.assertEqual(f.read(), "test")
+
+    def test_merge_into_branch_not_checked_out(self):
+        target_repo = Repo(self.repository.path)
+        branch = target_repo.create_head("draft")
+        before = branch.commit.hexsha
+
+        with open(os.path.join(self.repository2.path, "README.txt"), "w") as f:
+            f.write("test")
+        repo = Repo(self.repository2.path)
+        repo.index.add(["*"])
+        theirs = repo.index.commit("test commit")
+        target_repo.git.fetch(self.repository2.path, theirs.hexsha)
+
+        receiver = mock.Mock()
+        repository_updated.connect(receiver)
+        try:
+            commit = merge_commit(
+                self.repository,
+                target_repo,
+                "draft",
+                target_repo.commit(theirs.hexsha),
+                "merge draft",
+            )
+        finally:
+            repository_updated.disconnect(receiver)
+
+        self.assertEqual(branch.commit.hexsha, commit.hexsha)
+        self.assertNotEqual(target_repo.head.commit.hexsha, commit.hexsha)
+        receiver.assert_called_once_with(
+            signal=repository_updated,
+            sender=Repository,
+            repository=self.repository,
+            before=before,
+            after=commit.hexsha,
+        )
+
+    def test_update_mergeability(self):
+        response = self.client.post(reverse("pullrequests-list"), self.data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with open(os.path.join(self.repository2.path, "README.txt"), "w") as f:
+            f.write("test")
+        repo = Repo(self.repository2.path)
+        repo.index.add(["*"])
+        repo.index.commit("test commit")
+
+        update_mergeability(1)
+        pull_request = PullRequest.objects.get(pk=1)
+        self.assertEqual(pull_request.mergeable, "clean")
+        self.assertEqual(pull_request.conflicts, [])
+        self.assertEqual(pull_request.merge_checked_source, repo.head.commit.hexsha)
+
+        with open(os.path.join(self.repository.path, "README.txt"), "w") as f:
+            f.write("asdfasdf")
+        target_repo = Repo(self.repository.path)
+        target_repo.index.add(["*"])
+        target_repo.index.commit("test commit")
+
+        update_mergeability(1)
+        pull_request = PullRequest.objects.get(pk=1)
+        self.assertEqual(pull_request.mergeable, "conflicting")
+        self.assertEqual(pull_request.conflicts, ["README.txt"])
+        self.assertEqual(pull_request.status, "open")
+
+        # The check leaves nothing behind in the target repository
+        self.assertFalse(target_repo.is_dirty())
+        self.assertFalse(
+            [name for name in os.listdir(target_repo.git_dir) if "merge-" in name]
+        )
+
+    @mock.patch("pullrequests.signals.run_in_background")
+    def test_schedule_mergeability_update(self, run_in_background):
+        self.client.post(reverse("pullrequests-list"), self.data)
+
+        repository_updated.send(
+            sender=Repository, repository=self.repository2, before=None, after=None
+        )
+
+        run_in_background.assert_called_once_with(update_mergeability, 1)
+
     def test_reject_pull_request(self):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user1_token}")
 
@@ -212,6 +426,82 @@ class PullRequestViewSetTestCase(APITestCase):
         with open(os.path.join(self.repository.path, "README.txt"), "r") as f:
             self.assertEqual(f.read(), "test")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(reop.head.commit.parents), 2)
+        self.assertEqual(PullRequest.objects.first().status, "merged")
+
+    def test_resolve_conflicts_in_one_commit(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user1_token}")
+        self.client.post(reverse("pullrequests-list"), self.data)
+
+        def commit(path: str, files: dict) -> Repo:
+            for name, text in files.items():
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(text)
+            repo = Repo(path)
+            repo.index.add(list(files))
+            repo.index.commit("test commit")
+            return repo
+
+        target_repo = commit(self.repository.path, {"A.txt": "a\nb\nc\nd\ne\n"})
+        source_repo = Repo(self.repository2.path)
+        source_repo.git.pull("--no-rebase", "--no-edit", self.repository.path, "main")
+
+        commit(
+            self.repository.path,
+            {"README.txt": "asdf", "A.txt": "a\nB\nc\nd\nE\n", "B.txt": "target"},
+        )
+        commit(
+            self.repository2.path,
+            {"README.txt": "test", "A.txt": "a\nb2\nc\nd\ne\nf\n", "B.txt": "src"},
+        )
+        head = target_repo.head.commit
+
+        response = self.client.post(reverse("pullrequests-approve", args=[1]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        conflicts = {item["path"]: item for item in response.data["conflicts"]}
+        self.assertEqual(sorted(conflicts), ["A.txt", "B.txt", "README.txt"])
+        self.assertEqual(
+            conflicts["A.txt"]["hunks"],
+            [
+                {"base": "b\n", "ours": "B\n", "theirs": "b2\n"},
+                {"base": "e\n", "ours": "E\n", "theirs": "e\nf\n"},
+            ],
+        )
+
+        # Every conflict has to be resolved in the same request
+        response = self.client.post(
+            reverse("pullrequests-resolve", args=[1]),
+            {"resolutions": {"README.txt": "theirs"}},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data["conflicts"]), 2)
+        self.assertEqual(target_repo.head.commit, head)
+
+        response = self.client.post(
+            reverse("pullrequests-resolve", args=[1]),
+            {
+                "resolutions": {
+                    "README.txt": "theirs",
+                    "A.txt": {"hunks": ["theirs", "ours"]},
+                    "B.txt": {"content": "both"},
+                }
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        merge = target_repo.head.commit
+        self.assertEqual(merge.parents, (head, source_repo.head.commit))
+        for name, text in (
+            ("README.txt", "test"),
+            ("A.txt", "a\nb2\nc\nd\nE\n"),
+            ("B.txt", "both"),
+        ):
+            with open(os.path.join(self.repository.path, name), "r") as f:
+                self.assertEqual(f.read(), text)
+        self.assertFalse(target_repo.is_dirty())
+        self.assertEqual(PullRequest.objects.first().status, "merged")
 
     # no_auth
     def test_get_pull_request_list_no_auth(self):
@@ -0,0 +1,109 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from git.exc import GitCommandError
+from git.objects import Commit
+from git.repo import Repo
+
+from pullrequests.models import PullRequest
+from repositories.diff import get_object_env, get_range_diff
+from repositories.merge import MergeError, merge_trees
+from repositories.pool import get_repo
+
+logger = logging.getLogger(__name__)
+
+
+def get_pull_request_ref(pull_request: PullRequest) -> str:
+    return f"refs/pullrequests/{pull_request.id}/head"
+
+
+def fetch_pull_request(pull_request: PullRequest, target_repo: Repo) -> Commit:
+    # Copies the source branch's objects into the target under a hidden ref, no
+    # remote is added and neither working tree is touched
+    ref = get_pull_request_ref(pull_request)
+    try:
+        target_repo.git.fetch(
+            "--no-tags",
+            "--quiet",
+            pull_request.source_repository.path,
+            f"+refs/heads/{pull_request.source_branch}:{ref}",
+        )
+    except GitCommandError as e:
+        raise MergeError(e.stderr.strip())
+    return target_repo.commit(ref)
+
+
+def get_pull_request_diff(pull_request: PullRequest) -> tuple:
+    # The diff of the source branch since it left the target branch, cached per
+    # pair of branch heads. The source objects are read through alternates.
+    target_repo = get_repo(pull_request.target_repository.path)
+    source_repo = get_repo(pull_request.source_repository.path)
+    env = get_object_env(source_repo)
+
+    diff = get_range_diff(
+        target_repo,
+        target_repo.heads[pull_request.target_branch].commit.hexsha,
+        source_repo.heads[pull_request.source_branch].commit.hexsha,
+        env,
+    )
+    return target_repo, diff, env
+
+
+def check_mergeable(
+    target_repo: Repo, source_repo: Repo, ours: str, theirs: str
+) -> list:
+    # The merge runs against a scratch object directory, it reads both object
+    # stores and the trees it writes are thrown away
+    scratch = tempfile.mkdtemp(prefix="merge-", dir=target_repo.common_dir)
+    env = {
+        "GIT_OBJECT_DIRECTORY": scratch,
+        "GIT_ALTERNATE_OBJECT_DIRECTORIES": os.pathsep.join(
+            os.path.join(repo.common_dir, "objects")
+            for repo in (target_repo, source_repo)
+        ),
+    }
+    try:
+        _, conflicts = merge_trees(target_repo, ours, theirs, env)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return sorted(conflicts)
+
+
+def update_mergeability(pull_request_id: int) -> None:
+    pull_request = (
+        PullRequest.objects.select_related("source_repository", "target_repository")
+        .filter(pk=pull_request_id, status="open")
+        .first()
+    )
+    if pull_request is None:
+        return
+
+    target_repo = get_repo(pull_request.target_repository.path)
+    source_repo = get_repo(pull_request.source_repository.path)
+    try:
+        ours = target_repo.heads[pull_request.target_branch].commit.hexsha
+        theirs = source_repo.heads[pull_request.source_branch].commit.hexsha
+    except IndexError:
+        return
+
+    if (
+        pull_request.merge_checked_target == ours
+        and pull_request.merge_checked_source == theirs
+    ):
+        return
+
+    try:
+        conflicts = check_mergeable(target_repo, source_repo, ours, theirs)
+    except MergeError as e:
+        logger.warning("could not check %s for conflicts: %s", pull_request, e)
+        return
+
+    # update() leaves the updated timestamp alone, nothing the author did changed
+    PullRequest.objects.filter(pk=pull_request.pk).update(
+        mergeable="conflicting" if conflicts else "clean",
+        conflicts=conflicts,
+        merge_checked_target=ours,
+        merge_checked_source=theirs,
+    )
@@ -1,14 +1,39 @@
 from typing import Optional
 
 from django.db import transaction
-from django.http import HttpRequest
-from git.repo import Repo
+from django.db.models import Q
+from django.http import Http404, HttpRequest
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from jobs.utils import run_or_enqueue_job
+from project.background import run_in_background
 from pullrequests.models import PullRequest
-from pullrequests.serializers import PullRequestSerializer
+from pullrequests.pagination import PullRequestPagination
+from pullrequests.serializers import PullRequestListSerializer, PullRequestSerializer
+from pullrequests.utils import (
+    fetch_pull_request,
+    get_pull_request_diff,
+    update_mergeability,
+)
+from repositories.diff import get_file_patch
+from repositories.locks import locks_repository
+from repositories.merge import MergeConflict, MergeError, merge_commit
+from repositories.models import Repository
+from repositories.pool import get_repo
+
+STATUSES = ("open", "closed", "merged")
+
+# Sides of a conflict a resolution can pick
+CHOICES = {"HEAD": "ours", "REMOTE": "theirs"}
+
+
+def get_pull_request_paths(pk: Optional[str] = None) -> list:
+    pull_request = PullRequest.objects.select_related(
+        "source_repository", "target_repository"
+    ).get(pk=pk)
+    return [pull_request.target_repository.path, pull_request.source_repository.path]
 
 
 class PullRequestViewSet(viewsets.ViewSet):
@@ -19,10 +44,63 @@ class PullRequestViewSet(viewsets.ViewSet):
     def create(self, request: HttpRequest) -> Response:
         serializer = PullRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        pull_request = serializer.save()
+        run_in_background(update_mergeability, pull_request.id)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def list(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        def prepare_data(request: HttpRequest) -> Optional[tuple]:
+            pr_status = request.query_params.get("status")
+            author = request.query_params.get("author")
+            role = request.query_params.get("role")
+
+            if pr_status is not None and pr_status not in STATUSES:
+                return None
+            if author is not None and not author.isdigit():
+                return None
+            if role not in (None, "source", "target"):
+                return None
+
+            return pr_status, author, role
+
+        repository = Repository.objects.filter(pk=pk).first()
+        if repository is None:
+            raise Http404
+
+        if (
+            repository.private
+            and not repository.owners.filter(id=request.user.id).exists()
+        ):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        data = prepare_data(request)
+        if data is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        pr_status, author, role = data
+
+        if role == "source":
+            query = PullRequest.objects.filter(source_repository=repository)
+        elif role == "target":
+            query = PullRequest.objects.filter(target_repository=repository)
+        else:
+            query = PullRequest.objects.filter(
+                Q(source_repository=repository) | Q(target_repository=repository)
+            )
+
+        if pr_status is not None:
+            query = query.filter(status=pr_status)
+        if author is not None:
+            query = query.filter(user_id=author)
+
+        pagenator = PullRequestPagination()
+        serializer = PullRequestListSerializer(request)
+
+        query = serializer.get_queryset(query, "updated")
+        query = pagenator.paginate_queryset(query, request)
+
+        return pagenator.get_paginated_response(serializer.serialize(query))
+
     def destroy(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         PullRequest.objects.filter(pk=pk).delete()
 
@@ -32,98 +110,44 @@ class PullRequestViewSet(viewsets.ViewSet):
     def check_difference(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
-        def get_working_tree(target_repo: Repo, source_repo: Repo) -> list:
-            source_commit = source_repo.head.commit
-            source_tree = source_commit.tree
-            target_commit = target_repo.head.commit
-            target_tree = target_commit.tree
-
-            diff_index = source_tree.diff(target_tree)
-            working_tree = []
+        pull_request = PullRequest.objects.select_related(
+            "source_repository", "target_repository"
+        ).get(pk=pk)
 
-            for diff in diff_index:
-                a_blob = diff.a_blob
-                b_blob = diff.b_blob
-                if a_blob and b_blob:
-                    working_tree.append(
-                        source_repo.git.diff(a_blob.hexsha, b_blob.hexsha)
-                    )
-
-            return working_tree
-
-        pull_request = PullRequest.objects.get(pk=pk)
+        try:
+            target_repo, diff, env = get_pull_request_diff(pull_request)
+        except IndexError:
+            # One of the branches is gone
+            raise Http404
 
-        target_repo = Repo(pull_request.target_repository.path)
-        source_repo = Repo(pull_request.source_repository.path)
+        path = request.query_params.get("path")
+        if path is None:
+            return Response(diff, status=status.HTTP_200_OK)
 
-        working_tree = get_working_tree(target_repo, source_repo)
+        # Patches are read one file at a time
+        for file in diff["files"]:
+            if file["path"] == path:
+                patch = get_file_patch(target_repo, diff, file, env)
+                return Response({**file, "patch": patch}, status=status.HTTP_200_OK)
 
-        return Response(working_tree, status=status.HTTP_200_OK)
+        raise Http404
 
     @action(detail=True, methods=["post"], url_path="approve", url_name="approve")
     def approve_pull_request(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
-        def prepare_merging(pullrequest: PullRequest) -> tuple:
-            target_repo = Repo(pullrequest.target_repository.path)
-            target_repo.git.checkout(pullrequest.target_branch)
-
-            source_repo = Repo(pullrequest.source_repository.path)
-            source_repo.git.checkout(pullrequest.source_branch)
-
-            target_remote = target_repo.create_remote(
-                "source", url=f"file://{source_repo.working_dir}"
-            )
-            target_remote.fetch()
-
-            source_branch = (
-                f"{target_remote.name}/{source_repo.heads[pullrequest.source_branch]}"
-            )
-
-            return target_repo, target_remote, source_branch
-
-        def merge(target_repo: Repo, source_branch: str) -> tuple:
-            try:
-                target_repo.git.merge(source_branch)
-                return True, None
-            except Exception as e:
-                data = {"error": str(e)}
-                temp = target_repo.index.unmerged_blobs()
-                file_path = list(temp.keys())[0]
-                blob_list = temp[file_path]
-                path = blob_list[0][1].abspath
-                with open(path, "r") as f:
-                    data["file"] = f.read()
-                return False, data
-
-        def commit(target_repo: Repo) -> None:
-            target_repo.index.add(["*"])
-            target_repo.index.commit("Merged pull request")
-
-        def push_and_delete(
-            target_repo: Repo, target_remote: Repo, target_branch: str
-        ) -> None:
-            target_remote.push(refspec=f"{target_branch}:{target_branch}")
-            target_repo.delete_remote(target_remote)
-
         pull_request = PullRequest.objects.get(pk=pk)
 
         if pull_request.target_repository.user != request.user:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        pull_request.status = "merged"
-        pull_request.save()
-
-        target_repo, target_remote, source_branch = prepare_merging(pull_request)
-        is_merged, data = merge(target_repo, source_branch)
-
-        if not is_merged:
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        commit(target_repo)
-        push_and_delete(target_repo, target_remote, pull_request.target_branch)
-
-        return Response(status=status.HTTP_200_OK)
+        return run_or_enqueue_job(
+            request,
+            "merge_pull_request",
+            get_pull_request_paths(pk),
+            status.HTTP_200_OK,
+            pull_request_id=pull_request.id,
+        )
 
     @action(detail=True, methods=["post"], url_path="reject", url_name="reject")
     def reject_pull_request(
@@ -140,38 +164,56 @@ class PullRequestViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"], url_path="resolve", url_name="resolve")
+    @locks_repository(get_pull_request_paths)
     def resolve_conflict(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
-        def commit(target_repo: Repo, path: str) -> None:
-            target_repo.index.remove([path])
-            target_repo.index.add([path])
-            target_repo.index.commit("Resolved conflict")
-
-        def resolve(target_repo: Repo, filename: str, choice: str) -> None:
-            unmerged_blobs = target_repo.index.unmerged_blobs()[filename]
-            path = unmerged_blobs[0][1].abspath
-
-            with open(path, "w") as f:
-                if choice == "HEAD":
-                    f.write(unmerged_blobs[1][1].data_stream.read().decode("utf-8"))
-                elif choice == "REMOTE":
-                    f.write(unmerged_blobs[2][1].data_stream.read().decode("utf-8"))
-
-            commit(target_repo, path)
-
-        choice = request.data.get("choice")
-        filename = request.data.get("filename")
-
-        if not choice or not filename:
+        def prepare_data(request: HttpRequest) -> Optional[dict]:
+            # resolutions maps every conflicting path to "ours", "theirs",
+            # {"content": text} or {"hunks": [...]}. A single file can still be
+            # resolved with choice (HEAD or REMOTE) and filename.
+            resolutions = request.data.get("resolutions")
+            if resolutions is not None:
+                return resolutions if isinstance(resolutions, dict) else None
+
+            choice = CHOICES.get(request.data.get("choice"))
+            filename = request.data.get("filename")
+            if not choice or not filename:
+                return None
+            return {filename: choice}
+
+        resolutions = prepare_data(request)
+
+        if not resolutions:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        pull_request = PullRequest.objects.get(pk=pk)
+        pull_request = PullRequest.objects.select_related(
+            "source_repository", "target_repository"
+        ).get(pk=pk)
 
         if pull_request.target_repository.user != request.user:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        target_repo = Repo(pull_request.target_repository.path)
-        resolve(target_repo, filename, choice)
+        # The merge is computed again and every resolution goes into one commit
+        target_repo = get_repo(pull_request.target_repository.path)
+        try:
+            commit = merge_commit(
+                pull_request.target_repository,
+                target_repo,
+                pull_request.target_branch,
+                fetch_pull_request(pull_request, target_repo),
+                "Resolved conflict",
+                resolutions,
+            )
+        except MergeConflict as e:
+            return Response(
+                {"error": str(e), "conflicts": e.conflicts},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except MergeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        pull_request.status = "merged"
+        pull_request.save()
 
-        return Response(status=status.HTTP_200_OK)
+        return Response({"commit_hash": commit.hexsha}, status=status.HTTP_200_OK)
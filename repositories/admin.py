@@ -1,5 +1,13 @@
 from django.contrib import admin
 
-from repositories.models import Repository
+from repositories.models import (
+    CommitStats,
+    Repository,
+    RestorePoint,
+    TemplatePoolStats,
+)
 
 admin.site.register(Repository)
+admin.site.register(RestorePoint)
+admin.site.register(CommitStats)
+admin.site.register(TemplatePoolStats)
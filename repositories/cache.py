@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from project.settings import (
+    CACHE_ROOT,
+    SNAPSHOT_CACHE_DISK_MAX_AGE,
+    SNAPSHOT_CACHE_DISK_MAX_BYTES,
+    SNAPSHOT_CACHE_PRUNE_INTERVAL,
+    SNAPSHOT_CACHE_SIZE,
+)
+
+
+# Values keyed by git object ids never change, so entries are never invalidated.
+# Each worker keeps a bounded LRU in front of a directory shared by all workers.
+# The directory is pruned by age and size, a file's mtime is its last use.
+class SnapshotCache:
+    def __init__(
+        self,
+        namespace: str,
+        max_size: int = SNAPSHOT_CACHE_SIZE,
+        max_bytes: int = SNAPSHOT_CACHE_DISK_MAX_BYTES,
+        max_age: int = SNAPSHOT_CACHE_DISK_MAX_AGE,
+    ) -> None:
+        self.directory = os.path.join(CACHE_ROOT, namespace)
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.prune_lock = threading.Lock()
+        self.writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        value = self.read(key)
+        if value is not None:
+            self.remember(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.remember(key, value)
+        self.write(key, value)
+
+    def get_or_set(self, key: str, build: Callable[[], str]) -> str:
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def remember(self, key: str, value: str) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def read(self, key: str) -> Optional[str]:
+        path = self.get_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def write(self, key: str, value: str) -> None:
+        path = self.get_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(value)
+            # Other workers must never see a half written file
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self.lock:
+            self.writes += 1
+            due = self.writes % SNAPSHOT_CACHE_PRUNE_INTERVAL == 0
+        # One thread prunes at a time, the others do not wait for it
+        if due and self.prune_lock.acquire(blocking=False):
+            try:
+                self.prune()
+            finally:
+                self.prune_lock.release()
+
+    def prune(self) -> int:
+        # Removes the files unused for max_age seconds, then the least recently used
+        # ones until the directory holds at most max_bytes
+        files = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        deadline = time.time() - self.max_age
+        removed = 0
+
+        for mtime, size, path in files:
+            if mtime >= deadline and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        return removed
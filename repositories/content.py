@@ -0,0 +1,108 @@
+import hashlib
+import mimetypes
+import re
+from typing import Iterator, Optional
+
+from git.repo import Repo
+from gitdb.util import hex_to_bin
+
+from project.settings import CONTENT_CHUNK_SIZE
+from repositories.cache import SnapshotCache
+
+blob_cache = SnapshotCache("blobs")
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+def resolve_blob(repo: Repo, ref: str, path: str) -> tuple:
+    # (commit, path) always names the same blob, only the ref itself is resolved
+    commit_sha = repo.commit(ref).hexsha
+    key = hashlib.sha1(f"{commit_sha}:{path}".encode("utf-8")).hexdigest()
+
+    value = blob_cache.get(key)
+    if value is None:
+        blob = repo.commit(commit_sha).tree / path
+        if blob.type != "blob":
+            raise KeyError(path)
+        value = f"{blob.hexsha} {blob.size}"
+        blob_cache.set(key, value)
+
+    hexsha, size = value.split()
+    return hexsha, int(size)
+
+
+def is_immutable_ref(ref: str) -> bool:
+    return SHA_PATTERN.match(ref) is not None
+
+
+def get_etag(hexsha: str) -> str:
+    return f'"{hexsha}"'
+
+
+def check_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    # Multiple ranges are rare for text and are answered with the whole blob
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        start = max(size - int(end), 0)
+        end = size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise ValueError(header)
+
+    return start, end
+
+
+def get_content_type(path: str) -> str:
+    content_type, _ = mimetypes.guess_type(path)
+    if content_type is None or content_type.startswith("text/"):
+        return "text/plain; charset=utf-8"
+    return content_type
+
+
+def read_blob(repo: Repo, hexsha: str) -> bytes:
+    return repo.odb.stream(hex_to_bin(hexsha)).read()
+
+
+def iter_blob(repo: Repo, hexsha: str, start: int, end: int) -> Iterator[bytes]:
+    stream = repo.odb.stream(hex_to_bin(hexsha))
+
+    try:
+        skipped = 0
+        while skipped < start:
+            skipped += len(stream.read(min(CONTENT_CHUNK_SIZE, start - skipped)))
+
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = stream.read(min(CONTENT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        # The cat-file process is shared, leave it positioned at the next object
+        while stream.read(CONTENT_CHUNK_SIZE):
+            pass
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+from git import NULL_TREE
+from git.diff import Diff
+from git.exc import GitCommandError
+from git.objects import Commit
+from git.repo import Repo
+
+from repositories.cache import SnapshotCache
+
+diff_cache = SnapshotCache("diffs")
+
+NULL_HEXSHA = "0" * 40
+EMPTY_TREE_HEXSHA = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+NAME_STATUS = {"A": "added", "D": "deleted", "R": "renamed", "C": "added"}
+
+
+def get_diff_status(diff: Diff) -> str:
+    if diff.new_file:
+        return "added"
+    if diff.deleted_file:
+        return "deleted"
+    if diff.renamed_file:
+        return "renamed"
+    return "modified"
+
+
+def serialize_diff(diff: Diff) -> dict:
+    old_path = None if diff.new_file else diff.a_path
+    path = diff.a_path if diff.deleted_file else diff.b_path
+    patch = diff.diff.decode("utf-8", errors="replace") if diff.diff else ""
+
+    if patch:
+        header = f"--- {'a/' + old_path if old_path else '/dev/null'}\n"
+        header += f"+++ {'/dev/null' if diff.deleted_file else 'b/' + path}\n"
+        patch = header + patch
+
+    return {
+        "path": path,
+        "old_path": old_path,
+        "status": get_diff_status(diff),
+        "patch": patch,
+    }
+
+
+def build_diff(parent: Optional[Commit], commit: Commit) -> list:
+    # A single `git diff-tree -p` for the whole commit, root commits are compared
+    # with the empty tree
+    if parent is None:
+        diff_index = commit.diff(NULL_TREE, create_patch=True)
+    else:
+        diff_index = parent.diff(commit, create_patch=True, M=True)
+
+    return [serialize_diff(diff) for diff in diff_index]
+
+
+def get_commit_diff(commit: Commit) -> list:
+    parent = commit.parents[0] if commit.parents else None
+    key = f"{parent.hexsha if parent else NULL_HEXSHA}-{commit.hexsha}"
+
+    return json.loads(
+        diff_cache.get_or_set(key, lambda: json.dumps(build_diff(parent, commit)))
+    )
+
+
+def get_diffstat(repo: Repo, a: Commit, b: Commit) -> dict:
+    files = []
+    for line in repo.git.diff("--numstat", "-M", a.hexsha, b.hexsha).splitlines():
+        insertions, deletions, path = line.split("\t", 2)
+        # Binary files have no line counts
+        files.append(
+            {
+                "path": path,
+                "insertions": int(insertions) if insertions.isdigit() else 0,
+                "deletions": int(deletions) if deletions.isdigit() else 0,
+            }
+        )
+
+    return {
+        "files": files,
+        "insertions": sum(file["insertions"] for file in files),
+        "deletions": sum(file["deletions"] for file in files),
+    }
+
+
+def get_object_env(other: Repo) -> dict:
+    # Lets git read the objects of another repository, e.g. a fork's new commits
+    # from its upstream, without fetching them
+    return {
+        "GIT_ALTERNATE_OBJECT_DIRECTORIES": os.path.join(other.common_dir, "objects")
+    }
+
+
+def get_merge_base(repo: Repo, a: str, b: str, env: dict) -> str:
+    try:
+        return repo.git.merge_base(a, b, env=env)
+    except GitCommandError:
+        # Unrelated histories, everything on b is new
+        return EMPTY_TREE_HEXSHA
+
+
+def parse_name_status(output: str) -> list:
+    # (status, old_path, path) from `git diff --name-status -z`, renames and copies
+    # carry both paths
+    fields = output.split("\0")
+    rows = []
+    i = 0
+    while i < len(fields) and fields[i]:
+        if fields[i][0] in "RC":
+            rows.append((fields[i], fields[i + 1], fields[i + 2]))
+            i += 3
+        else:
+            rows.append((fields[i], None, fields[i + 1]))
+            i += 2
+    return rows
+
+
+def parse_numstat(output: str) -> dict:
+    # path -> (insertions, deletions) from `git diff --numstat -z`
+    fields = output.split("\0")
+    stats = {}
+    i = 0
+    while i < len(fields) and fields[i]:
+        insertions, deletions, path = fields[i].split("\t", 2)
+        if path:
+            i += 1
+        else:
+            path = fields[i + 2]
+            i += 3
+        stats[path] = (insertions, deletions)
+    return stats
+
+
+def build_file_list(repo: Repo, base: str, head: str, env: dict) -> list:
+    statuses = parse_name_status(
+        repo.git.diff("--name-status", "-z", "-M", base, head, env=env)
+    )
+    stats = parse_numstat(repo.git.diff("--numstat", "-z", "-M", base, head, env=env))
+
+    files = []
+    for name_status, old_path, path in statuses:
+        insertions, deletions = stats.get(path, ("-", "-"))
+        status = NAME_STATUS.get(name_status[0], "modified")
+        files.append(
+            {
+                "path": path,
+                "old_path": old_path if status == "renamed" else None,
+                "status": status,
+                # Binary files have no line counts
+                "insertions": int(insertions) if insertions.isdigit() else 0,
+                "deletions": int(deletions) if deletions.isdigit() else 0,
+            }
+        )
+    return files
+
+
+def get_range_diff(repo: Repo, base_sha: str, head_sha: str, env: dict) -> dict:
+    # Three-dot diff: what head changed since it branched off base. Only the file
+    # list is built here, patches are read per file with get_file_patch.
+    def build() -> str:
+        merge_base = get_merge_base(repo, base_sha, head_sha, env)
+        files = build_file_list(repo, merge_base, head_sha, env)
+        return json.dumps(
+            {
+                "base": base_sha,
+                "head": head_sha,
+                "merge_base": merge_base,
+                "files": files,
+                "insertions": sum(file["insertions"] for file in files),
+                "deletions": sum(file["deletions"] for file in files),
+            }
+        )
+
+    return json.loads(diff_cache.get_or_set(f"{base_sha}...{head_sha}", build))
+
+
+def get_file_patch(repo: Repo, diff: dict, file: dict, env: dict) -> str:
+    paths = [path for path in (file["old_path"], file["path"]) if path]
+    key = hashlib.sha1("\0".join(paths).encode("utf-8")).hexdigest()
+
+    return diff_cache.get_or_set(
+        f"{diff['merge_base']}-{diff['head']}-{key}",
+        lambda: repo.git.diff(
+            "-M", diff["merge_base"], diff["head"], "--", *paths, env=env
+        ),
+    )
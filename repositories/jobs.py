@@ -0,0 +1,23 @@
+import json
+from typing import Optional
+
+from jobs.models import Job
+from jobs.utils import job_handler, set_progress
+from repositories.models import Repository
+from repositories.objects import commit_changes
+from repositories.pool import get_repo
+from repositories.utils import get_structure_changes
+
+
+@job_handler("update_structure")
+def update_structure(
+    job: Optional[Job], repository_id: int, structure: str, message: str
+) -> None:
+    repository = Repository.objects.get(pk=repository_id)
+    repo = get_repo(repository.path)
+
+    changes = get_structure_changes(repo, json.loads(structure))
+    set_progress(job, 50)
+
+    if changes:
+        commit_changes(repository, repo, changes, message)
@@ -0,0 +1,143 @@
+import fcntl
+import hashlib
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from project.settings import (
+    REPO_LOCK_QUEUE_SIZE,
+    REPO_LOCK_ROOT,
+    REPO_LOCK_TIMEOUT,
+    REPO_LOCK_WARN_WAIT,
+)
+from repositories.models import Repository
+
+logger = logging.getLogger(__name__)
+
+
+class RepositoryBusy(Exception):
+    pass
+
+
+class LockTimer:
+    def __init__(self) -> None:
+        self.wait = 0.0
+
+
+def get_lock_path(path: str, name: str) -> str:
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(REPO_LOCK_ROOT, f"{key}.{name}")
+
+
+def try_lock(lock_path: str) -> Optional[int]:
+    # flock belongs to the open file, so threads of one worker exclude each other
+    # as well as other workers, and the kernel drops it if the process dies.
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def unlock(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def take_queue_slot(path: str, name: str) -> int:
+    for slot in range(REPO_LOCK_QUEUE_SIZE):
+        fd = try_lock(get_lock_path(path, f"{name}-wait-{slot}"))
+        if fd is not None:
+            return fd
+    raise RepositoryBusy(path)
+
+
+def acquire(path: str, name: str, deadline: float) -> int:
+    fd = try_lock(get_lock_path(path, name))
+    if fd is not None:
+        return fd
+
+    # Waiters hold one of a fixed number of slots, when all are taken the request
+    # is turned away instead of piling up behind the lock.
+    slot = take_queue_slot(path, name)
+    delay = 0.005
+    try:
+        while True:
+            fd = try_lock(get_lock_path(path, name))
+            if fd is not None:
+                return fd
+            if time.monotonic() >= deadline:
+                raise RepositoryBusy(path)
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, 0.1)
+    finally:
+        unlock(slot)
+
+
+@contextmanager
+def repository_lock(
+    *paths: str, timeout: Optional[float] = None, name: str = "lock"
+) -> Iterator[LockTimer]:
+    # name picks an independent lock, "lock" guards git writes. Several repositories
+    # are always locked in the same order.
+    paths = sorted({os.path.abspath(path) for path in paths})
+    deadline = time.monotonic() + (REPO_LOCK_TIMEOUT if timeout is None else timeout)
+    timer = LockTimer()
+    start = time.monotonic()
+    fds = []
+
+    try:
+        for path in paths:
+            fds.append(acquire(path, name, deadline))
+        timer.wait = time.monotonic() - start
+
+        if timer.wait >= REPO_LOCK_WARN_WAIT:
+            logger.warning("waited %.3fs for lock on %s", timer.wait, ", ".join(paths))
+
+        yield timer
+    finally:
+        for fd in reversed(fds):
+            unlock(fd)
+
+
+def get_repository_paths(pk: Optional[str] = None, **kwargs) -> list:
+    return [Repository.objects.get(pk=pk).path]
+
+
+def busy_response() -> Response:
+    response = Response(
+        {"error": "repository is busy"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def locks_repository(get_paths: Callable[..., list]) -> Callable:
+    # get_paths receives the view's URL kwargs and returns the repository paths the
+    # view writes to
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs) -> Response:
+            paths = get_paths(**kwargs)
+
+            try:
+                with repository_lock(*paths) as timer:
+                    response = func(self, request, *args, **kwargs)
+            except RepositoryBusy:
+                return busy_response()
+
+            response["Server-Timing"] = f"lock;dur={timer.wait * 1000:.1f}"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,84 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from git.repo import Repo
+
+from forks.utils import dissociate_dependents
+from repositories.locks import RepositoryBusy, repository_lock
+from repositories.models import Repository
+from repositories.pool import repo_pool
+
+
+class Command(BaseCommand):
+    help = "Convert repositories with a working tree into bare repositories in place"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Convert even if the working tree has uncommitted changes",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        repositories = Repository.objects.order_by("id")
+        if options["ids"]:
+            repositories = repositories.filter(id__in=options["ids"])
+
+        converted = 0
+        for repository in repositories.iterator():
+            try:
+                with repository_lock(repository.path):
+                    if self.convert(repository, options["force"], options["dry_run"]):
+                        converted += 1
+            except RepositoryBusy:
+                self.stderr.write(f"Skipped {repository.path}: repository is busy")
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} repositories"))
+
+    def convert(self, repository: Repository, force: bool, dry_run: bool) -> bool:
+        path = repository.path
+        git_dir = os.path.join(path, ".git")
+        staging_dir = f"{path}.bare"
+        worktree_dir = f"{path}.worktree"
+
+        # Every step is a rename, so an interrupted run is finished by running again
+        if not os.path.exists(staging_dir) and not os.path.isdir(git_dir):
+            if os.path.isdir(worktree_dir) and Repo(path).bare:
+                shutil.rmtree(worktree_dir)
+            return False
+
+        if os.path.isdir(git_dir):
+            repo = Repo(path)
+            if repo.is_dirty(untracked_files=True) and not force:
+                self.stderr.write(f"Skipped {path}: working tree has changes")
+                return False
+
+            self.stdout.write(f"Converting {path}")
+            if dry_run:
+                return False
+
+            # Forks borrowing from .git/objects would lose them with the rename
+            dissociate_dependents(path)
+            repo.close()
+            os.rename(git_dir, staging_dir)
+
+        repo_pool.evict(path)
+
+        staging = Repo(staging_dir)
+        with staging.config_writer() as config_writer:
+            config_writer.set_value("core", "bare", True)
+        staging.close()
+
+        index_path = os.path.join(staging_dir, "index")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+        if os.path.exists(path):
+            os.rename(path, worktree_dir)
+        os.rename(staging_dir, path)
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+
+        return True
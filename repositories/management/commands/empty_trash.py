@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from project.settings import TRASH_REAP_RATE
+from repositories.trash import empty_trash
+
+
+class Command(BaseCommand):
+    help = "Remove deleted repositories from the trash, resuming interrupted removals"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=TRASH_REAP_RATE,
+            help="Bytes removed per second, 0 for no limit",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and empty the trash every interval seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            reaped = empty_trash(options["rate"] or None)
+            self.stdout.write(self.style.SUCCESS(f"Reaped {reaped} entries"))
+
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from project.settings import BARE_REPOSITORIES, TEMPLATE_POOL_SIZE
+from repositories.template_pool import fill_template_pool, get_template_pool_stats
+
+
+class Command(BaseCommand):
+    help = "Create pre-initialized repositories until the template pool is full"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=TEMPLATE_POOL_SIZE)
+        parser.add_argument(
+            "--stats", action="store_true", help="Only print the pool hit rate"
+        )
+
+    def handle(self, *args, **options):
+        if not options["stats"]:
+            created = fill_template_pool(options["size"], BARE_REPOSITORIES)
+            self.stdout.write(self.style.SUCCESS(f"Created {created} templates"))
+
+        stats = get_template_pool_stats(BARE_REPOSITORIES)
+        hit_rate = stats["hit_rate"]
+        self.stdout.write(
+            f"size={stats['size']} hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={'-' if hit_rate is None else f'{hit_rate:.2f}'}"
+        )
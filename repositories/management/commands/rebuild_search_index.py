@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from repositories.models import Repository
+from repositories.search import (
+    delete_repository_documents,
+    is_search_available,
+    update_search_index,
+)
+
+
+class Command(BaseCommand):
+    help = "Bring the full-text search index up to date with every repository HEAD"
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Drop the indexed documents and index HEAD from scratch",
+        )
+
+    def handle(self, *args, **options):
+        if not is_search_available():
+            self.stderr.write("Full-text search needs the SQLite database backend")
+            return
+
+        repositories = Repository.objects.order_by("id")
+        if options["ids"]:
+            repositories = repositories.filter(id__in=options["ids"])
+
+        indexed = 0
+        for repository in repositories.iterator():
+            if options["full"]:
+                delete_repository_documents(repository.id)
+            update_search_index(repository.id)
+            indexed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} repositories"))
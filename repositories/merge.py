@@ -0,0 +1,199 @@
+from typing import Optional
+
+from git.objects import Commit
+from git.refs import Head
+from git.repo import Repo
+
+from repositories.merge3 import get_hunks, resolve_hunks
+from repositories.models import Repository
+from repositories.objects import (
+    FILE_MODE,
+    TREE_MODE,
+    edit_tree,
+    move_head,
+    read_object,
+    read_tree_entries,
+    write_blob,
+    write_commit,
+)
+from repositories.signals import repository_updated
+
+# Stages of a conflicted path as written by `git merge-tree`
+STAGES = {1: "base", 2: "ours", 3: "theirs"}
+
+
+class MergeError(Exception):
+    pass
+
+
+class MergeConflict(Exception):
+    def __init__(self, conflicts: list) -> None:
+        super().__init__(f"{len(conflicts)} conflicting files")
+        self.conflicts = conflicts
+
+
+def merge_trees(
+    repo: Repo, ours: str, theirs: str, env: Optional[dict] = None
+) -> tuple:
+    # Merges in the object database only, no index or working tree is involved.
+    # Returns the merged tree, with conflict markers in conflicting files, and
+    # path -> {stage: (mode, binsha)} for every conflict.
+    code, output, error = repo.git.merge_tree(
+        "--write-tree",
+        "-z",
+        "--no-messages",
+        ours,
+        theirs,
+        with_extended_output=True,
+        with_exceptions=False,
+        env=env,
+    )
+    if code not in (0, 1):
+        raise MergeError(error)
+
+    tree, *entries = output.split("\0")
+    conflicts = {}
+
+    for entry in entries:
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        mode, hexsha, stage = info.split(" ")
+        conflicts.setdefault(path, {})[int(stage)] = (
+            int(mode, 8),
+            bytes.fromhex(hexsha),
+        )
+
+    return bytes.fromhex(tree), conflicts
+
+
+def read_text(repo: Repo, entry: Optional[tuple]) -> Optional[str]:
+    if entry is None:
+        return None
+    try:
+        return read_object(repo, entry[1]).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def get_tree_entry(repo: Repo, tree: bytes, path: str) -> Optional[tuple]:
+    entry = (TREE_MODE, tree)
+    for name in path.split("/"):
+        if entry[0] != TREE_MODE:
+            return None
+        entry = read_tree_entries(repo, entry[1]).get(name)
+        if entry is None:
+            return None
+    return entry
+
+
+def serialize_conflicts(repo: Repo, tree: bytes, conflicts: dict) -> list:
+    data = []
+
+    for path, stages in sorted(conflicts.items()):
+        conflict = {"path": path}
+        for stage, name in STAGES.items():
+            conflict[name] = read_text(repo, stages.get(stage))
+        conflict["merged"] = read_text(repo, get_tree_entry(repo, tree, path))
+
+        # Text files changed on both sides can be resolved hunk by hunk
+        if conflict["ours"] is not None and conflict["theirs"] is not None:
+            conflict["hunks"] = get_hunks(
+                conflict["base"] or "", conflict["ours"], conflict["theirs"]
+            )
+        else:
+            conflict["hunks"] = None
+        data.append(conflict)
+
+    return data
+
+
+def resolve_conflict(repo: Repo, path: str, stages: dict, choice) -> Optional[tuple]:
+    # choice is "ours" or "theirs", {"content": text} or {"hunks": [...]} with
+    # one choice per hunk, see merge3.resolve_hunks
+    stage_of = {name: stage for stage, name in STAGES.items()}
+    if choice in ("ours", "theirs"):
+        return stages.get(stage_of[choice])
+
+    mode = (stages.get(2) or stages.get(3) or (FILE_MODE,))[0]
+
+    if isinstance(choice, dict) and isinstance(choice.get("content"), str):
+        return mode, write_blob(repo, choice["content"].encode("utf-8"))
+
+    if isinstance(choice, dict) and isinstance(choice.get("hunks"), list):
+        base, ours, theirs = (read_text(repo, stages.get(stage)) for stage in STAGES)
+        if ours is None or theirs is None:
+            raise MergeError(f"{path} can not be resolved by hunks")
+        try:
+            text = resolve_hunks(base or "", ours, theirs, choice["hunks"])
+        except ValueError as e:
+            raise MergeError(f"{path}: {e}")
+        return mode, write_blob(repo, text.encode("utf-8"))
+
+    raise MergeError(f"invalid resolution for {path}")
+
+
+def update_branch(
+    repository: Repository, repo: Repo, branch: str, commit: Commit, message: str
+) -> None:
+    if not repo.head.is_detached and repo.head.ref.name == branch:
+        # The checked out branch brings the changed files along
+        move_head(repository, repo, commit, message)
+        return
+
+    head = Head(repo, f"refs/heads/{branch}")
+    before = head.commit.hexsha
+    head.set_commit(commit, logmsg=message)
+
+    # move_head sends this for the checked out branch
+    repository_updated.send(
+        sender=Repository,
+        repository=repository,
+        before=before,
+        after=commit.hexsha,
+    )
+
+
+def merge_commit(
+    repository: Repository,
+    repo: Repo,
+    branch: str,
+    theirs: Commit,
+    message: str,
+    choices: Optional[dict] = None,
+) -> Commit:
+    # Merges theirs into branch like `git merge`. choices resolves conflicts with
+    # path -> choice, see resolve_conflict. All of them go into the one merge
+    # commit, a side that deleted the path deletes it.
+    try:
+        ours = repo.heads[branch].commit
+    except IndexError:
+        raise MergeError(f"branch {branch} does not exist")
+    choices = choices or {}
+
+    if repo.is_ancestor(theirs, ours):
+        return ours
+    if repo.is_ancestor(ours, theirs):
+        update_branch(repository, repo, branch, theirs, f"merge: {message}")
+        return theirs
+
+    tree, conflicts = merge_trees(repo, ours.hexsha, theirs.hexsha)
+
+    unknown = sorted(set(choices) - set(conflicts))
+    if unknown:
+        raise MergeError(f"no conflict in {', '.join(unknown)}")
+
+    unresolved = {path: conflicts[path] for path in conflicts if path not in choices}
+    if unresolved:
+        raise MergeConflict(serialize_conflicts(repo, tree, unresolved))
+
+    resolutions = {
+        path: resolve_conflict(repo, path, stages, choices[path])
+        for path, stages in conflicts.items()
+    }
+    if resolutions:
+        tree = edit_tree(repo, tree, resolutions)
+
+    commit = write_commit(repo, tree, message, [ours.hexsha, theirs.hexsha])
+    update_branch(repository, repo, branch, commit, f"merge: {message}")
+    return commit
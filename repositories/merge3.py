@@ -0,0 +1,125 @@
+from difflib import SequenceMatcher
+
+
+# Three-way merge of lists of lines in the style of diff3: regions where ours and
+# theirs both match the base are synced, in between a side that is unchanged from
+# the base takes the other side's lines and two different changes conflict.
+def find_sync_regions(base: list, ours: list, theirs: list) -> list:
+    ours_matches = SequenceMatcher(None, base, ours, autojunk=False)
+    theirs_matches = SequenceMatcher(None, base, theirs, autojunk=False)
+    ours_blocks = ours_matches.get_matching_blocks()
+    theirs_blocks = theirs_matches.get_matching_blocks()
+
+    regions = []
+    i = j = 0
+    while i < len(ours_blocks) and j < len(theirs_blocks):
+        ours_base, ours_start, ours_length = ours_blocks[i]
+        theirs_base, theirs_start, theirs_length = theirs_blocks[j]
+
+        start = max(ours_base, theirs_base)
+        end = min(ours_base + ours_length, theirs_base + theirs_length)
+        if start < end:
+            ours_sync = ours_start + start - ours_base
+            theirs_sync = theirs_start + start - theirs_base
+            regions.append(
+                (
+                    start,
+                    end,
+                    ours_sync,
+                    ours_sync + end - start,
+                    theirs_sync,
+                    theirs_sync + end - start,
+                )
+            )
+
+        if ours_base + ours_length < theirs_base + theirs_length:
+            i += 1
+        else:
+            j += 1
+
+    regions.append(
+        (len(base), len(base), len(ours), len(ours), len(theirs), len(theirs))
+    )
+    return regions
+
+
+def merge_lines(base: list, ours: list, theirs: list) -> list:
+    # Returns chunks: a list of merged lines, or a dict with the base, ours and
+    # theirs lines of a conflict
+    chunks = []
+    base_at = ours_at = theirs_at = 0
+
+    for (
+        base_start,
+        base_end,
+        ours_start,
+        ours_end,
+        theirs_start,
+        theirs_end,
+    ) in find_sync_regions(base, ours, theirs):
+        base_lines = base[base_at:base_start]
+        ours_lines = ours[ours_at:ours_start]
+        theirs_lines = theirs[theirs_at:theirs_start]
+
+        if ours_lines == theirs_lines:
+            chunks.append(ours_lines)
+        elif base_lines == ours_lines:
+            chunks.append(theirs_lines)
+        elif base_lines == theirs_lines:
+            chunks.append(ours_lines)
+        else:
+            chunks.append(
+                {"base": base_lines, "ours": ours_lines, "theirs": theirs_lines}
+            )
+
+        chunks.append(base[base_start:base_end])
+        base_at, ours_at, theirs_at = base_end, ours_end, theirs_end
+
+    return [chunk for chunk in chunks if chunk]
+
+
+def get_hunks(base: str, ours: str, theirs: str) -> list:
+    chunks = merge_lines(
+        base.splitlines(keepends=True),
+        ours.splitlines(keepends=True),
+        theirs.splitlines(keepends=True),
+    )
+    return [
+        {name: "".join(lines) for name, lines in chunk.items()}
+        for chunk in chunks
+        if isinstance(chunk, dict)
+    ]
+
+
+def resolve_hunks(base: str, ours: str, theirs: str, choices: list) -> str:
+    # choices has one entry per conflicting hunk: "ours", "theirs", "both" (ours
+    # first) or {"content": text}
+    chunks = merge_lines(
+        base.splitlines(keepends=True),
+        ours.splitlines(keepends=True),
+        theirs.splitlines(keepends=True),
+    )
+    hunks = [chunk for chunk in chunks if isinstance(chunk, dict)]
+    if len(choices) != len(hunks):
+        raise ValueError(f"expected {len(hunks)} hunk choices, got {len(choices)}")
+
+    choices = iter(choices)
+    text = []
+    for chunk in chunks:
+        if not isinstance(chunk, dict):
+            text.extend(chunk)
+            continue
+
+        choice = next(choices)
+        if choice == "ours":
+            text.extend(chunk["ours"])
+        elif choice == "theirs":
+            text.extend(chunk["theirs"])
+        elif choice == "both":
+            text.extend(chunk["ours"] + chunk["theirs"])
+        elif isinstance(choice, dict) and isinstance(choice.get("content"), str):
+            text.append(choice["content"])
+        else:
+            raise ValueError(f"invalid hunk choice {choice!r}")
+
+    return "".join(text)
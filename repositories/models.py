@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -23,11 +24,80 @@ class Repository(models.Model):
     )
     path = models.CharField(max_length=100, unique=True)
     created = models.DateTimeField(auto_now_add=True)
+    # Last time HEAD moved, see repositories.receivers
+    updated = models.DateTimeField(default=timezone.now)
     tags = models.ManyToManyField(Tag, blank=True)
     star_count = models.IntegerField(default=0)
     fork_count = models.IntegerField(default=0)
     private = models.BooleanField(default=False)
     fork = models.BooleanField(default=False)
 
+    class Meta:
+        # One index per listing order, see repositories.pagination
+        indexes = [
+            models.Index(fields=["-star_count", "-id"], name="repository_stars_idx"),
+            models.Index(fields=["-created", "-id"], name="repository_newest_idx"),
+            models.Index(fields=["-updated", "-id"], name="repository_updated_idx"),
+        ]
+
     def __str__(self):
         return self.name
+
+
+class RestorePoint(models.Model):
+    id = models.BigAutoField(primary_key=True, unique=True)
+    repository = models.ForeignKey(
+        Repository, on_delete=models.CASCADE, related_name="restore_points"
+    )
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    mode = models.CharField(max_length=10)
+    target = models.CharField(max_length=40)
+    before = models.CharField(max_length=40)
+    after = models.CharField(max_length=40)
+    undone = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.repository.name} {self.before[:7]}..{self.after[:7]}"
+
+
+class CommitStats(models.Model):
+    id = models.BigAutoField(primary_key=True, unique=True)
+    repository = models.ForeignKey(
+        Repository, on_delete=models.CASCADE, related_name="commit_stats"
+    )
+    commit = models.CharField(max_length=40)
+    parent = models.CharField(max_length=40, null=True)
+    committed = models.DateTimeField()
+    words = models.IntegerField(default=0)
+    characters = models.IntegerField(default=0)
+    chapters = models.IntegerField(default=0)
+    # Differences from the first parent
+    words_delta = models.IntegerField(default=0)
+    characters_delta = models.IntegerField(default=0)
+    chapters_delta = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["repository", "commit"], name="commit_stats_unique"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["repository", "committed"], name="commit_stats_series_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.repository.name} {self.commit[:7]}"
+
+
+class TemplatePoolStats(models.Model):
+    id = models.BigAutoField(primary_key=True, unique=True)
+    bare = models.BooleanField(unique=True)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "bare" if self.bare else "worktree"
@@ -0,0 +1,356 @@
+import os
+import time
+from io import BytesIO
+from typing import Iterator, Optional
+
+from git.index import IndexFile
+from git.index.typ import BaseIndexEntry, IndexEntry
+from git.objects import Commit, Tree
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from git.refs import Head
+from git.repo import Repo
+from git.util import Actor
+from gitdb import IStream, LooseObjectDB
+
+from repositories.models import Repository
+from repositories.signals import repository_updated
+
+FILE_MODE = 0o100644
+TREE_MODE = 0o040000
+
+
+# Objects are written as loose objects from Python, GitPython's default store
+# spawns a `git hash-object` process for every object.
+def get_object_writer(repo: Repo) -> LooseObjectDB:
+    return LooseObjectDB(os.path.join(repo.common_dir, "objects"))
+
+
+def write_object(repo: Repo, object_type: str, data: bytes) -> bytes:
+    istream = IStream(object_type, len(data), BytesIO(data))
+    return get_object_writer(repo).store(istream).binsha
+
+
+def write_blob(repo: Repo, data: bytes) -> bytes:
+    return write_object(repo, "blob", data)
+
+
+def read_object(repo: Repo, binsha: bytes) -> bytes:
+    return repo.odb.stream(binsha).read()
+
+
+def read_tree_entries(repo: Repo, binsha: Optional[bytes]) -> dict:
+    if binsha is None:
+        return {}
+    return {
+        name: (mode, entry_binsha)
+        for entry_binsha, mode, name in tree_entries_from_data(
+            read_object(repo, binsha)
+        )
+    }
+
+
+def write_tree(repo: Repo, entries: dict) -> bytes:
+    def sort_key(item: tuple) -> bytes:
+        name, (mode, _) = item
+        name = name.encode("utf-8")
+        return name + b"/" if mode == TREE_MODE else name
+
+    stream = BytesIO()
+    tree_to_stream(
+        [
+            (binsha, mode, name)
+            for name, (mode, binsha) in sorted(entries.items(), key=sort_key)
+        ],
+        stream.write,
+    )
+    return write_object(repo, "tree", stream.getvalue())
+
+
+def flatten_tree(repo: Repo, binsha: Optional[bytes], prefix: str = "") -> dict:
+    result = {}
+    for name, (mode, entry_binsha) in read_tree_entries(repo, binsha).items():
+        path = prefix + name
+        if mode == TREE_MODE:
+            result.update(flatten_tree(repo, entry_binsha, path + "/"))
+        else:
+            result[path] = (mode, entry_binsha)
+    return result
+
+
+def edit_tree(repo: Repo, binsha: Optional[bytes], changes: dict) -> bytes:
+    # changes maps a path to (mode, binsha), or to None to delete it. Only the trees
+    # on the way to a changed path are read and written again.
+    return write_tree(repo, edit_tree_entries(repo, binsha, changes))
+
+
+def edit_tree_entries(repo: Repo, binsha: Optional[bytes], changes: dict) -> dict:
+    entries = read_tree_entries(repo, binsha)
+    nested = {}
+
+    for path, entry in changes.items():
+        name, _, rest = path.partition("/")
+        if rest:
+            nested.setdefault(name, {})[rest] = entry
+        elif entry is None:
+            entries.pop(name, None)
+        else:
+            entries[name] = entry
+
+    for name, sub_changes in nested.items():
+        # A file written over a directory replaces it, whatever happens below
+        if changes.get(name) is not None:
+            continue
+        mode, sub_binsha = entries.get(name, (TREE_MODE, None))
+        sub_entries = edit_tree_entries(
+            repo, sub_binsha if mode == TREE_MODE else None, sub_changes
+        )
+
+        if sub_entries:
+            entries[name] = (TREE_MODE, write_tree(repo, sub_entries))
+        else:
+            entries.pop(name, None)
+
+    return entries
+
+
+class PathConflict(ValueError):
+    pass
+
+
+def check_changes(repo: Repo, binsha: Optional[bytes], changes: dict) -> None:
+    # A path can not be a file and a directory at once. edit_tree would quietly
+    # replace one with the other, which the working tree can not follow.
+    trees: dict = {}
+    entries: dict = {"": (TREE_MODE, binsha)}
+
+    def lookup(path: str) -> Optional[tuple]:
+        if path not in entries:
+            parent, _, name = path.rpartition("/")
+            parent_entry = lookup(parent)
+            if parent_entry is None or parent_entry[0] != TREE_MODE:
+                entries[path] = None
+            else:
+                if parent_entry[1] not in trees:
+                    trees[parent_entry[1]] = read_tree_entries(repo, parent_entry[1])
+                entries[path] = trees[parent_entry[1]].get(name)
+        return entries[path]
+
+    def get_parents(path: str) -> Iterator[str]:
+        while "/" in path:
+            path = path.rpartition("/")[0]
+            yield path
+
+    written = [path for path, entry in changes.items() if entry is not None]
+    directories = {parent for path in written for parent in get_parents(path)}
+
+    for path in written:
+        for parent in get_parents(path):
+            entry = changes[parent] if parent in changes else lookup(parent)
+            if entry is not None and entry[0] != TREE_MODE:
+                raise PathConflict(f"{path}: {parent} is a file")
+
+        entry = lookup(path)
+        if path in directories or (
+            entry is not None
+            and entry[0] == TREE_MODE
+            and any(
+                changes.get(f"{path}/{child}", entry) is not None
+                for child in flatten_tree(repo, entry[1])
+            )
+        ):
+            raise PathConflict(f"{path}: is a directory")
+
+
+def diff_trees(
+    repo: Repo, a: Optional[bytes], b: Optional[bytes], prefix: str = ""
+) -> dict:
+    # The changes that turn tree a into tree b, in the form edit_tree takes. Subtrees
+    # with the same id are equal, so only the trees that differ are read.
+    changes = {}
+    if a == b:
+        return changes
+
+    a_entries = read_tree_entries(repo, a)
+    b_entries = read_tree_entries(repo, b)
+
+    for name in a_entries.keys() | b_entries.keys():
+        a_entry = a_entries.get(name)
+        b_entry = b_entries.get(name)
+        if a_entry == b_entry:
+            continue
+
+        path = prefix + name
+        a_tree = a_entry[1] if a_entry and a_entry[0] == TREE_MODE else None
+        b_tree = b_entry[1] if b_entry and b_entry[0] == TREE_MODE else None
+
+        if a_tree is not None or b_tree is not None:
+            changes.update(diff_trees(repo, a_tree, b_tree, path + "/"))
+        if b_entry is not None and b_tree is None:
+            changes[path] = b_entry
+        elif a_entry is not None and a_tree is None:
+            changes[path] = None
+
+    return changes
+
+
+def write_commit(
+    repo: Repo,
+    tree: bytes,
+    message: str,
+    parents: list,
+    author: Optional[Actor] = None,
+) -> Commit:
+    config_reader = repo.config_reader()
+    committer = Actor.committer(config_reader)
+    author = author or Actor.author(config_reader)
+    unix_time = int(time.time())
+    offset = time.altzone if time.localtime().tm_isdst > 0 else time.timezone
+
+    commit = Commit(
+        repo,
+        Commit.NULL_BIN_SHA,
+        Tree(repo, tree),
+        author,
+        unix_time,
+        offset,
+        committer,
+        unix_time,
+        offset,
+        message,
+        [repo.commit(parent) for parent in parents],
+        Commit.default_encoding,
+    )
+
+    stream = BytesIO()
+    commit._serialize(stream)
+    commit.binsha = write_object(repo, "commit", stream.getvalue())
+    return commit
+
+
+def sync_worktree(repo: Repo, changes: dict) -> None:
+    # Keep a checked out working tree and its index in step with the new commit,
+    # touching only the changed paths. Moved files are renamed, not rewritten.
+    if repo.bare:
+        return
+
+    index = IndexFile(repo)
+    wanted = {entry[1] for entry in changes.values() if entry is not None}
+    moved = {}
+    moved_count = 0
+
+    for path, entry in changes.items():
+        index_entry = index.entries.pop((path, 0), None)
+        abspath = os.path.join(repo.working_tree_dir, path)
+
+        if entry is not None or not os.path.isfile(abspath):
+            continue
+
+        if index_entry is not None and index_entry.binsha in wanted:
+            moved_path = os.path.join(repo.git_dir, f"move-{moved_count}")
+            moved_count += 1
+            os.rename(abspath, moved_path)
+            moved.setdefault(index_entry.binsha, []).append(moved_path)
+        else:
+            os.remove(abspath)
+        remove_empty_directories(repo, os.path.dirname(abspath))
+
+    for path, entry in changes.items():
+        if entry is None:
+            continue
+
+        mode, binsha = entry
+        abspath = os.path.join(repo.working_tree_dir, path)
+        os.makedirs(os.path.dirname(abspath), exist_ok=True)
+
+        if moved.get(binsha):
+            os.replace(moved[binsha].pop(), abspath)
+        else:
+            with open(abspath, "wb") as f:
+                f.write(read_object(repo, binsha))
+
+        index.entries[(path, 0)] = IndexEntry.from_base(
+            BaseIndexEntry((mode, binsha, 0, path))
+        )
+
+    for moved_paths in moved.values():
+        for moved_path in moved_paths:
+            os.remove(moved_path)
+
+    index.write()
+
+
+def remove_empty_directories(repo: Repo, directory: str) -> None:
+    root = os.path.abspath(repo.working_tree_dir)
+    directory = os.path.abspath(directory)
+
+    while directory != root and directory.startswith(root) and os.path.isdir(directory):
+        if os.listdir(directory):
+            return
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+
+def update_head(repo: Repo, commit: Commit, message: str) -> None:
+    if repo.head.is_valid():
+        repo.head.set_commit(commit, logmsg=message)
+    else:
+        # The first commit creates the branch HEAD points to
+        Head.create(repo, repo.head.ref.path, commit, logmsg=message)
+
+
+def commit_changes(
+    repository: Repository,
+    repo: Repo,
+    changes: dict,
+    message: str,
+    author: Optional[Actor] = None,
+) -> Commit:
+    # Raises PathConflict before anything is written
+    head = repo.head.commit if repo.head.is_valid() else None
+    base_tree = head.tree.binsha if head is not None else None
+
+    check_changes(repo, base_tree, changes)
+    tree = edit_tree(repo, base_tree, changes)
+    return commit_tree(repository, repo, tree, changes, message, author)
+
+
+def commit_tree(
+    repository: Repository,
+    repo: Repo,
+    tree: bytes,
+    changes: dict,
+    message: str,
+    author: Optional[Actor] = None,
+) -> Commit:
+    # changes must be what turns the HEAD tree into tree, the working tree is
+    # brought up to date with them
+    head = repo.head.commit if repo.head.is_valid() else None
+    commit = write_commit(
+        repo, tree, message, [head.hexsha] if head is not None else [], author
+    )
+    update_head(repo, commit, f"commit: {commit.summary}")
+    sync_worktree(repo, changes)
+
+    repository_updated.send(
+        sender=Repository,
+        repository=repository,
+        before=head.hexsha if head is not None else None,
+        after=commit.hexsha,
+    )
+    return commit
+
+
+def move_head(repository: Repository, repo: Repo, commit: Commit, message: str) -> None:
+    # Points HEAD at an existing commit and updates only the files that differ,
+    # unlike `git reset --hard` which rewrites the whole checkout
+    head = repo.head.commit
+
+    update_head(repo, commit, message)
+    sync_worktree(repo, diff_trees(repo, head.tree.binsha, commit.tree.binsha))
+
+    repository_updated.send(
+        sender=Repository,
+        repository=repository,
+        before=head.hexsha,
+        after=commit.hexsha,
+    )
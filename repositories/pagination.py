@@ -0,0 +1,142 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from project.settings import REPOSITORY_MAX_PAGE_SIZE
+
+
+# Pages are cut with a `(field, id) < (value, id)` condition on a composite
+# index instead of an offset, so ties never repeat or skip rows and a deep page
+# costs the same as the first.
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "order"
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = REPOSITORY_MAX_PAGE_SIZE
+
+    # Every ordering is descending with id as the tie breaker
+    orderings = {
+        "stars": "star_count",
+        "newest": "created",
+        "updated": "updated",
+    }
+    default_ordering = "stars"
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view=None
+    ) -> Optional[list]:
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field = self.orderings.get(
+            request.query_params.get(self.ordering_query_param, self.default_ordering)
+        )
+
+        if self.field is None:
+            raise NotFound("Invalid ordering")
+
+        position, reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+
+        if position is not None:
+            value, row_id = position
+            try:
+                value = queryset.model._meta.get_field(self.field).to_python(value)
+            except ValidationError:
+                raise NotFound("Invalid cursor")
+
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f"{self.field}__gt": value})
+                    | Q(**{self.field: value, "id__gt": row_id})
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{self.field}__lt": value})
+                    | Q(**{self.field: value, "id__lt": row_id})
+                )
+
+        if reverse:
+            queryset = queryset.order_by(self.field, "id")
+        else:
+            queryset = queryset.order_by(f"-{self.field}", "-id")
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request: Request) -> int:
+        page_size = request.query_params.get(self.page_size_query_param)
+
+        if page_size is None:
+            return self.page_size
+        if not page_size.isdigit() or int(page_size) < 1:
+            raise NotFound("Invalid page size")
+        return min(int(page_size), self.max_page_size)
+
+    def decode_cursor(self, request: Request) -> tuple:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            return (data["v"], int(data["id"])), bool(data.get("r"))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound("Invalid cursor")
+
+    def encode_cursor(self, row, reverse: bool) -> str:
+        # Rows are model instances or values() dicts
+        if isinstance(row, dict):
+            value, row_id = row[self.field], row["id"]
+        else:
+            value, row_id = getattr(row, self.field), row.id
+
+        data = {"v": value.isoformat() if hasattr(value, "isoformat") else value}
+        data.update({"id": row_id, "r": reverse})
+
+        encoded = urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.page[0], True)
+
+    def get_paginated_response(self, data: list) -> Response:
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
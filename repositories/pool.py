@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from git.repo import Repo
+
+from project.settings import REPO_POOL_SIZE
+
+
+# Keeps Repo objects, and the persistent `git cat-file --batch` processes they own,
+# alive between requests. Handles are never shared between threads, max_size is
+# the limit per thread.
+class RepoPool:
+    def __init__(self, max_size: int = REPO_POOL_SIZE) -> None:
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> Repo:
+        path = os.path.abspath(path)
+        key = (path, threading.get_ident())
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            repo, identity = entry
+            if self.is_healthy(repo, identity):
+                self.put(key, repo, identity)
+                return repo
+            repo.close()
+
+        repo = Repo(path)
+        self.put(key, repo, self.get_identity(repo))
+        return repo
+
+    def put(self, key: tuple, repo: Repo, identity: Optional[tuple]) -> None:
+        # Each thread has max_size handles and only ever evicts its own, a handle
+        # of another thread may be in use by a request. Threads that exited leave
+        # theirs behind.
+        thread = key[1]
+        alive = {alive_thread.ident for alive_thread in threading.enumerate()}
+        evicted = []
+        with self.lock:
+            self.entries[key] = (repo, identity)
+            owned = [entry_key for entry_key in self.entries if entry_key[1] == thread]
+            stale = owned[: max(len(owned) - self.max_size, 0)]
+            stale += [
+                entry_key for entry_key in self.entries if entry_key[1] not in alive
+            ]
+            for entry_key in stale:
+                evicted.append(self.entries.pop(entry_key)[0])
+
+        for repo in evicted:
+            repo.close()
+
+    def evict(self, path: str) -> None:
+        path = os.path.abspath(path)
+        self.evict_where(lambda entry_path: entry_path == path)
+
+    def evict_prefix(self, prefix: str) -> None:
+        prefix = os.path.join(os.path.abspath(prefix), "")
+        self.evict_where(lambda entry_path: entry_path.startswith(prefix))
+
+    def evict_where(self, predicate) -> None:
+        with self.lock:
+            keys = [key for key in self.entries if predicate(key[0])]
+            evicted = [self.entries.pop(key)[0] for key in keys]
+
+        for repo in evicted:
+            repo.close()
+
+    def clear(self) -> None:
+        self.evict_where(lambda entry_path: True)
+
+    def get_identity(self, repo: Repo) -> Optional[tuple]:
+        # Inode numbers are reused, HEAD's ctime tells a recreated repository apart
+        try:
+            stat = os.stat(os.path.join(repo.git_dir, "HEAD"))
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_ctime_ns
+
+    def is_healthy(self, repo: Repo, identity: Optional[tuple]) -> bool:
+        # A repository deleted and created again at the same path is a new repository
+        if identity is None or self.get_identity(repo) != identity:
+            return False
+
+        for cmd in (repo.git.cat_file_all, repo.git.cat_file_header):
+            if cmd is not None and cmd.proc is not None and cmd.proc.poll() is not None:
+                repo.git.clear_cache()
+                break
+
+        return True
+
+
+repo_pool = RepoPool()
+
+
+def get_repo(path: str) -> Repo:
+    return repo_pool.get(path)
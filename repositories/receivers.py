@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from project.background import run_in_background
+from repositories.models import Repository
+from repositories.search import delete_repository_documents, update_search_index
+from repositories.signals import repository_updated
+from repositories.stats import update_commit_stats
+
+
+@receiver(repository_updated)
+def touch_repository(sender, repository, **kwargs) -> None:
+    Repository.objects.filter(id=repository.id).update(updated=timezone.now())
+
+
+@receiver(repository_updated)
+def schedule_search_index_update(sender, repository, **kwargs) -> None:
+    run_in_background(update_search_index, repository.id)
+
+
+@receiver(repository_updated)
+def schedule_commit_stats_update(sender, repository, after, **kwargs) -> None:
+    run_in_background(update_commit_stats, repository.id, after)
+
+
+@receiver(post_delete, sender=Repository)
+def delete_search_documents(sender, instance, **kwargs) -> None:
+    delete_repository_documents(instance.id)
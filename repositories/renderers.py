@@ -0,0 +1,22 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+
+        if not isinstance(data, list):
+            data = [data]
+
+        return b"".join(
+            json.dumps(item, cls=DjangoJSONEncoder).encode("utf-8") + b"\n"
+            for item in data
+        )
@@ -0,0 +1,208 @@
+import html
+from typing import Optional
+
+from django.db import OperationalError, connection, transaction
+from gitdb.exc import BadName, BadObject
+
+from project.settings import SEARCH_MAX_FILE_SIZE
+from repositories.locks import repository_lock
+from repositories.models import Repository
+from repositories.objects import diff_trees, flatten_tree, read_object
+from repositories.pool import get_repo
+
+# search_file maps (repository, path) to the rowid of the document in the FTS5
+# table, search_head remembers the commit each repository was indexed at.
+TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS search_file (
+        id INTEGER PRIMARY KEY,
+        repository_id INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        UNIQUE (repository_id, path)
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_document
+    USING fts5(content, tokenize = 'unicode61', prefix = '2 3')
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS search_head (
+        repository_id INTEGER PRIMARY KEY,
+        head TEXT NOT NULL
+    )
+    """,
+)
+
+
+# Matches are marked with control characters in the snippet, file content is
+# escaped before they become HTML tags
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# bm25 ranks better matches lower
+SEARCH_QUERY = f"""
+    SELECT file.repository_id, repository.name, file.path,
+        snippet(search_document, 0, '{MATCH_START}', '{MATCH_END}', '...', 16),
+        bm25(search_document) AS rank
+    FROM search_document
+    JOIN search_file AS file ON file.id = search_document.rowid
+    JOIN repositories_repository AS repository ON repository.id = file.repository_id
+    WHERE search_document MATCH %s AND NOT repository.private
+    ORDER BY rank
+    LIMIT %s OFFSET %s
+"""
+
+
+class InvalidQuery(Exception):
+    pass
+
+
+def is_search_available() -> bool:
+    return connection.vendor == "sqlite"
+
+
+def create_tables(cursor) -> None:
+    for table in TABLES:
+        cursor.execute(table)
+
+
+def get_indexed_head(cursor, repository_id: int) -> Optional[str]:
+    cursor.execute(
+        "SELECT head FROM search_head WHERE repository_id = %s", [repository_id]
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def delete_document(cursor, repository_id: int, path: str) -> None:
+    cursor.execute(
+        "SELECT id FROM search_file WHERE repository_id = %s AND path = %s",
+        [repository_id, path],
+    )
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute("DELETE FROM search_document WHERE rowid = %s", [row[0]])
+        cursor.execute("DELETE FROM search_file WHERE id = %s", [row[0]])
+
+
+def delete_documents(cursor, repository_id: int) -> None:
+    cursor.execute(
+        "DELETE FROM search_document WHERE rowid IN "
+        "(SELECT id FROM search_file WHERE repository_id = %s)",
+        [repository_id],
+    )
+    cursor.execute("DELETE FROM search_file WHERE repository_id = %s", [repository_id])
+
+
+def delete_repository_documents(repository_id: int) -> None:
+    if not is_search_available():
+        return
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        create_tables(cursor)
+        delete_documents(cursor, repository_id)
+        cursor.execute(
+            "DELETE FROM search_head WHERE repository_id = %s", [repository_id]
+        )
+
+
+def read_text(repo, binsha: bytes) -> Optional[str]:
+    if repo.odb.info(binsha).size > SEARCH_MAX_FILE_SIZE:
+        return None
+    try:
+        return read_object(repo, binsha).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def get_indexed_tree(repo, indexed_head: Optional[str]) -> Optional[bytes]:
+    if indexed_head is None:
+        return None
+    try:
+        return repo.commit(indexed_head).tree.binsha
+    except (BadName, BadObject, ValueError):
+        # The indexed commit is gone, e.g. the repository was replaced
+        return None
+
+
+def update_search_index(repository_id: int) -> None:
+    if not is_search_available():
+        return
+
+    repository = Repository.objects.filter(pk=repository_id).first()
+    if repository is None:
+        return
+
+    # Runs from background workers of several processes, one at a time per
+    # repository so two updates never apply the same diff twice
+    with repository_lock(repository.path, name="search"):
+        repo = get_repo(repository.path)
+        head = repo.head.commit
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            create_tables(cursor)
+            indexed_head = get_indexed_head(cursor, repository.id)
+
+            if indexed_head == head.hexsha:
+                return
+
+            indexed_tree = get_indexed_tree(repo, indexed_head)
+
+            # Only the paths that changed since the indexed commit are touched
+            if indexed_tree is None:
+                delete_documents(cursor, repository.id)
+                changes = flatten_tree(repo, head.tree.binsha)
+            else:
+                changes = diff_trees(repo, indexed_tree, head.tree.binsha)
+
+            for path, entry in changes.items():
+                delete_document(cursor, repository.id, path)
+
+                # Only regular files, not symlinks or submodules
+                if entry is None or entry[0] & 0o170000 != 0o100000:
+                    continue
+
+                text = read_text(repo, entry[1])
+                if text is None:
+                    continue
+
+                cursor.execute(
+                    "INSERT INTO search_file (repository_id, path) VALUES (%s, %s)",
+                    [repository.id, path],
+                )
+                cursor.execute(
+                    "INSERT INTO search_document (rowid, content) VALUES (%s, %s)",
+                    [cursor.lastrowid, text],
+                )
+
+            cursor.execute(
+                "INSERT OR REPLACE INTO search_head (repository_id, head) "
+                "VALUES (%s, %s)",
+                [repository.id, head.hexsha],
+            )
+
+
+def format_snippet(snippet: str) -> str:
+    return html.escape(snippet).replace(MATCH_START, "<b>").replace(MATCH_END, "</b>")
+
+
+def search(query: str, limit: int, offset: int) -> list:
+    # query is FTS5 syntax: words, "phrases", prefix* and AND/OR/NOT
+    with connection.cursor() as cursor:
+        create_tables(cursor)
+        try:
+            with transaction.atomic():
+                cursor.execute(SEARCH_QUERY, [query, limit, offset])
+        except OperationalError as e:
+            raise InvalidQuery(str(e))
+
+        return [
+            {
+                "repository": repository_id,
+                "repository_name": name,
+                "path": path,
+                "snippet": format_snippet(snippet),
+                "rank": rank,
+            }
+            for repository_id, name, path, snippet, rank in cursor.fetchall()
+        ]
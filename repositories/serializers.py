@@ -1,5 +1,6 @@
 from rest_framework.serializers import ModelSerializer
 
+from project.serializers import ValuesSerializer
 from repositories.models import Repository
 
 
@@ -8,3 +9,20 @@ class RepositorySerializer(ModelSerializer):
         fields = ("id", "name", "tags")
         model = Repository
         depth = 1
+
+
+class RepositoryListSerializer(ValuesSerializer):
+    model = Repository
+    fields = (
+        "id",
+        "name",
+        "tags",
+        "star_count",
+        "fork_count",
+        "private",
+        "fork",
+        "created",
+        "updated",
+    )
+    default_fields = ("id", "name", "tags")
+    related = {"tags": ("id", "name")}
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent with repository, before and after (commit SHAs) whenever a view moves HEAD.
+repository_updated = Signal()
@@ -0,0 +1,121 @@
+from typing import Optional
+
+from git.objects import Commit
+from git.repo import Repo
+from gitdb.exc import BadName, BadObject
+
+from repositories.cache import SnapshotCache
+from repositories.models import CommitStats, Repository
+from repositories.objects import diff_trees, flatten_tree, read_object
+from repositories.pool import get_repo
+
+blob_stats_cache = SnapshotCache("blobstats")
+
+EMPTY_STATS = (0, 0, 0)
+
+
+def get_blob_stats(repo: Repo, mode: int, binsha: bytes) -> tuple:
+    # (words, characters, chapters) of one file, every text file is a chapter
+    if mode & 0o170000 != 0o100000:
+        return EMPTY_STATS
+
+    def count() -> str:
+        try:
+            text = read_object(repo, binsha).decode("utf-8")
+        except UnicodeDecodeError:
+            return "0 0 0"
+        return f"{len(text.split())} {len(text)} 1"
+
+    value = blob_stats_cache.get_or_set(binsha.hex(), count)
+    return tuple(int(number) for number in value.split())
+
+
+def add_stats(a: tuple, b: tuple, sign: int = 1) -> tuple:
+    return tuple(x + sign * y for x, y in zip(a, b))
+
+
+def count_tree(repo: Repo, tree: bytes) -> tuple:
+    totals = EMPTY_STATS
+    for mode, binsha in flatten_tree(repo, tree).values():
+        totals = add_stats(totals, get_blob_stats(repo, mode, binsha))
+    return totals
+
+
+def count_changes(repo: Repo, a: Optional[bytes], b: bytes) -> tuple:
+    # Only the blobs that differ between the two trees are read: what b adds minus
+    # what it replaces or removes from a
+    delta = EMPTY_STATS
+    for entry in diff_trees(repo, a, b).values():
+        if entry is not None:
+            delta = add_stats(delta, get_blob_stats(repo, *entry))
+    for entry in diff_trees(repo, b, a).values():
+        if entry is not None:
+            delta = add_stats(delta, get_blob_stats(repo, *entry), -1)
+    return delta
+
+
+def get_reachable_commits(repo: Repo, ref: str = "HEAD") -> set:
+    # Stats of commits a reset dropped, or that only other branches have, are kept
+    # for when they come back but are not part of the series
+    return set(repo.git.rev_list(ref).split())
+
+
+def get_parent(commit: Commit) -> Optional[Commit]:
+    return commit.parents[0] if commit.parents else None
+
+
+def update_commit_stats(
+    repository_id: int, commit_hash: Optional[str] = None
+) -> Optional[CommitStats]:
+    repository = Repository.objects.filter(pk=repository_id).first()
+    if repository is None:
+        return None
+
+    repo = get_repo(repository.path)
+    try:
+        commit = repo.commit(commit_hash) if commit_hash else repo.head.commit
+    except (BadName, BadObject, ValueError):
+        return None
+
+    stats = CommitStats.objects.filter(
+        repository=repository, commit=commit.hexsha
+    ).first()
+    if stats is not None:
+        return stats
+
+    parent = get_parent(commit)
+    parent_stats = None
+    if parent is not None:
+        parent_stats = CommitStats.objects.filter(
+            repository=repository, commit=parent.hexsha
+        ).first()
+
+    if parent_stats is not None:
+        base = (parent_stats.words, parent_stats.characters, parent_stats.chapters)
+    elif parent is not None:
+        # Without a stored parent it is counted in full once, later commits build
+        # on the stored result
+        base = count_tree(repo, parent.tree.binsha)
+    else:
+        base = EMPTY_STATS
+
+    delta = count_changes(
+        repo, parent.tree.binsha if parent else None, commit.tree.binsha
+    )
+    totals = add_stats(base, delta)
+
+    stats, _ = CommitStats.objects.get_or_create(
+        repository=repository,
+        commit=commit.hexsha,
+        defaults={
+            "parent": parent.hexsha if parent is not None else None,
+            "committed": commit.committed_datetime,
+            "words": totals[0],
+            "characters": totals[1],
+            "chapters": totals[2],
+            "words_delta": delta[0],
+            "characters_delta": delta[1],
+            "chapters_delta": delta[2],
+        },
+    )
+    return stats
@@ -0,0 +1,102 @@
+import os
+import uuid
+from typing import Optional
+
+from django.db.models import F
+from git.repo import Repo
+
+from project.settings import BARE_REPOSITORIES, TEMPLATE_POOL_ROOT, TEMPLATE_POOL_SIZE
+from repositories.locks import RepositoryBusy, repository_lock
+from repositories.models import TemplatePoolStats
+from repositories.objects import FILE_MODE, sync_worktree, write_blob
+
+
+# Repositories are initialized ahead of time in the background, so creating one
+# in a request is a rename instead of a `git init`.
+def get_pool_dir(bare: bool = BARE_REPOSITORIES) -> str:
+    return os.path.join(TEMPLATE_POOL_ROOT, "bare" if bare else "worktree")
+
+
+def list_templates(bare: bool = BARE_REPOSITORIES) -> list:
+    try:
+        names = os.listdir(get_pool_dir(bare))
+    except FileNotFoundError:
+        return []
+    # Templates being built are hidden until they are complete
+    return sorted(name for name in names if not name.startswith("."))
+
+
+def create_template(bare: bool = BARE_REPOSITORIES) -> str:
+    pool_dir = get_pool_dir(bare)
+    name = uuid.uuid4().hex
+    build_path = os.path.join(pool_dir, f".{name}")
+
+    repo = Repo.init(build_path, bare=bare, mkdir=True)
+    # The README of the first commit is already in place
+    sync_worktree(repo, {"README.txt": (FILE_MODE, write_blob(repo, b""))})
+    repo.close()
+
+    path = os.path.join(pool_dir, name)
+    os.rename(build_path, path)
+    return path
+
+
+def fill_template_pool(
+    size: int = TEMPLATE_POOL_SIZE, bare: bool = BARE_REPOSITORIES
+) -> int:
+    pool_dir = get_pool_dir(bare)
+    os.makedirs(pool_dir, exist_ok=True)
+
+    # One filler at a time, others have nothing to do
+    try:
+        with repository_lock(pool_dir, timeout=0, name="fill"):
+            created = 0
+            while len(list_templates(bare)) < size:
+                create_template(bare)
+                created += 1
+            return created
+    except RepositoryBusy:
+        return 0
+
+
+def claim_template(path: str, bare: bool = BARE_REPOSITORIES) -> Optional[Repo]:
+    if os.path.exists(path):
+        return None
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for name in list_templates(bare):
+        try:
+            # rename is atomic, a template taken by another worker is just gone
+            os.rename(os.path.join(get_pool_dir(bare), name), path)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            # path was created in the meantime
+            break
+
+        record_claim(bare, hit=True)
+        return Repo(path)
+
+    record_claim(bare, hit=False)
+    return None
+
+
+def record_claim(bare: bool, hit: bool) -> None:
+    TemplatePoolStats.objects.get_or_create(bare=bare)
+    field = "hits" if hit else "misses"
+    TemplatePoolStats.objects.filter(bare=bare).update(**{field: F(field) + 1})
+
+
+def get_template_pool_stats(bare: bool = BARE_REPOSITORIES) -> dict:
+    stats = TemplatePoolStats.objects.filter(bare=bare).first()
+    hits = stats.hits if stats else 0
+    misses = stats.misses if stats else 0
+
+    return {
+        "bare": bare,
+        "size": len(list_templates(bare)),
+        "target_size": TEMPLATE_POOL_SIZE,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+    }
@@ -1,16 +1,39 @@
+import json
 import os
 import shutil
+import threading
+from io import StringIO
+from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from git.repo import Repo
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from comments.models import Comment
 from forks.models import Fork
-from project.settings import REPO_ROOT
-from repositories.models import Repository, Tag
+from forks.utils import update_fork_status
+from project.settings import REPO_ROOT, TRASH_ROOT
+from repositories.cache import SnapshotCache
+from repositories.locks import (
+    RepositoryBusy,
+    get_lock_path,
+    repository_lock,
+    try_lock,
+    unlock,
+)
+from repositories.models import CommitStats, Repository, Tag
+from repositories.pool import RepoPool
+from repositories.search import update_search_index
+from repositories.stats import update_commit_stats
+from repositories.trash import empty_trash, get_manifest_path, move_to_trash
+from repositories.utils import tree_cache
 from users.models import User
 
 
@@ -86,6 +109,29 @@ class RepositoryViewSetTestCase(APITestCase):
             )
         )
 
+    def test_create_repository_from_template_pool(self):
+        call_command("fill_template_pool", size=2, stdout=StringIO())
+
+        response = self.client.post(
+            reverse("repositories-list"), data={"name": "test_create_repo"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.data["tree"]), {"README.txt": "blob"})
+
+        repo = Repo(os.path.join(REPO_ROOT, self.user1.username, "test_create_repo"))
+        self.assertEqual(repo.head.commit.author.name, self.user1.username)
+        self.assertEqual(len(list(repo.iter_commits())), 1)
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+        self.user1.is_staff = True
+        self.user1.save()
+        response = self.client.get(reverse("repositories-pool"))
+
+        self.assertEqual(response.data["size"], 1)
+        self.assertEqual(response.data["hits"], 1)
+        self.assertEqual(response.data["hit_rate"], 1)
+
     def test_retrieve_repository(self):
         response = self.client.get(
             reverse("repositories-detail", args=[self.repository2.id]),
@@ -94,17 +140,32 @@ class RepositoryViewSetTestCase(APITestCase):
         self.assertTrue(response.data["tree"])
         self.assertEqual(response.status_code, 200)
 
+    def test_retrieve_repository_tree_cache(self):
+        head = Repo(self.repository.path).head.commit.hexsha
+
+        response = self.client.get(
+            reverse("repositories-detail", args=[self.repository.id]),
+        )
+        self.assertTrue(os.path.exists(tree_cache.get_path(head)))
+
+        tree_cache.clear()
+        self.assertEqual(tree_cache.get(head), response.data["tree"])
+        self.assertEqual(json.loads(response.data["tree"]), {"README.txt": "blob"})
+
     def test_retrieve_fork_repository(self):
         with open(os.path.join(self.repository2.path, "README.txt"), "w") as f:
             f.write("This is a test file.")
         repo = Repo(self.repository2.path)
         repo.index.add(["*"])
         repo.index.commit("Updated README.txt")
+        update_fork_status(self.repository2.id)
 
         response = self.client.get(
             reverse("repositories-detail", args=[self.repository2.id]),
         )
         self.assertTrue(response.data["pullrequest"])
+        self.assertEqual(response.data["ahead"], 2)
+        self.assertEqual(response.data["behind"], 0)
         self.assertEqual(response.status_code, 200)
 
     def test_partial_update(self):
@@ -151,15 +212,126 @@ class RepositoryViewSetTestCase(APITestCase):
         )
         self.assertEqual(response.data["tree"], data["structure"])
 
-    def test_destroy_repository(self):
-        response = self.client.delete(
-            reverse("repositories-detail", args=[self.repository.id]),
+    def test_partial_update_structure_move(self):
+        self.test_partial_update()
+        repo = Repo(self.repository.path)
+        blob = repo.head.commit.tree / "README.txt"
+
+        data = {
+            "structure": '{"chapters": {"README.txt": "blob", "NEW.txt": "blob"}}',
+            "message": "Moved README.txt",
+        }
+        response = self.client.patch(
+            reverse("repositories-structure", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        tree = repo.head.commit.tree
+        self.assertEqual((tree / "chapters/README.txt").hexsha, blob.hexsha)
+        self.assertEqual((tree / "chapters/NEW.txt").size, 0)
+        self.assertEqual([item.name for item in tree], ["chapters"])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.repository.path, "README.txt"))
+        )
+        with open(os.path.join(self.repository.path, "chapters", "README.txt")) as f:
+            self.assertEqual(f.read(), "This is some new content.")
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    def test_partial_update_file_under_file(self):
+        repo = Repo(self.repository.path)
+        head = repo.head.commit.hexsha
+        new_file = SimpleUploadedFile("x", b"content")
+
+        data = {
+            "file": new_file,
+            "message": "Wrote README.txt/x",
+            "path": f"{self.user1.username}/{self.repository.name}/README.txt/x",
+        }
+        response = self.client.patch(
+            reverse("repositories-file", args=[self.repository.id]),
+            data,
+            format="multipart",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(repo.head.commit.hexsha, head)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.repository.path, "README.txt"))
+        )
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    def test_partial_update_structure_file_to_directory(self):
+        data = {
+            "structure": '{"README.txt": {"a.txt": "blob"}}',
+            "message": "README.txt is a directory",
+        }
+        response = self.client.patch(
+            reverse("repositories-structure", args=[self.repository.id]),
+            data,
+            format="json",
         )
 
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.repository.path, "README.txt", "a.txt"))
+        )
+        self.assertFalse(Repo(self.repository.path).is_dirty(untracked_files=True))
+
+    def test_partial_update_structure_directory_to_file(self):
+        self.test_partial_update_structure_file_to_directory()
+
+        data = {
+            "structure": '{"README.txt": "blob"}',
+            "message": "README.txt is a file again",
+        }
+        response = self.client.patch(
+            reverse("repositories-structure", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        repo = Repo(self.repository.path)
+        self.assertEqual((repo.head.commit.tree / "README.txt").type, "blob")
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.repository.path, "README.txt"))
+        )
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    def test_destroy_repository(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse("repositories-detail", args=[self.repository.id]),
+            )
+
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Repository.objects.count(), 1)
+        # The directory moves once the delete is committed, the reaper is left to
+        # the test
+        self.assertTrue(os.path.exists(self.repository.path))
+        callbacks[0]()
         self.assertFalse(os.path.exists(self.repository.path))
 
+        # The files stay in the trash until the reaper runs
+        self.assertEqual(len(os.listdir(TRASH_ROOT)), 2)
+        self.assertEqual(empty_trash(None), 1)
+        self.assertEqual(os.listdir(TRASH_ROOT), [])
+
+    def test_destroy_repository_failed_delete(self):
+        with mock.patch.object(
+            Repository, "delete", side_effect=DatabaseError("locked")
+        ), self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(DatabaseError):
+                self.client.delete(
+                    reverse("repositories-detail", args=[self.repository.id]),
+                )
+
+        # The row is still there, so are its files
+        self.assertEqual(callbacks, [])
+        self.assertTrue(os.path.exists(self.repository.path))
+
     def test_list_repositories(self):
         Repository.objects.bulk_create(
             [
@@ -201,6 +373,163 @@ class RepositoryViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 5)
 
+    def test_list_repositories_queries(self):
+        tags = [Tag.objects.create(name=f"tag{i}") for i in range(3)]
+        for i in range(20):
+            repository = Repository.objects.create(
+                name=f"test_repo{i}", user=self.user1, path=f"temp{i}"
+            )
+            repository.tags.set(tags[: i % 4])
+
+        query_counts = []
+        for page_size in (2, 20):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse("repositories-list"), {"page_size": page_size}
+                )
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(
+            response.data["results"][0]["tags"],
+            [{"id": tag.id, "name": tag.name} for tag in tags],
+        )
+
+        response = self.client.get(
+            reverse("repositories-list"), {"fields": "id,star_count"}
+        )
+
+        self.assertEqual(set(response.data["results"][0]), {"id", "star_count"})
+
+    def test_list_repositories_ties(self):
+        Repository.objects.bulk_create(
+            [
+                Repository(
+                    name=f"test_repo{i}",
+                    user=self.user1,
+                    path=f"temp{i}",
+                    star_count=i % 2,
+                )
+                for i in range(10)
+            ]
+        )
+
+        names = []
+        ids = set()
+        response = self.client.get(reverse("repositories-list"), {"page_size": 3})
+        while True:
+            self.assertLessEqual(len(response.data["results"]), 3)
+            names += [repository["name"] for repository in response.data["results"]]
+            ids |= {repository["id"] for repository in response.data["results"]}
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+
+        # Two repositories come from setUp
+        self.assertEqual(len(names), 12)
+        self.assertEqual(len(ids), 12)
+        self.assertEqual(names[:5], [f"test_repo{i}" for i in (9, 7, 5, 3, 1)])
+
+        response = self.client.get(response.data["previous"])
+
+        self.assertEqual(
+            [repository["name"] for repository in response.data["results"]],
+            ["test_repo6", "test_repo4", "test_repo2"],
+        )
+
+    def test_list_repositories_updated(self):
+        other = Repository.objects.create(
+            name="other_repo", user=self.user1, path="other"
+        )
+        self.test_partial_update()
+
+        response = self.client.get(reverse("repositories-list"), {"order": "updated"})
+
+        self.assertEqual(response.data["results"][0]["id"], self.repository.id)
+        self.assertEqual(response.data["results"][1]["id"], other.id)
+
+        response = self.client.get(reverse("repositories-list"), {"order": "newest"})
+
+        self.assertEqual(response.data["results"][0]["id"], other.id)
+
+    def test_search_contents(self):
+        data = {
+            "message": "test_search_contents",
+            "changes": [
+                {
+                    "action": "write",
+                    "path": "ch1.txt",
+                    "content": "the quick brown fox",
+                },
+                {
+                    "action": "write",
+                    "path": "ch2.txt",
+                    "content": "a lazy brown <script>alert(1)</script> dog",
+                },
+            ],
+        }
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        update_search_index(self.repository.id)
+
+        response = self.client.get(reverse("repositories-search"), {"q": "brown"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(
+            reverse("repositories-search"), {"q": '"quick brown"'}
+        )
+
+        self.assertEqual(
+            [result["path"] for result in response.data["results"]], ["ch1.txt"]
+        )
+        self.assertIn("<b>quick brown</b>", response.data["results"][0]["snippet"])
+
+        # File content is escaped, only the match markers are markup
+        response = self.client.get(reverse("repositories-search"), {"q": "lazy"})
+
+        self.assertEqual(
+            response.data["results"][0]["snippet"],
+            "a <b>lazy</b> brown &lt;script&gt;alert(1)&lt;/script&gt; dog",
+        )
+
+        # Only the changed paths are indexed again
+        data = {
+            "message": "test_search_contents",
+            "changes": [
+                {"action": "rename", "path": "ch1.txt", "new_path": "chapter1.txt"},
+                {"action": "delete", "path": "ch2.txt"},
+            ],
+        }
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        update_search_index(self.repository.id)
+
+        response = self.client.get(reverse("repositories-search"), {"q": "qui*"})
+
+        self.assertEqual(
+            [result["path"] for result in response.data["results"]], ["chapter1.txt"]
+        )
+
+        self.repository.private = True
+        self.repository.save()
+        response = self.client.get(reverse("repositories-search"), {"q": "quick"})
+
+        self.assertEqual(response.data["results"], [])
+
+    def test_search_contents_invalid_query(self):
+        response = self.client.get(reverse("repositories-search"), {"q": '"open'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_name(self):
         data = {
             "old_name": "README.txt",
@@ -216,6 +545,64 @@ class RepositoryViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(os.path.exists(os.path.join(self.repository.path, "AFTER.txt")))
 
+    def test_update_name_invalid_path(self):
+        repo = Repo(self.repository.path)
+        head = repo.head.commit.hexsha
+
+        for new_name in (
+            "../../escaped.txt",
+            ".git/hooks/post-commit",
+            "/abs.txt",
+            "x/../../y",
+            "",
+        ):
+            response = self.client.patch(
+                reverse("repositories-rename", args=[self.repository.id]),
+                {"old_name": "README.txt", "new_name": new_name, "message": "test"},
+                format="json",
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(repo.head.commit.hexsha, head)
+
+        # Redundant separators are cleaned up, not rejected
+        response = self.client.patch(
+            reverse("repositories-rename", args=[self.repository.id]),
+            {"old_name": "README.txt", "new_name": "a//b", "message": "test"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((repo.head.commit.tree / "a/b").type, "blob")
+
+    def test_update_name_directory(self):
+        response = self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {
+                "message": "Added ch",
+                "changes": [{"action": "write", "path": "ch/a.txt", "content": "a"}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        data = {"old_name": "ch", "new_name": "book", "message": "Renamed ch"}
+        response = self.client.patch(
+            reverse("repositories-rename", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        repo = Repo(self.repository.path)
+        self.assertEqual(
+            (repo.head.commit.tree / "book/a.txt").data_stream.read(), b"a"
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.repository.path, "ch")))
+        with open(os.path.join(self.repository.path, "book", "a.txt")) as f:
+            self.assertEqual(f.read(), "a")
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
     def test_retrieve_working_tree(self):
         self.test_partial_update()
 
@@ -225,6 +612,51 @@ class RepositoryViewSetTestCase(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["files"][0]["status"], "modified")
+
+    def test_retrieve_working_tree_pagination(self):
+        repo = Repo(self.repository.path)
+        root_commit = repo.head.commit.hexsha
+        data = {
+            "message": "test_retrieve_working_tree",
+            "changes": [
+                {"action": "write", "path": "a.txt", "content": "a"},
+                {"action": "write", "path": "b.txt", "content": "b"},
+                {"action": "rename", "path": "README.txt", "new_path": "README.md"},
+            ],
+        }
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        response = self.client.get(
+            reverse("repositories-workingtree", args=[self.repository.id]),
+            {"commit_hash": repo.head.commit.hexsha, "limit": 2},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(
+            [file["status"] for file in response.data["files"]], ["renamed", "added"]
+        )
+        self.assertIn("+a", response.data["files"][1]["patch"])
+
+        response = self.client.get(response.data["next"])
+
+        self.assertEqual(response.data["files"][0]["path"], "b.txt")
+        self.assertIsNone(response.data["next"])
+
+        # Root commits are compared with the empty tree
+        response = self.client.get(
+            reverse("repositories-workingtree", args=[self.repository.id]),
+            {"commit_hash": root_commit},
+        )
+
+        self.assertEqual(response.data["files"][0]["status"], "added")
+        self.assertEqual(response.data["files"][0]["path"], "README.txt")
 
     def test_list_commits(self):
         self.test_partial_update()
@@ -234,7 +666,338 @@ class RepositoryViewSetTestCase(APITestCase):
         )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_list_commits_comment_counts(self):
+        self.test_partial_update()
+        repo = Repo(self.repository.path)
+        head, parent = repo.head.commit, repo.head.commit.parents[0]
+        Comment.objects.bulk_create(
+            [
+                Comment(
+                    user=self.user1,
+                    repository=self.repository,
+                    commit=head.hexsha,
+                    text="comment",
+                )
+                for _ in range(3)
+            ]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("repositories-commits", args=[self.repository.id]),
+            )
+        # user, repository and one grouped count for the page
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            [
+                (commit["commit_hash"], commit["comment_count"])
+                for commit in response.data["results"]
+            ],
+            [(head.hexsha, 3), (parent.hexsha, 0)],
+        )
+
+        response = self.client.get(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {"format": "ndjson"},
+        )
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(json.loads(lines[0])["comment_count"], 3)
+
+    def test_list_commits_pagination(self):
+        self.test_partial_update()
+        repo = Repo(self.repository.path)
+
+        response = self.client.get(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {"limit": 1},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"][0]["commit_hash"], repo.head.commit.hexsha
+        )
+        self.assertIn(f"after={repo.head.commit.hexsha}", response.data["next"])
+
+        response = self.client.get(response.data["next"])
+
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(
+            response.data["results"][0]["commit_message"], "initial commit"
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_list_commits_pagination_merge(self):
+        repo = Repo(self.repository.path)
+        branch = repo.active_branch.name
+        repo.git.checkout("-b", "side")
+        repo.git.commit("--allow-empty", "-m", "m1")
+        repo.git.commit("--allow-empty", "-m", "m2")
+        repo.git.checkout(branch)
+        repo.git.commit("--allow-empty", "-m", "f1")
+        repo.git.commit("--allow-empty", "-m", "f2")
+        repo.git.merge("--no-ff", "-m", "merge", "side")
+
+        url = reverse("repositories-commits", args=[self.repository.id])
+        params = {"limit": 2}
+        commit_hashes = []
+        while url is not None:
+            response = self.client.get(url, params)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            commit_hashes += [
+                commit["commit_hash"] for commit in response.data["results"]
+            ]
+            url, params = response.data["next"], None
+
+        # Commits only reachable through the merged branch are not skipped
+        self.assertEqual(
+            commit_hashes, [commit.hexsha for commit in repo.iter_commits("HEAD")]
+        )
+        self.assertEqual(len(commit_hashes), 6)
+
+    def test_list_commits_unreachable_cursor(self):
+        repo = Repo(self.repository.path)
+        root_commit = repo.head.commit
+        self.test_partial_update()
+        dropped = repo.head.commit.hexsha
+        repo.head.reset(root_commit, index=True, working_tree=True)
+
+        response = self.client.get(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {"after": dropped},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_commits_ndjson(self):
+        self.test_partial_update()
+
+        response = self.client.get(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {"format": "ndjson", "path": "README.txt"},
+        )
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["commit_message"], "Updated README.txt")
+
+    def test_list_commits_bad_ref(self):
+        response = self.client.get(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {"ref": "no-such-branch"},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_commit(self):
+        repo = Repo(self.repository.path)
+        parent = repo.head.commit.hexsha
+
+        data = {
+            "message": "test_create_commit",
+            "parent": parent,
+            "changes": [
+                {"action": "write", "path": "src/main.py", "content": "print(1)"},
+                {"action": "rename", "path": "README.txt", "new_path": "docs/README"},
+                {"action": "write", "path": "docs/README", "content": "docs"},
+            ],
+        }
+        response = self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["parent"], parent)
+        self.assertEqual(repo.head.commit.hexsha, response.data["commit_hash"])
+        self.assertIn("lock;dur=", response["Server-Timing"])
+        self.assertEqual(len(list(repo.iter_commits())), 2)
+        self.assertFalse(
+            os.path.exists(os.path.join(repo.working_tree_dir, "README.txt"))
+        )
+        with open(os.path.join(repo.working_tree_dir, "docs", "README")) as f:
+            self.assertEqual(f.read(), "docs")
+        with open(os.path.join(repo.working_tree_dir, "src", "main.py")) as f:
+            self.assertEqual(f.read(), "print(1)")
+
+    def test_create_commit_stale_parent(self):
+        repo = Repo(self.repository.path)
+        parent = repo.head.commit.hexsha
+        self.test_partial_update()
+
+        data = {
+            "message": "test_create_commit",
+            "parent": parent,
+            "changes": [{"action": "delete", "path": "README.txt"}],
+        }
+        response = self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["head"], repo.head.commit.hexsha)
+
+    def test_create_commit_invalid_change(self):
+        repo = Repo(self.repository.path)
+        head = repo.head.commit.hexsha
+
+        data = {
+            "message": "test_create_commit",
+            "changes": [
+                {"action": "write", "path": "a.txt", "content": "a"},
+                {"action": "delete", "path": "missing.txt"},
+            ],
+        }
+        response = self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(repo.head.commit.hexsha, head)
+
+    def test_create_commit_path_conflict(self):
+        repo = Repo(self.repository.path)
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {
+                "message": "Added ch",
+                "changes": [{"action": "write", "path": "ch/a.txt", "content": "a"}],
+            },
+            format="json",
+        )
+        head = repo.head.commit.hexsha
+
+        for changes in (
+            [{"action": "write", "path": "README.txt/x", "content": "x"}],
+            [{"action": "rename", "path": "README.txt", "new_path": "README.txt/b"}],
+            [{"action": "write", "path": "ch", "content": "ch"}],
+            [
+                {"action": "write", "path": "new/a.txt", "content": "a"},
+                {"action": "write", "path": "new", "content": "new"},
+            ],
+        ):
+            response = self.client.post(
+                reverse("repositories-commits", args=[self.repository.id]),
+                {"message": "test_create_commit", "changes": changes},
+                format="json",
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(repo.head.commit.hexsha, head)
+            self.assertFalse(repo.is_dirty(untracked_files=True))
+
+        # A directory emptied earlier in the batch can become a file
+        response = self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            {
+                "message": "ch is a file",
+                "changes": [
+                    {"action": "delete", "path": "ch/a.txt"},
+                    {"action": "write", "path": "ch", "content": "ch"},
+                ],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with open(os.path.join(self.repository.path, "ch")) as f:
+            self.assertEqual(f.read(), "ch")
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    @mock.patch("repositories.locks.REPO_LOCK_TIMEOUT", 0.05)
+    def test_create_commit_locked(self):
+        repo = Repo(self.repository.path)
+        head = repo.head.commit.hexsha
+
+        data = {
+            "message": "test_create_commit",
+            "changes": [{"action": "write", "path": "a.txt", "content": "a"}],
+        }
+        with repository_lock(self.repository.path):
+            response = self.client.post(
+                reverse("repositories-commits", args=[self.repository.id]),
+                data,
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(repo.head.commit.hexsha, head)
+
+    def test_list_stats(self):
+        repo = Repo(self.repository.path)
+        update_commit_stats(self.repository.id, repo.head.commit.hexsha)
+
+        data = {
+            "message": "test_list_stats",
+            "changes": [
+                {"action": "write", "path": "ch1.txt", "content": "one two three"},
+                {"action": "write", "path": "ch2.txt", "content": "four five"},
+            ],
+        }
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        update_commit_stats(self.repository.id, repo.head.commit.hexsha)
+
+        data = {
+            "message": "test_list_stats",
+            "changes": [
+                {"action": "write", "path": "ch1.txt", "content": "one"},
+                {"action": "delete", "path": "ch2.txt"},
+            ],
+        }
+        self.client.post(
+            reverse("repositories-commits", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+        with mock.patch("repositories.stats.count_tree") as count_tree:
+            update_commit_stats(self.repository.id, repo.head.commit.hexsha)
+        count_tree.assert_not_called()
+
+        response = self.client.get(
+            reverse("repositories-stats", args=[self.repository.id])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(stats["words"], stats["chapters"]) for stats in response.data],
+            [(0, 1), (5, 3), (1, 2)],
+        )
+        self.assertEqual(response.data[2]["words_delta"], -4)
+        self.assertEqual(response.data[2]["characters_delta"], -19)
+        self.assertEqual(response.data[2]["chapters_delta"], -1)
+
+        # A reset drops the last commit from the series, its row stays
+        response = self.client.put(
+            reverse("repositories-rollback", args=[self.repository.id]),
+            {"commit_hash": repo.head.commit.parents[0].hexsha},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(
+            reverse("repositories-stats", args=[self.repository.id])
+        )
+
+        self.assertEqual(
+            [(stats["words"], stats["chapters"]) for stats in response.data],
+            [(0, 1), (5, 3)],
+        )
+        self.assertEqual(
+            CommitStats.objects.filter(repository=self.repository).count(), 3
+        )
 
     def test_rollback_to_commit(self):
         self.test_partial_update()
@@ -255,6 +1018,65 @@ class RepositoryViewSetTestCase(APITestCase):
         self.assertEqual(len(list(repo.iter_commits())), 1)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_rollback_to_commit_dry_run(self):
+        self.test_partial_update()
+
+        repo = Repo(self.repository.path)
+        head = repo.head.commit.hexsha
+
+        data = {"commit_hash": repo.head.commit.parents[0].hexsha, "dry_run": True}
+        response = self.client.put(
+            reverse("repositories-rollback", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["files"][0]["path"], "README.txt")
+        self.assertEqual(response.data["deletions"], 1)
+        self.assertEqual(repo.head.commit.hexsha, head)
+
+    def test_rollback_to_commit_mode_commit(self):
+        self.test_partial_update()
+
+        repo = Repo(self.repository.path)
+        head = repo.head.commit
+        target = head.parents[0]
+
+        data = {"commit_hash": target.hexsha, "mode": "commit"}
+        response = self.client.put(
+            reverse("repositories-rollback", args=[self.repository.id]),
+            data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(repo.head.commit.tree, target.tree)
+        self.assertEqual(repo.head.commit.parents[0], head)
+        self.assertEqual(len(list(repo.iter_commits())), 3)
+        with open(os.path.join(self.repository.path, "README.txt"), "r") as f:
+            self.assertEqual(f.read(), "")
+
+        response = self.client.post(
+            reverse("repositories-rollback-undo", args=[self.repository.id]),
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(repo.head.commit, head)
+        self.assertFalse(repo.is_dirty(untracked_files=True))
+
+    def test_undo_rollback_after_new_commit(self):
+        self.test_rollback_to_commit()
+        self.test_partial_update()
+
+        response = self.client.post(
+            reverse("repositories-rollback-undo", args=[self.repository.id]),
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
     def test_get_content_in_file(self):
         self.test_partial_update()
 
@@ -266,6 +1088,105 @@ class RepositoryViewSetTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, "This is some new content.")
 
+    def test_get_content_in_file_not_modified(self):
+        self.test_partial_update()
+        url = reverse("repositories-content", args=[self.repository.id])
+
+        response = self.client.get(url, {"file_path": "README.txt"})
+        etag = response["ETag"]
+        blob = Repo(self.repository.path).head.commit.tree / "README.txt"
+        self.assertEqual(etag, f'"{blob.hexsha}"')
+
+        response = self.client.get(
+            url, {"file_path": "README.txt"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_raw_content(self):
+        self.test_partial_update()
+        url = reverse("repositories-raw", args=[self.repository.id])
+        parent = Repo(self.repository.path).head.commit.parents[0].hexsha
+
+        response = self.client.get(url, {"path": "README.txt"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b"".join(response.streaming_content), b"This is some new content."
+        )
+
+        response = self.client.get(url, {"path": "README.txt"}, HTTP_RANGE="bytes=8-11")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], "bytes 8-11/25")
+        self.assertEqual(b"".join(response.streaming_content), b"some")
+
+        response = self.client.get(url, {"path": "README.txt"}, HTTP_RANGE="bytes=100-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+
+        response = self.client.get(url, {"path": "README.txt", "ref": parent})
+        self.assertEqual(b"".join(response.streaming_content), b"")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(url, {"path": "MISSING.txt"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_convert_to_bare(self):
+        head = Repo(self.repository.path).head.commit.hexsha
+
+        call_command("convert_to_bare", self.repository.id, stdout=StringIO())
+
+        repo = Repo(self.repository.path)
+        self.assertTrue(repo.bare)
+        self.assertEqual(repo.head.commit.hexsha, head)
+        self.assertFalse(os.path.exists(os.path.join(self.repository.path, ".git")))
+        self.assertFalse(os.path.exists(f"{self.repository.path}.worktree"))
+
+        response = self.client.patch(
+            reverse("repositories-file", args=[self.repository.id]),
+            {
+                "file": SimpleUploadedFile("README.txt", b"bare content"),
+                "message": "Updated README.txt",
+                "path": f"{self.user1.username}/{self.repository.name}/README.txt",
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.patch(
+            reverse("repositories-rename", args=[self.repository.id]),
+            {"old_name": "README.txt", "new_name": "AFTER.txt", "message": "rename"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(
+            reverse("repositories-branches", args=[self.repository.id]),
+            {"branch_name": "draft", "message": "draft"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        repo = Repo(self.repository.path)
+        self.assertEqual(repo.active_branch.name, "draft")
+        self.assertEqual(
+            (repo.head.commit.tree / "AFTER.txt").data_stream.read(), b"bare content"
+        )
+        self.assertEqual(len(list(repo.iter_commits())), 4)
+
+    def test_create_bare_repository(self):
+        with mock.patch("repositories.views.BARE_REPOSITORIES", True):
+            response = self.client.post(
+                reverse("repositories-list"),
+                data={"name": "test_bare_repo"},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.data["tree"]), {"README.txt": "blob"})
+
+        repo = Repo(os.path.join(REPO_ROOT, self.user1.username, "test_bare_repo"))
+        self.assertTrue(repo.bare)
+        self.assertEqual(repo.head.commit.message, "initial commit")
+        self.assertEqual(repo.head.commit.author.name, self.user1.username)
+
     # no_auth
     def test_create_repository_no_auth(self):
         self.client.credentials()
@@ -323,3 +1244,161 @@ class RepositoryViewSetTestCase(APITestCase):
             reverse("repositories-rollback", args=[self.repository.id])
         )
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RepositoryLockTestCase(TestCase):
+    @mock.patch("repositories.locks.REPO_LOCK_QUEUE_SIZE", 1)
+    def test_queue_is_bounded(self):
+        path = os.path.join(REPO_ROOT, "locked")
+
+        # Other repositories are not held up
+        with repository_lock(path):
+            with repository_lock(path + "-other", timeout=0) as timer:
+                pass
+        self.assertLess(timer.wait, 0.01)
+
+        with repository_lock(path):
+            slot = try_lock(get_lock_path(path, "lock-wait-0"))
+            with self.assertRaises(RepositoryBusy):
+                with repository_lock(path, timeout=10):
+                    pass
+            unlock(slot)
+
+            with self.assertRaises(RepositoryBusy):
+                with repository_lock(path, timeout=0.01):
+                    pass
+
+
+class RepoPoolTestCase(TestCase):
+    def setUp(self):
+        self.repo_path = os.path.join(REPO_ROOT, "pool@pool.com", "test_repo")
+        if os.path.exists(self.repo_path):
+            shutil.rmtree(self.repo_path)
+        Repo.init(self.repo_path)
+
+        self.pool = RepoPool(max_size=2)
+
+    def tearDown(self):
+        self.pool.clear()
+
+    def test_get_reuses_handle(self):
+        repo = self.pool.get(self.repo_path)
+
+        self.assertIs(self.pool.get(self.repo_path), repo)
+
+    def test_get_replaces_recreated_repository(self):
+        repo = self.pool.get(self.repo_path)
+
+        shutil.rmtree(self.repo_path)
+        Repo.init(self.repo_path)
+
+        self.assertIsNot(self.pool.get(self.repo_path), repo)
+
+    def test_evict(self):
+        repo = self.pool.get(self.repo_path)
+
+        self.pool.evict_prefix(os.path.dirname(self.repo_path))
+
+        self.assertEqual(len(self.pool.entries), 0)
+        self.assertIsNot(self.pool.get(self.repo_path), repo)
+
+    def test_evict_only_own_thread(self):
+        paths = [self.repo_path]
+        for name in ("second_repo", "third_repo"):
+            path = os.path.join(os.path.dirname(self.repo_path), name)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            Repo.init(path)
+            paths.append(path)
+
+        # A running thread holds the least recently used handle
+        started, done = threading.Event(), threading.Event()
+
+        def hold() -> None:
+            self.pool.get(self.repo_path)
+            started.set()
+            done.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        started.wait()
+
+        for path in paths:
+            self.pool.get(path)
+
+        self.assertIn((self.repo_path, thread.ident), self.pool.entries)
+        self.assertNotIn((self.repo_path, threading.get_ident()), self.pool.entries)
+        self.assertEqual(len(self.pool.entries), 3)
+
+        # Handles of threads that exited go with the next put
+        done.set()
+        thread.join()
+        self.pool.get(self.repo_path)
+
+        self.assertNotIn((self.repo_path, thread.ident), self.pool.entries)
+
+
+class SnapshotCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = SnapshotCache("test", max_size=1, max_bytes=10, max_age=60)
+        if os.path.exists(self.cache.directory):
+            shutil.rmtree(self.cache.directory)
+
+    def test_prune_least_recently_used(self):
+        for key in ("aa", "bb", "cc"):
+            self.cache.set(key, "12345")
+        # Reading an entry from disk counts as a use
+        os.utime(self.cache.get_path("aa"), (0, 0))
+        os.utime(self.cache.get_path("bb"), (1, 1))
+        self.cache.clear()
+        self.cache.get("aa")
+
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertFalse(os.path.exists(self.cache.get_path("bb")))
+        self.assertTrue(os.path.exists(self.cache.get_path("aa")))
+
+    def test_prune_expired(self):
+        self.cache.set("aa", "1")
+        os.utime(self.cache.get_path("aa"), (0, 0))
+
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertIsNone(self.cache.read("aa"))
+
+
+class TrashTestCase(TestCase):
+    def setUp(self):
+        if os.path.exists(TRASH_ROOT):
+            shutil.rmtree(TRASH_ROOT)
+        self.repo_path = os.path.join(REPO_ROOT, "trash@trash.com", "test_repo")
+        if os.path.exists(self.repo_path):
+            shutil.rmtree(self.repo_path)
+        Repo.init(self.repo_path, mkdir=True)
+
+    def test_resume_interrupted_removal(self):
+        trash_path = move_to_trash(self.repo_path)
+        name = os.path.basename(trash_path)
+
+        # The reaper died after removing part of the tree
+        shutil.rmtree(os.path.join(trash_path, ".git", "objects"))
+
+        self.assertEqual(empty_trash(None), 1)
+        self.assertFalse(os.path.exists(trash_path))
+        self.assertFalse(os.path.exists(get_manifest_path(name)))
+
+    @mock.patch("repositories.trash.TRASH_ABORT_AGE", 0)
+    def test_drop_manifest_without_entry(self):
+        # The request died between writing the manifest and the rename
+        trash_path = move_to_trash(self.repo_path)
+        name = os.path.basename(trash_path)
+        os.rename(trash_path, self.repo_path)
+
+        self.assertEqual(empty_trash(None), 1)
+        self.assertFalse(os.path.exists(get_manifest_path(name)))
+        self.assertTrue(os.path.exists(self.repo_path))
+
+    def test_empty_trash_once_at_a_time(self):
+        move_to_trash(self.repo_path)
+
+        with repository_lock(TRASH_ROOT, name="reap"):
+            self.assertEqual(empty_trash(None), 0)
+        self.assertEqual(empty_trash(None), 1)
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from django.db import transaction
+from git.repo import Repo
+
+from forks.models import Fork
+from forks.utils import dissociate, get_alternates_path, read_alternates
+from project.settings import TRASH_ABORT_AGE, TRASH_REAP_RATE, TRASH_ROOT
+from repositories.locks import RepositoryBusy, repository_lock
+from repositories.pool import repo_pool
+
+logger = logging.getLogger(__name__)
+
+
+# Deleting is a rename into TRASH_ROOT, the files are removed later by the reaper.
+# Every entry has a manifest written before the rename, so a reaper that died
+# half way simply starts over on the next run.
+def get_manifest_path(name: str) -> str:
+    return os.path.join(TRASH_ROOT, f"{name}.json")
+
+
+def get_objects_dir(path: str) -> Optional[str]:
+    for objects_dir in (
+        os.path.join(path, ".git", "objects"),
+        os.path.join(path, "objects"),
+    ):
+        if os.path.isdir(objects_dir):
+            return os.path.realpath(objects_dir)
+    return None
+
+
+def find_borrowers(path: str, trash_path: str) -> list:
+    # Forks outside path that borrow objects from a repository inside it, with the
+    # objects directory they have to follow into the trash
+    path = os.path.abspath(path)
+    borrowers = []
+
+    for source_path, target_path in Fork.objects.filter(
+        source_repository__path__startswith=path
+    ).values_list("source_repository__path", "target_repository__path"):
+        source_path = os.path.abspath(source_path)
+        if source_path != path and not source_path.startswith(path + os.sep):
+            continue
+        if target_path.startswith(path + os.sep) or not os.path.isdir(target_path):
+            continue
+
+        objects_dir = get_objects_dir(source_path)
+        if objects_dir is None:
+            continue
+
+        if objects_dir in read_alternates(Repo(target_path)):
+            trashed = os.path.join(trash_path, os.path.relpath(objects_dir, path))
+            borrowers.append(
+                {"path": target_path, "objects": objects_dir, "trashed": trashed}
+            )
+
+    return borrowers
+
+
+def relink_borrower(borrower: dict) -> None:
+    # Point the alternates at the objects' place in the trash. Runs again after a
+    # crash, so a borrower that was relinked already is left as it is.
+    repo = Repo(borrower["path"])
+    alternates_path = get_alternates_path(repo)
+    alternates = read_alternates(repo)
+
+    if borrower["objects"] not in alternates:
+        return
+
+    alternates = [
+        borrower["trashed"] if alternate == borrower["objects"] else alternate
+        for alternate in alternates
+    ]
+    with open(f"{alternates_path}.tmp", "w") as f:
+        f.write("".join(f"{alternate}\n" for alternate in alternates))
+    os.replace(f"{alternates_path}.tmp", alternates_path)
+    repo_pool.evict(borrower["path"])
+
+
+def move_to_trash(
+    path: str, name: Optional[str] = None, borrowers: Optional[list] = None
+) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+
+    os.makedirs(TRASH_ROOT, exist_ok=True)
+    name = name or uuid.uuid4().hex
+    trash_path = os.path.join(TRASH_ROOT, name)
+    if borrowers is None:
+        borrowers = find_borrowers(path, trash_path)
+
+    with open(get_manifest_path(name), "w") as f:
+        json.dump({"path": path, "borrowers": borrowers}, f)
+
+    repo_pool.evict_prefix(path)
+    os.rename(path, trash_path)
+
+    for borrower in borrowers:
+        relink_borrower(borrower)
+
+    return trash_path
+
+
+@contextmanager
+def trash_on_commit(path: str) -> Iterator[None]:
+    # Wraps deleting the rows of what lives at path. The directory is only moved
+    # once the delete is committed, a delete that fails or is rolled back leaves
+    # it in place. Forks borrowing from it are looked up while their rows exist.
+    name = uuid.uuid4().hex
+    borrowers = find_borrowers(path, os.path.join(TRASH_ROOT, name))
+    yield
+    transaction.on_commit(lambda: move_to_trash(path, name, borrowers))
+
+
+def remove_tree(path: str, rate: Optional[int]) -> None:
+    # Bottom up so an interrupted removal leaves a smaller tree behind. rate limits
+    # the bytes removed per second to keep the disk free for requests.
+    start = time.monotonic()
+    removed = 0
+
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            try:
+                removed += os.lstat(file_path).st_size
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+            if rate:
+                delay = removed / rate - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+        for dirname in dirnames:
+            dir_path = os.path.join(dirpath, dirname)
+            if os.path.islink(dir_path):
+                os.remove(dir_path)
+            elif os.path.isdir(dir_path):
+                os.rmdir(dir_path)
+
+    os.rmdir(path)
+
+
+def reap_entry(name: str, rate: Optional[int]) -> None:
+    manifest_path = get_manifest_path(name)
+    trash_path = os.path.join(TRASH_ROOT, name)
+
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {"borrowers": []}
+
+    if not os.path.exists(trash_path):
+        # The rename may still be on its way, only a stale manifest is dropped
+        if not os.path.exists(manifest_path):
+            return
+        if time.time() - os.path.getmtime(manifest_path) < TRASH_ABORT_AGE:
+            return
+    else:
+        # Forks stop borrowing before the objects are gone
+        for borrower in manifest["borrowers"]:
+            if not os.path.isdir(borrower["path"]):
+                continue
+            relink_borrower(borrower)
+
+            repo = Repo(borrower["path"])
+            if borrower["trashed"] in read_alternates(repo):
+                dissociate(repo)
+                repo_pool.evict(borrower["path"])
+
+        remove_tree(trash_path, rate)
+
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def empty_trash(rate: Optional[int] = TRASH_REAP_RATE) -> int:
+    try:
+        names = os.listdir(TRASH_ROOT)
+    except FileNotFoundError:
+        return 0
+
+    entries = sorted({name.split(".")[0] for name in names if not name.startswith(".")})
+    reaped = 0
+
+    # One reaper at a time, the others would only compete for the disk
+    try:
+        with repository_lock(TRASH_ROOT, timeout=0, name="reap"):
+            for name in entries:
+                try:
+                    reap_entry(name, rate)
+                    reaped += 1
+                except Exception:
+                    logger.exception("could not reap %s", name)
+    except RepositoryBusy:
+        return 0
+
+    return reaped
@@ -0,0 +1,227 @@
+import json
+import os
+from itertools import dropwhile, islice
+from typing import Any, Callable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from git.objects import Commit
+from git.repo import Repo
+
+from project.settings import REPO_ROOT
+from repositories.cache import SnapshotCache
+from repositories.models import Repository
+from repositories.objects import FILE_MODE, flatten_tree, write_blob
+
+tree_cache = SnapshotCache("trees")
+
+
+def build_tree_dict(tree: Any) -> dict:
+    result = {}
+    for item in tree:
+        if item.type == "blob":
+            result[item.name] = "blob"
+        elif item.type == "tree":
+            result[item.name] = build_tree_dict(item)
+    return result
+
+
+def normalize_path(path: str) -> Optional[str]:
+    path = os.path.normpath(path)
+    parts = path.split(os.sep)
+
+    if os.path.isabs(path) or path == "." or parts[0] == ".." or ".git" in parts:
+        return None
+    return "/".join(parts)
+
+
+def get_repository_file_path(repository: Repository, path: str) -> Optional[str]:
+    # Clients send paths relative to REPO_ROOT, "<username>/<repository>/<file>"
+    return normalize_path(
+        os.path.relpath(os.path.join(REPO_ROOT, path), repository.path)
+    )
+
+
+def is_text(content: bytes) -> bool:
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def get_tree_json(repo: Repo) -> str:
+    # Resolving HEAD only reads the ref, never the whole history
+    commit = repo.head.commit
+
+    return tree_cache.get_or_set(
+        commit.hexsha, lambda: json.dumps(build_tree_dict(commit.tree))
+    )
+
+
+def serialize_commit(commit: Commit) -> dict:
+    return {
+        "commit_hash": commit.hexsha,
+        "commit_date": commit.committed_datetime,
+        "commit_message": commit.message,
+    }
+
+
+def iter_commit_log(
+    repo: Repo,
+    ref: str = "HEAD",
+    path: Optional[str] = None,
+    after: Optional[str] = None,
+    max_count: Optional[int] = None,
+) -> Iterator[Commit]:
+    # rev-list output is consumed lazily, so only the commits up to the cursor and
+    # max_count more are ever read
+    paths = [path] if path else []
+    if after is None:
+        kwargs = {"max_count": max_count} if max_count is not None else {}
+        return repo.iter_commits(ref, paths, **kwargs)
+
+    # The cursor resumes the walk from ref, a walk restarted at after would miss
+    # the commits only reachable through the other parents of a merge
+    after = repo.commit(after).hexsha
+    commits = dropwhile(
+        lambda commit: commit.hexsha != after, repo.iter_commits(ref, paths)
+    )
+    next(commits, None)
+    return islice(commits, max_count)
+
+
+def stream_commit_log(
+    commits: Iterator[Commit],
+    batch_size: int,
+    annotate: Optional[Callable[[list], list]] = None,
+) -> Iterator[bytes]:
+    # annotate adds fields to a whole batch of serialized commits at once
+    while True:
+        batch = [serialize_commit(commit) for commit in islice(commits, batch_size)]
+        if not batch:
+            return
+        if annotate is not None:
+            batch = annotate(batch)
+
+        yield b"".join(
+            json.dumps(commit, cls=DjangoJSONEncoder).encode("utf-8") + b"\n"
+            for commit in batch
+        )
+
+
+def flatten_structure(structure: dict, prefix: str = "") -> list:
+    paths = []
+    for name, value in structure.items():
+        if value == "blob":
+            paths.append(prefix + name)
+        elif isinstance(value, dict):
+            paths.extend(flatten_structure(value, prefix + name + "/"))
+    return paths
+
+
+def get_structure_changes(repo: Repo, structure: dict) -> dict:
+    # Files keep their content by file name: a path that disappears and shows up
+    # somewhere else is a move, a new path with a known name is a copy.
+    current = flatten_tree(repo, repo.head.commit.tree.binsha)
+    requested = flatten_structure(structure)
+    requested_paths = set(requested)
+
+    removed = {}
+    by_name = {}
+    for path, entry in current.items():
+        name = path.rsplit("/", 1)[-1]
+        by_name.setdefault(name, entry)
+        if path not in requested_paths:
+            removed.setdefault(name, []).append(entry)
+
+    changes = {path: None for path in current if path not in requested_paths}
+    empty_blob = None
+
+    for path in requested:
+        if path in current:
+            continue
+
+        name = path.rsplit("/", 1)[-1]
+        if removed.get(name):
+            changes[path] = removed[name].pop(0)
+        elif name in by_name:
+            changes[path] = by_name[name]
+        else:
+            if empty_blob is None:
+                empty_blob = write_blob(repo, b"")
+            changes[path] = (FILE_MODE, empty_blob)
+
+    return changes
+
+
+def get_batch_changes(repo: Repo, commit: Commit, operations: list) -> dict:
+    # Operations are applied in order on top of the commit, a later operation sees
+    # the result of the earlier ones.
+    changes = {}
+
+    def lookup(path: str) -> Optional[tuple]:
+        if path in changes:
+            return changes[path]
+        try:
+            blob = commit.tree / path
+        except KeyError:
+            return None
+        return (blob.mode, blob.binsha) if blob.type == "blob" else None
+
+    def is_directory(path: str) -> bool:
+        prefix = path + "/"
+        if any(
+            changed.startswith(prefix) and entry is not None
+            for changed, entry in changes.items()
+        ):
+            return True
+        try:
+            tree = commit.tree / path
+        except KeyError:
+            return False
+        return tree.type == "tree" and any(
+            changes.get(prefix + child, True) is not None
+            for child in flatten_tree(repo, tree.binsha)
+        )
+
+    def check_target(path: str) -> None:
+        # A file can not be written below a file or over a directory
+        parent = path
+        while "/" in parent:
+            parent = parent.rsplit("/", 1)[0]
+            if lookup(parent) is not None:
+                raise ValueError(f"{path}: {parent} is a file")
+        if is_directory(path):
+            raise ValueError(f"{path}: is a directory")
+
+    for operation in operations:
+        action = operation.get("action")
+        path = normalize_path(operation.get("path") or "")
+
+        if path is None:
+            raise ValueError("invalid path")
+
+        if action == "write":
+            content = operation.get("content")
+            if not isinstance(content, str):
+                raise ValueError(f"{path}: content is required")
+            check_target(path)
+            entry = lookup(path)
+            mode = entry[0] if entry is not None else FILE_MODE
+            changes[path] = (mode, write_blob(repo, content.encode("utf-8")))
+        elif action == "rename":
+            new_path = normalize_path(operation.get("new_path") or "")
+            entry = lookup(path)
+            if new_path is None or entry is None:
+                raise ValueError(f"{path}: cannot be renamed")
+            check_target(new_path)
+            changes[path] = None
+            changes[new_path] = entry
+        elif action == "delete":
+            if lookup(path) is None:
+                raise ValueError(f"{path}: does not exist")
+            changes[path] = None
+        else:
+            raise ValueError(f"{path}: unknown action {action}")
+
+    return changes
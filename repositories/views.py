@@ -1,40 +1,88 @@
-import json
 import os
-import shutil
-from typing import Any, Optional
+from itertools import islice
+from typing import Optional
 
-from django.http import Http404, HttpRequest
+from django.http import Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from git.objects import Commit
+from git.refs import Reference
 from git.repo import Repo
+from gitdb.exc import BadName, BadObject
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
-
-from project.settings import REPO_ROOT
+from rest_framework.utils.urls import replace_query_param
+
+from comments.utils import add_comment_counts
+from forks.models import ForkStatus
+from jobs.utils import run_or_enqueue_job
+from project.background import run_in_background
+from project.settings import (
+    BARE_REPOSITORIES,
+    COMMIT_LOG_BATCH_SIZE,
+    COMMIT_LOG_MAX_PAGE_SIZE,
+    COMMIT_LOG_PAGE_SIZE,
+    DIFF_MAX_PAGE_SIZE,
+    DIFF_PAGE_SIZE,
+    REPO_ROOT,
+    SEARCH_MAX_PAGE_SIZE,
+    SEARCH_PAGE_SIZE,
+    STATS_MAX_PAGE_SIZE,
+    STATS_PAGE_SIZE,
+)
 from pullrequests.models import PullRequest
-from repositories.models import Repository
-from repositories.serializers import RepositorySerializer
+from repositories.content import (
+    check_not_modified,
+    get_content_type,
+    get_etag,
+    is_immutable_ref,
+    iter_blob,
+    parse_range,
+    read_blob,
+    resolve_blob,
+)
+from repositories.diff import get_commit_diff, get_diffstat
+from repositories.locks import get_repository_paths, locks_repository
+from repositories.models import CommitStats, Repository, RestorePoint, Tag
+from repositories.objects import (
+    FILE_MODE,
+    PathConflict,
+    commit_changes,
+    commit_tree,
+    diff_trees,
+    flatten_tree,
+    move_head,
+    write_blob,
+)
+from repositories.pagination import KeysetPagination
+from repositories.pool import get_repo
+from repositories.renderers import NDJSONRenderer
+from repositories.search import InvalidQuery, is_search_available, search
+from repositories.serializers import RepositoryListSerializer, RepositorySerializer
+from repositories.stats import get_reachable_commits
+from repositories.template_pool import (
+    claim_template,
+    fill_template_pool,
+    get_template_pool_stats,
+)
+from repositories.trash import empty_trash, trash_on_commit
+from repositories.utils import (
+    get_batch_changes,
+    get_repository_file_path,
+    get_tree_json,
+    is_text,
+    iter_commit_log,
+    normalize_path,
+    serialize_commit,
+    stream_commit_log,
+)
 
 
 class RepositoryViewSet(viewsets.ViewSet):
     queryset = Repository.objects.all()
     serializer_class = RepositorySerializer
 
-    def build_tree_dict(self, tree: Any) -> dict:
-        result = {}
-        for item in tree:
-            if item.type == "blob":
-                result[item.name] = "blob"
-            elif item.type == "tree":
-                result[item.name] = self.build_tree_dict(item)
-        return result
-
-    def get_tree_json(self, repo: Repo) -> str:
-        tree = list(repo.iter_commits())[0].tree
-        tree_dict = self.build_tree_dict(tree)
-        tree_json = json.dumps(tree_dict)
-        return tree_json
-
     def check_is_pullrequest_open(self, repository: Repository) -> bool:
         if PullRequest.objects.filter(
             source_repository=repository, status="open"
@@ -48,40 +96,56 @@ class RepositoryViewSet(viewsets.ViewSet):
             config_writer.set_value("user", "name", request.user.username)
             config_writer.release()
 
-        def init_repo(repo_path: str, file_path: str) -> Repo:
-            repo = Repo.init(repo_path)
-            open(file_path, "w").close()
-            repo.index.add("*")
-            repo.index.commit("initial commit")
+        def init_repo(repo_path: str) -> Repo:
+            # A pre-initialized template is renamed into place, `git init` is the
+            # fallback when the pool is empty
+            repo = claim_template(repo_path)
+            if repo is None:
+                repo = Repo.init(repo_path, bare=BARE_REPOSITORIES)
+            run_in_background(fill_template_pool)
             set_user_name(repo)
             return repo
 
         def prepare_data(request: HttpRequest) -> tuple:
             name = request.data.get("name")
-            repo_path = os.path.join(REPO_ROOT, request.user.username, name)
-            file_path = os.path.join(repo_path, "README.txt")
 
             if not name:
                 raise Http404
 
-            return name, repo_path, file_path
+            repo_path = os.path.join(REPO_ROOT, request.user.username, name)
+
+            return name, repo_path
 
-        name, repo_path, file_path = prepare_data(request)
+        name, repo_path = prepare_data(request)
 
-        repo = init_repo(repo_path, file_path)
+        repo = init_repo(repo_path)
 
         repository = Repository.objects.create(
             name=name,
-            path=repo.working_tree_dir,
+            path=repo_path,
             user=request.user,
         )
         repository.owners.set([request.user])
 
+        commit_changes(
+            repository,
+            repo,
+            {"README.txt": (FILE_MODE, write_blob(repo, b""))},
+            "initial commit",
+        )
+
         data = RepositorySerializer(repository).data
-        data["tree"] = self.get_tree_json(repo)
+        data["tree"] = get_tree_json(repo)
 
         return Response(data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=["get"], url_path="pool", url_name="pool")
+    def retrieve_template_pool(self, request: HttpRequest) -> Response:
+        if not request.user.is_staff:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        return Response(get_template_pool_stats(), status=status.HTTP_200_OK)
+
     def retrieve(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         def check_readable(repository: Repository, request: HttpRequest) -> bool:
             if repository.private:
@@ -89,37 +153,34 @@ class RepositoryViewSet(viewsets.ViewSet):
                     return True
                 return False
 
-        def check_is_possible_to_pullrequest(
-            repository: Repository, repo: Repo
-        ) -> bool:
+        def get_fork_status(repository: Repository) -> Optional[ForkStatus]:
             if repository.fork:
-                remote = repo.remotes.origin
-                remote.fetch()
-                remote_tree = remote.refs.main.commit.tree
-                diff = remote_tree.diff(repo.head.commit.tree)
-                if diff:
-                    return True
-                return False
-            return False
+                return ForkStatus.objects.filter(repository=repository).first()
+            return None
 
         repository = Repository.objects.get(pk=pk)
 
         if check_readable(repository, request) is False:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        repo = Repo(repository.path)
+        repo = get_repo(repository.path)
 
         data = RepositorySerializer(repository).data
-        data["tree"] = self.get_tree_json(repo)
+        data["tree"] = get_tree_json(repo)
+
+        fork_status = get_fork_status(repository)
 
-        if check_is_possible_to_pullrequest(repository, repo):
-            data["pullrequest"] = True
+        if fork_status is not None:
+            data["pullrequest"] = fork_status.pullrequest
+            data["ahead"] = fork_status.ahead
+            data["behind"] = fork_status.behind
         else:
             data["pullrequest"] = False
 
         return Response(data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["patch"], url_path="file", url_name="file")
+    @locks_repository(get_repository_paths)
     def partial_update_file(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
@@ -133,11 +194,6 @@ class RepositoryViewSet(viewsets.ViewSet):
 
             return txt_file, message, path
 
-        def write_file(txt_file: Any, path: str) -> None:
-            content = txt_file.read()
-            with open(path, "w") as f:
-                f.write(content.decode("utf-8"))
-
         repository = Repository.objects.get(pk=pk)
 
         if self.check_is_pullrequest_open(repository):
@@ -145,12 +201,22 @@ class RepositoryViewSet(viewsets.ViewSet):
 
         txt_file, message, path = prepare_data(request)
 
-        path = os.path.join(REPO_ROOT, path)
-        write_file(txt_file, path)
+        path = get_repository_file_path(repository, path)
+        content = txt_file.read()
+
+        if path is None or not is_text(content):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        repo = Repo(repository.path)
-        repo.index.add([path])
-        repo.index.commit(message)
+        repo = get_repo(repository.path)
+        try:
+            commit_changes(
+                repository,
+                repo,
+                {path: (FILE_MODE, write_blob(repo, content))},
+                message,
+            )
+        except PathConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(status=status.HTTP_200_OK)
 
@@ -167,36 +233,6 @@ class RepositoryViewSet(viewsets.ViewSet):
 
             return structure, message
 
-        def get_blobs_dict(repo: Repo) -> dict:
-            blobs_dict = {}
-            for file_path in repo.git.ls_files().split("\n"):
-                file_path = os.path.join(repository.path, file_path)
-                with open(file_path, "r") as f:
-                    blobs_dict[os.path.basename(file_path)] = f.read()
-            return blobs_dict
-
-        def reset_directory(repository: Repository) -> None:
-            contents = os.listdir(repository.path)
-            contents.remove(".git")
-
-            for item in contents:
-                item_path = os.path.join(repository.path, item)
-                if os.path.isfile(item_path):
-                    os.remove(item_path)
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-
-        def build_directory(tree, path):
-            for item in tree:
-                item_path = os.path.join(path, item)
-                if tree[item] == "blob":
-                    content = blobs_dict.get(item, "")
-                    with open(item_path, "w") as f:
-                        f.write(content)
-                else:
-                    os.makedirs(item_path)
-                    build_directory(tree[item], item_path)
-
         repository = Repository.objects.get(pk=pk)
 
         if self.check_is_pullrequest_open(repository):
@@ -204,72 +240,127 @@ class RepositoryViewSet(viewsets.ViewSet):
 
         structure, message = prepare_data(request)
 
-        repo = Repo(repository.path)
-        blobs_dict = get_blobs_dict(repo)
-        reset_directory(repository)
-
-        structure = json.loads(structure)
-
-        build_directory(structure, repository.path)
-
-        repo.index.add("*")
-        repo.index.commit(message)
-
-        return Response(status=status.HTTP_200_OK)
+        return run_or_enqueue_job(
+            request,
+            "update_structure",
+            [repository.path],
+            status.HTTP_200_OK,
+            repository_id=repository.id,
+            structure=structure,
+            message=message,
+        )
 
+    @locks_repository(get_repository_paths)
     def destroy(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         repository = Repository.objects.get(pk=pk)
 
-        repository.delete()
-        shutil.rmtree(repository.path)
+        # The files are removed by the reaper, forks sharing the objects follow
+        # them into the trash until they have their own copy
+        with trash_on_commit(repository.path):
+            repository.delete()
+        run_in_background(empty_trash)
         return Response(status=status.HTTP_200_OK)
 
     def list(self, request: HttpRequest) -> Response:
-        pagenator = CursorPagination()
+        pagenator = KeysetPagination()
+        serializer = RepositoryListSerializer(request)
 
-        query = Repository.objects.all().order_by("star_count")
+        query = serializer.get_queryset(
+            Repository.objects.all(), *KeysetPagination.orderings.values()
+        )
         query = pagenator.paginate_queryset(query, request)
 
-        if query is None:
-            raise Http404
-
-        return pagenator.get_paginated_response(
-            RepositorySerializer(query, many=True).data
-        )
+        return pagenator.get_paginated_response(serializer.serialize(query))
 
     @action(detail=False, methods=["get"], url_path="tag", url_name="tag")
     def search_by_tag(self, request: HttpRequest) -> Response:
-        pagenator = CursorPagination()
+        pagenator = KeysetPagination()
+        serializer = RepositoryListSerializer(request)
 
-        tag = request.query_params.get("tag")
-        query = Repository.objects.filter(tags__name=tag).order_by("star_count")
+        # Filtering on the tag id joins only the indexed through table
+        tag = Tag.objects.filter(name=request.query_params.get("tag")).first()
+        query = (
+            Repository.objects.filter(tags=tag) if tag else Repository.objects.none()
+        )
+        query = serializer.get_queryset(query, *KeysetPagination.orderings.values())
         query = pagenator.paginate_queryset(query, request)
 
-        if query is None:
-            raise Http404
+        return pagenator.get_paginated_response(serializer.serialize(query))
+
+    @action(detail=False, methods=["get"], url_path="search", url_name="search")
+    def search_contents(self, request: HttpRequest) -> Response:
+        def prepare_data(request: HttpRequest) -> tuple:
+            query = request.query_params.get("q")
+            offset = request.query_params.get("offset", "0")
+            limit = request.query_params.get("limit", str(SEARCH_PAGE_SIZE))
+
+            if not query or not offset.isdigit() or not limit.isdigit():
+                raise ValueError(query)
+
+            return query, int(offset), min(max(int(limit), 1), SEARCH_MAX_PAGE_SIZE)
+
+        if not is_search_available():
+            return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
 
-        return pagenator.get_paginated_response(
-            RepositorySerializer(query, many=True).data
+        try:
+            query, offset, limit = prepare_data(request)
+            results = search(query, limit + 1, offset)
+        except (ValueError, InvalidQuery):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = None
+        if len(results) > limit:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "offset", offset + limit
+            )
+
+        return Response(
+            {"next": next_url, "results": results[:limit]}, status=status.HTTP_200_OK
         )
 
     @action(detail=True, methods=["patch"], url_path="rename", url_name="rename")
+    @locks_repository(get_repository_paths)
     def update_name(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         repository = Repository.objects.get(pk=pk)
         old_name = request.data.get("old_name")
         new_name = request.data.get("new_name")
         message = request.data.get("message")
 
-        if not old_name or not new_name or not message:
+        if (
+            not message
+            or not isinstance(old_name, str)
+            or not isinstance(new_name, str)
+        ):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        old_name = os.path.join(repository.path, old_name)
-        new_name = os.path.join(repository.path, new_name)
+        # Names are paths in the repository and may not leave it or touch .git
+        old_name, new_name = normalize_path(old_name), normalize_path(new_name)
+        if old_name is None or new_name is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        repo = get_repo(repository.path)
+
+        try:
+            entry = repo.head.commit.tree / old_name
+        except KeyError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        os.rename(old_name, new_name)
+        if entry.type == "tree":
+            # The working tree follows file changes only, a directory moves file
+            # by file
+            files = flatten_tree(repo, entry.binsha)
+            changes = {f"{old_name}/{path}": None for path in files}
+            changes.update(
+                {f"{new_name}/{path}": file_entry for path, file_entry in files.items()}
+            )
+        else:
+            changes = {old_name: None, new_name: (entry.mode, entry.binsha)}
 
-        repo = Repo(repository.path)
-        repo.index.add([new_name])
-        repo.index.commit(message)
+        try:
+            commit_changes(repository, repo, changes, message)
+        except ValueError as e:
+            # PathConflict, or a name git does not accept in a tree
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(status=status.HTTP_200_OK)
 
@@ -279,68 +370,296 @@ class RepositoryViewSet(viewsets.ViewSet):
     def retrieve_working_tree(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
-        def get_working_tree(repo: Repo, commit_hash: str) -> list:
-            head_commit = repo.commit(commit_hash)
-            commit_date = head_commit.committed_datetime
-            head_tree = head_commit.tree
-            parent_commit = head_commit.parents[0]
-            parent_tree = parent_commit.tree
+        def prepare_data(request: HttpRequest) -> tuple:
+            commit_hash = request.query_params.get("commit_hash")
+            offset = request.query_params.get("offset", "0")
+            limit = request.query_params.get("limit")
 
-            diff_index = parent_tree.diff(head_tree)
-            working_tree = []
+            if commit_hash is None or not offset.isdigit():
+                raise ValueError(commit_hash)
 
-            for diff in diff_index:
-                a_blob = diff.a_blob
-                b_blob = diff.b_blob
-                if a_blob and b_blob:
-                    working_tree.append(repo.git.diff(a_blob.hexsha, b_blob.hexsha))
+            if limit is not None:
+                if not limit.isdigit() or int(limit) < 1:
+                    raise ValueError(limit)
+                limit = min(int(limit), DIFF_MAX_PAGE_SIZE)
 
-            working_tree.append(commit_date)
+            return repo.commit(commit_hash), int(offset), limit or DIFF_PAGE_SIZE
 
-            return working_tree
+        def get_next_url(request: HttpRequest, offset: int) -> str:
+            url = request.build_absolute_uri()
+            return replace_query_param(url, "offset", offset)
 
-        commit_hash = request.query_params.get("commit_hash", None)
         repository = Repository.objects.get(pk=pk)
-        repo = Repo(repository.path)
+        repo = get_repo(repository.path)
 
-        if commit_hash is None:
+        try:
+            commit, offset, limit = prepare_data(request)
+        except (BadName, BadObject, ValueError):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        working_tree = get_working_tree(repo, commit_hash)
-
-        return Response(working_tree, status=status.HTTP_200_OK)
+        files = get_commit_diff(commit)
+        has_next = len(files) > offset + limit
+
+        return Response(
+            {
+                "commit_hash": commit.hexsha,
+                "commit_date": commit.committed_datetime,
+                "count": len(files),
+                "next": get_next_url(request, offset + limit) if has_next else None,
+                "files": files[offset : offset + limit],
+            },
+            status=status.HTTP_200_OK,
+        )
 
-    @action(detail=True, methods=["get"], url_path="commits", url_name="commits")
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="commits",
+        url_name="commits",
+        renderer_classes=[JSONRenderer, BrowsableAPIRenderer, NDJSONRenderer],
+    )
     def list_commits(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        def prepare_data(request: HttpRequest) -> tuple:
+            ref = request.query_params.get("ref", "HEAD")
+            path = request.query_params.get("path")
+            after = request.query_params.get("after")
+            limit = request.query_params.get("limit")
+
+            if limit is not None:
+                if not limit.isdigit() or int(limit) < 1:
+                    raise ValueError(limit)
+                limit = min(int(limit), COMMIT_LOG_MAX_PAGE_SIZE)
+
+            for rev in (ref, after):
+                if rev is not None:
+                    repo.rev_parse(rev)
+
+            # A cursor ref can not reach, e.g. after a reset, would walk the whole
+            # history for an empty page
+            if after is not None and not repo.is_ancestor(after, ref):
+                raise ValueError(after)
+
+            return ref, path, after, limit
+
+        def get_next_url(request: HttpRequest, commit_list: list) -> str:
+            url = request.build_absolute_uri()
+            return replace_query_param(url, "after", commit_list[-1]["commit_hash"])
+
+        repository = Repository.objects.get(pk=pk)
+        repo = get_repo(repository.path)
+
+        try:
+            ref, path, after, limit = prepare_data(request)
+        except (BadName, BadObject, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        if request.accepted_renderer.format == "ndjson":
+            commits = iter_commit_log(repo, ref, path, after, limit)
+            return StreamingHttpResponse(
+                stream_commit_log(
+                    commits,
+                    COMMIT_LOG_BATCH_SIZE,
+                    lambda batch: add_comment_counts(repository.id, batch),
+                ),
+                content_type=NDJSONRenderer.media_type,
+            )
+
+        limit = limit or COMMIT_LOG_PAGE_SIZE
+        commit_list = [
+            serialize_commit(commit)
+            for commit in iter_commit_log(repo, ref, path, after, limit + 1)
+        ]
+        has_next = len(commit_list) > limit
+        # Comment counts of the whole page come from one query
+        commit_list = add_comment_counts(repository.id, commit_list[:limit])
+
+        return Response(
+            {
+                "next": get_next_url(request, commit_list) if has_next else None,
+                "results": commit_list,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @list_commits.mapping.post
+    @locks_repository(get_repository_paths)
+    def create_commit(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        def prepare_data(request: HttpRequest) -> tuple:
+            message = request.data.get("message")
+            operations = request.data.get("changes")
+            parent = request.data.get("parent")
+
+            if not message or not isinstance(operations, list) or not operations:
+                raise Http404
+
+            return message, operations, parent
+
         repository = Repository.objects.get(pk=pk)
-        repo = Repo(repository.path)
-        commit_list = []
-
-        for commit in repo.iter_commits():
-            commit_list.append(
-                {
-                    "commit_hash": commit.hexsha,
-                    "commit_date": commit.committed_datetime,
-                    "commit_message": commit.message,
-                }
+
+        if self.check_is_pullrequest_open(repository):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        message, operations, parent = prepare_data(request)
+
+        repo = get_repo(repository.path)
+        head = repo.head.commit
+
+        if parent and parent != head.hexsha:
+            return Response({"head": head.hexsha}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            changes = get_batch_changes(repo, head, operations)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        commit = commit_changes(repository, repo, changes, message)
+
+        return Response(
+            {"commit_hash": commit.hexsha, "parent": head.hexsha},
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=["get"], url_path="stats", url_name="stats")
+    def list_stats(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        def prepare_data(request: HttpRequest) -> tuple:
+            since = request.query_params.get("since")
+            limit = request.query_params.get("limit", str(STATS_PAGE_SIZE))
+
+            if since is not None:
+                since = parse_datetime(since)
+                if since is None:
+                    raise ValueError(since)
+
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError(limit)
+
+            return since, min(int(limit), STATS_MAX_PAGE_SIZE)
+
+        repository = Repository.objects.get(pk=pk)
+
+        try:
+            since, limit = prepare_data(request)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        query = CommitStats.objects.filter(repository=repository)
+        if since is not None:
+            query = query.filter(committed__gt=since)
+
+        reachable = get_reachable_commits(get_repo(repository.path))
+        rows = (
+            query.order_by("committed", "id")
+            .values(
+                "commit",
+                "committed",
+                "words",
+                "characters",
+                "chapters",
+                "words_delta",
+                "characters_delta",
+                "chapters_delta",
             )
+            .iterator()
+        )
+        stats_list = list(
+            islice((row for row in rows if row["commit"] in reachable), limit)
+        )
 
-        return Response(commit_list, status=status.HTTP_200_OK)
+        return Response(stats_list, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["put"], url_path="rollback", url_name="rollback")
+    @locks_repository(get_repository_paths)
     def rollback_to_commit(
         self, request: HttpRequest, pk: Optional[str] = None
     ) -> Response:
+        def prepare_data(request: HttpRequest) -> tuple:
+            commit_hash = request.data.get("commit_hash")
+            mode = request.data.get("mode", "reset")
+            message = request.data.get("message") or f"Rollback to {commit_hash}"
+            dry_run = request.data.get("dry_run") in (True, "true", "1")
+
+            if commit_hash is None or mode not in ("reset", "commit"):
+                raise ValueError(mode)
+
+            return repo.commit(commit_hash), mode, message, dry_run
+
+        def rollback(target: Commit, mode: str, message: str) -> Commit:
+            if mode == "reset":
+                move_head(repository, repo, target, f"reset: moving to {target}")
+                return target
+
+            # A new commit with the old tree keeps the history in place
+            changes = diff_trees(repo, head.tree.binsha, target.tree.binsha)
+            return commit_tree(repository, repo, target.tree.binsha, changes, message)
+
         repository = Repository.objects.get(pk=pk)
-        commit_hash = request.data.get("commit_hash")
+        repo = get_repo(repository.path)
+        head = repo.head.commit
 
-        if commit_hash is None:
+        try:
+            target, mode, message, dry_run = prepare_data(request)
+        except (BadName, BadObject, ValueError):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        repo = Repo(repository.path)
-        repo.git.reset("--hard", commit_hash)
+        if dry_run:
+            return Response(get_diffstat(repo, head, target), status=status.HTTP_200_OK)
 
-        return Response(status=status.HTTP_200_OK)
+        commit = rollback(target, mode, message)
+        restore_point = RestorePoint.objects.create(
+            repository=repository,
+            user=request.user,
+            mode=mode,
+            target=target.hexsha,
+            before=head.hexsha,
+            after=commit.hexsha,
+        )
+        # The ref keeps the commits a reset dropped from being garbage collected
+        Reference.create(repo, f"refs/restore/{restore_point.id}", head, force=True)
+
+        return Response(
+            {"commit_hash": commit.hexsha, "restore_point": restore_point.id},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(
+        detail=True,
+        methods=["post"],
+        url_path="rollback/undo",
+        url_name="rollback-undo",
+    )
+    @locks_repository(get_repository_paths)
+    def undo_rollback(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
+        repository = Repository.objects.get(pk=pk)
+        restore_points = RestorePoint.objects.filter(
+            repository=repository, undone=False
+        )
+
+        if request.data.get("restore_point") is not None:
+            restore_points = restore_points.filter(id=request.data.get("restore_point"))
+        restore_point = restore_points.order_by("-id").first()
+
+        if restore_point is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        repo = get_repo(repository.path)
+        head = repo.head.commit.hexsha
+
+        # Anything committed after the rollback would be lost
+        if head != restore_point.after:
+            return Response({"head": head}, status=status.HTTP_409_CONFLICT)
+
+        move_head(
+            repository,
+            repo,
+            repo.commit(restore_point.before),
+            f"reset: undo rollback to {restore_point.target}",
+        )
+        restore_point.undone = True
+        restore_point.save(update_fields=["undone"])
+
+        return Response(
+            {"commit_hash": restore_point.before}, status=status.HTTP_200_OK
+        )
 
     @action(detail=True, methods=["get"], url_path="content", url_name="content")
     def get_content_in_file(
@@ -348,13 +667,92 @@ class RepositoryViewSet(viewsets.ViewSet):
     ) -> Response:
         repository = Repository.objects.get(pk=pk)
         file_path = request.query_params.get("file_path", None)
+        ref = request.query_params.get("ref", "HEAD")
 
         if file_path is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        file_path = os.path.join(repository.path, file_path)
+        repo = get_repo(repository.path)
+
+        try:
+            hexsha, _ = resolve_blob(repo, ref, file_path)
+        except (BadName, BadObject, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        except KeyError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        etag = get_etag(hexsha)
+        headers = {"ETag": etag}
+
+        if check_not_modified(request.headers.get("If-None-Match"), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        file_content = read_blob(repo, hexsha).decode("utf-8")
+
+        return Response(file_content, status=status.HTTP_200_OK, headers=headers)
+
+    @action(detail=True, methods=["get"], url_path="raw", url_name="raw")
+    def get_raw_content(
+        self, request: HttpRequest, pk: Optional[str] = None
+    ) -> HttpResponse:
+        repository = Repository.objects.get(pk=pk)
+        path = request.query_params.get("path", None)
+        ref = request.query_params.get("ref", "HEAD")
+
+        if path is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        repo = get_repo(repository.path)
 
-        with open(file_path, "r") as file:
-            file_content = file.read()
+        try:
+            hexsha, size = resolve_blob(repo, ref, path)
+        except (BadName, BadObject, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        except KeyError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        etag = get_etag(hexsha)
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Cache-Control": (
+                "private, max-age=31536000, immutable"
+                if is_immutable_ref(ref)
+                else "private, no-cache"
+            ),
+        }
+
+        if check_not_modified(request.headers.get("If-None-Match"), etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            for key, value in headers.items():
+                response[key] = value
+            return response
+
+        range_header = request.headers.get("Range")
+        if request.headers.get("If-Range", etag) != etag:
+            range_header = None
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+            )
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            iter_blob(repo, hexsha, start, end),
+            status=(
+                status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+            ),
+            content_type=get_content_type(path),
+        )
+        for key, value in headers.items():
+            response[key] = value
+        response["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
 
-        return Response(file_content, status=status.HTTP_200_OK)
+        return response
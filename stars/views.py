@@ -2,13 +2,13 @@ from typing import Optional
 
 from django.db import transaction
 from django.db.models import F
-from django.http import Http404, HttpRequest
+from django.http import HttpRequest
 from rest_framework import status, viewsets
-from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 
 from repositories.models import Repository
-from repositories.serializers import RepositorySerializer
+from repositories.pagination import KeysetPagination
+from repositories.serializers import RepositoryListSerializer
 from stars.models import Star
 from stars.serializers import StarSerializer
 
@@ -36,14 +36,13 @@ class StarViewSet(viewsets.ViewSet):
 
     def list(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         user_id = request.query_params.get("user", pk) or request.user.id
-        pagenator = CursorPagination()
+        pagenator = KeysetPagination()
+        serializer = RepositoryListSerializer(request)
 
-        query = Repository.objects.filter(star__user__id=user_id)
+        query = serializer.get_queryset(
+            Repository.objects.filter(star__user__id=user_id),
+            *KeysetPagination.orderings.values(),
+        )
         query = pagenator.paginate_queryset(query, request)
 
-        if query is None:
-            raise Http404
-
-        return pagenator.get_paginated_response(
-            RepositorySerializer(query, many=True).data
-        )
+        return pagenator.get_paginated_response(serializer.serialize(query))
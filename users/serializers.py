@@ -1,5 +1,6 @@
 from rest_framework.serializers import CharField, ModelSerializer
 
+from project.serializers import ValuesSerializer
 from users.models import User
 
 
@@ -21,3 +22,19 @@ class UserInSerializer(ModelSerializer):
         )
         model = User
         depth = 1
+
+
+class UserReadSerializer(ValuesSerializer):
+    model = User
+    fields = (
+        "id",
+        "last_login",
+        "is_superuser",
+        "username",
+        "first_name",
+        "last_name",
+        "email",
+        "is_staff",
+        "is_active",
+        "date_joined",
+    )
@@ -6,9 +6,9 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from project.settings import REPO_ROOT
+from project.settings import REPO_ROOT, TRASH_ROOT
+from repositories.trash import empty_trash
 from users.models import User
-from users.serializers import UserSerializer
 
 
 class AuthViewSetTestCase(APITestCase):
@@ -53,18 +53,47 @@ class UserViewSetTestCase(APITestCase):
         response = self.client.get(reverse("users-detail", args=[self.user1.id]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        serializer = UserSerializer(self.user1)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["id"], self.user1.id)
+        self.assertEqual(response.data["username"], self.user1.username)
+        self.assertNotIn("groups", response.data)
+        self.assertNotIn("password", response.data)
 
-    def test_destroy_user(self):
-        response = self.client.delete(
-            reverse("users-detail", args=[self.user1.id]),
-            {"password": "user1_password"},
+    def test_retrieve_user_fields(self):
+        response = self.client.get(
+            reverse("users-detail", args=[self.user1.id]), {"fields": "id,username"}
+        )
+
+        self.assertEqual(
+            response.data, {"id": self.user1.id, "username": self.user1.username}
+        )
+
+        response = self.client.get(
+            reverse("users-detail", args=[self.user1.id]), {"fields": "password"}
         )
 
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_destroy_user(self):
+        shutil.rmtree(TRASH_ROOT, ignore_errors=True)
+        path = os.path.join(REPO_ROOT, self.user1.username, "test_repo")
+        os.makedirs(path, exist_ok=True)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse("users-detail", args=[self.user1.id]),
+                {"password": "user1_password"},
+            )
+
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertFalse(User.objects.filter(username="testuser").exists())
 
+        # The directory moves once the delete is committed, the reaper is left to
+        # the test
+        callbacks[0]()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(empty_trash(None), 1)
+        self.assertEqual(os.listdir(TRASH_ROOT), [])
+
     def test_destroy_user_wrong_password(self):
         response = self.client.delete(
             reverse("users-detail", args=[self.user1.id]), {"password": "wrongpassword"}
@@ -1,19 +1,20 @@
 import os
-import shutil
 from typing import Optional
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
 from django.db import transaction
-from django.http import HttpRequest
+from django.http import Http404, HttpRequest
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from project.background import run_in_background
 from project.settings import REPO_ROOT
+from repositories.trash import empty_trash, trash_on_commit
 from users.models import User
-from users.serializers import UserSerializer
+from users.serializers import UserReadSerializer, UserSerializer
 
 
 class UserViewSet(viewsets.ViewSet):
@@ -22,12 +23,15 @@ class UserViewSet(viewsets.ViewSet):
 
     def retrieve(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
         user_id = request.query_params.get("user", pk) or request.user.id
-        if user_id is None:
-            user = request.user
-        else:
-            user = User.objects.get(id=user_id)
+        serializer = UserReadSerializer(request)
 
-        return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
+        query = serializer.get_queryset(User.objects.filter(id=user_id))
+        data = serializer.serialize(query)
+
+        if not data:
+            raise Http404
+
+        return Response(data[0], status=status.HTTP_200_OK)
 
     @transaction.atomic
     def destroy(self, request: HttpRequest, pk: Optional[str] = None) -> Response:
@@ -38,9 +42,9 @@ class UserViewSet(viewsets.ViewSet):
         if user is None:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
-        user.delete()
-
-        shutil.rmtree(os.path.join(REPO_ROOT, request.user.username))
+        with trash_on_commit(os.path.join(REPO_ROOT, request.user.username)):
+            user.delete()
+        run_in_background(empty_trash)
 
         return Response(status=status.HTTP_200_OK)
 